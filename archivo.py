@@ -0,0 +1,512 @@
+"""
+Archivo frío de historial: mueve a archivos locales comprimidos las filas
+que ya no se consultan en el día a día. Aplica a los retiros, los
+agendamientos entregados y los movimientos del libro de inventario
+anteriores a la ventana de retención.
+
+Cada lote movido es un segmento: un archivo NDJSON comprimido con gzip, en
+<ARCHIVO_DIR>/<tabla>/<AAAA-MM>/<id_min>-<id_max>.ndjson.gz. Los segmentos
+no se modifican nunca; manifiesto.json lista los segmentos con su rango de
+fechas, ids, filas, sha256 y, en las tablas con cliente_id, los clientes
+que aparecen en el segmento.
+
+Un lote se mueve así:
+  1. DELETE ... RETURNING en una transacción.
+  2. Se escribe el segmento como .pendiente (con fsync).
+  3. COMMIT.
+  4. Se renombra el segmento y se agrega al manifiesto.
+
+Si el proceso se interrumpe, la siguiente ejecución revisa los .pendiente.
+Si sus filas siguen en la base, el COMMIT no llegó y el archivo se borra; si
+no, se completa. Un advisory lock evita dos archivadores a la vez.
+
+Las rutas de historial (server.py) leen de forma transparente la tabla y el
+archivo cuando el rango de fechas llega hasta él: las filas archivadas se
+pasan a la consulta con json_populate_recordset (ver `origen`). Sólo se
+abren los segmentos cuyo rango de fechas y lista de clientes pueden
+aportar filas; para una página, `recientes` los recorre del más nuevo al
+más viejo y se detiene al completarla.
+
+Los retiros archivados también se suman por cliente en
+retiros_archivados_clientes (migrations/0012_archivo.sql).
+
+ARCHIVO_DIR tiene que estar en un disco persistente y ser el mismo para
+todos los workers. `archivar` se niega a correr si no está configurado: en
+un disco efímero (p. ej. el plan gratuito de Render) las filas movidas se
+perderían con el siguiente despliegue.
+
+Uso:
+    python archivo.py archivar [--retencion-meses 6] [--lote 20000]
+    python archivo.py estado
+
+Variables de entorno:
+    DATABASE_URL                URL de conexión (obligatoria)
+    ARCHIVO_DIR                 Directorio del archivo (obligatorio para archivar;
+                                sin él sólo se lee ./archivo)
+    ARCHIVO_RETENCION_MESES     Meses completos que quedan en la base (defecto 6)
+    ARCHIVO_LOTE                Filas por segmento (defecto 20000)
+"""
+
+import argparse
+import bisect
+import gzip
+import hashlib
+import heapq
+import json
+import logging
+import os
+import sys
+import threading
+from collections import namedtuple
+from datetime import date, datetime, time as hora_del_dia
+from decimal import Decimal
+from functools import lru_cache
+
+import psycopg2
+
+from cambios import marcar as marcar_cambios
+from conexiones import parametros_conexion
+import registro
+
+log = logging.getLogger(__name__)
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+DIRECTORIO = os.environ.get('ARCHIVO_DIR', os.path.join(RAIZ, 'archivo'))
+RETENCION_MESES = int(os.environ.get('ARCHIVO_RETENCION_MESES', 6))
+LOTE_DEFECTO = int(os.environ.get('ARCHIVO_LOTE', 20000))
+MANIFIESTO = 'manifiesto.json'
+EXTENSION = '.ndjson.gz'
+PENDIENTE = '.pendiente'
+CLAVE_LOCK = 'despacho_gas.archivo'
+
+Fuente = namedtuple('Fuente', 'tabla columna filtro')
+
+FUENTES = {
+    'retiros': Fuente('retiros', 'fecha', ''),
+    'agendamientos': Fuente('agendamientos', 'fecha_agendada', "AND estado = 'entregado'"),
+    # El último movimiento de cada tipo lo usa /api/inventario: no se archiva
+    'inventario': Fuente('inventario', 'fecha_ingreso', '''
+        AND id NOT IN (SELECT ultimo_movimiento_id FROM inventario_actual
+                       WHERE ultimo_movimiento_id IS NOT NULL)'''),
+}
+
+SQL_MAS_ANTIGUA = 'SELECT MIN({columna})::date AS minima FROM {tabla} WHERE {columna} < %(corte)s {filtro}'
+
+# Un lote del mes [desde, hasta), en orden de id. El rango se repite fuera
+# de la subconsulta para que el DELETE sólo toque la partición del mes.
+SQL_MOVER = '''
+    WITH movidas AS (
+        DELETE FROM {tabla}
+        WHERE id IN (
+            SELECT id FROM {tabla}
+            WHERE {columna} >= %(desde)s AND {columna} < %(hasta)s {filtro}
+            ORDER BY id
+            LIMIT %(lote)s
+        )
+          AND {columna} >= %(desde)s AND {columna} < %(hasta)s
+        RETURNING *
+    ){extra}
+    SELECT * FROM movidas ORDER BY id
+'''
+
+EXTRA_RETIROS = ''',
+    resumen AS (
+        INSERT INTO retiros_archivados_clientes AS t (cliente_id, retiros, litros, ultimo_retiro)
+        SELECT cliente_id, COUNT(*), SUM(litros), MAX(fecha) FROM movidas GROUP BY cliente_id
+        ON CONFLICT (cliente_id) DO UPDATE
+        SET retiros = t.retiros + EXCLUDED.retiros,
+            litros = t.litros + EXCLUDED.litros,
+            ultimo_retiro = GREATEST(t.ultimo_retiro, EXCLUDED.ultimo_retiro)
+    )'''
+
+
+def sumar_meses(mes, meses):
+    indice = mes.year * 12 + mes.month - 1 + meses
+    return date(indice // 12, indice % 12 + 1, 1)
+
+
+def _valor_json(valor):
+    if isinstance(valor, (date, datetime, hora_del_dia)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    raise TypeError(f'Tipo no serializable: {type(valor).__name__}')
+
+
+def _escribir_sincronizado(ruta, datos):
+    with open(ruta, 'wb') as f:
+        f.write(datos)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _sincronizar_directorio(ruta):
+    try:
+        fd = os.open(ruta, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+# ---------------------------------------------------------------------------
+# Lectura
+# ---------------------------------------------------------------------------
+
+@lru_cache(maxsize=int(os.environ.get('ARCHIVO_CACHE_SEGMENTOS', 8)))
+def _leer_segmento(ruta, sha256):
+    """Filas de un segmento (dicts con fechas en ISO). `sha256` es parte de la clave."""
+    with gzip.open(ruta, 'rt', encoding='utf-8') as f:
+        return tuple(json.loads(linea) for linea in f if linea.strip())
+
+
+class Archivo:
+    """Vista de sólo lectura del manifiesto; se recarga cuando cambia el archivo."""
+
+    def __init__(self, directorio=DIRECTORIO):
+        self.directorio = directorio
+        self._firma = None
+        self._segmentos = ()
+        self._lock = threading.Lock()
+
+    def _cargar(self):
+        ruta = os.path.join(self.directorio, MANIFIESTO)
+        try:
+            estado = os.stat(ruta)
+        except FileNotFoundError:
+            self._firma, self._segmentos = None, ()
+            return
+        firma = (estado.st_mtime_ns, estado.st_size)
+        if firma == self._firma:
+            return
+        with self._lock:
+            if firma != self._firma:
+                with open(ruta, encoding='utf-8') as f:
+                    self._segmentos = tuple(json.load(f)['segmentos'])
+                self._firma = firma
+
+    def segmentos(self, tabla=None, desde=None, hasta=None, cliente_id=None):
+        """
+        Segmentos de `tabla` cuyo rango de fechas toca [desde, hasta] (ISO,
+        inclusive) y que pueden tener filas de `cliente_id`.
+        """
+        self._cargar()
+        return [s for s in self._segmentos
+                if (tabla is None or s['tabla'] == tabla)
+                and (desde is None or s['hasta'] >= str(desde)[:10])
+                and (hasta is None or s['desde'] <= str(hasta)[:10])
+                and (cliente_id is None or _tiene_cliente(s, cliente_id))]
+
+    def ultimo_dia(self, tabla):
+        """Día (ISO) más reciente archivado de `tabla`, o None si no hay archivo."""
+        return max((s['hasta'] for s in self.segmentos(tabla)), default=None)
+
+    def _filas_segmento(self, segmento, desde, hasta, condicion, cliente_id):
+        columna = FUENTES[segmento['tabla']].columna
+        ruta = os.path.join(self.directorio, segmento['archivo'])
+        for fila in _leer_segmento(ruta, segmento['sha256']):
+            dia = fila[columna][:10]
+            if (desde and dia < desde) or (hasta and dia > hasta):
+                continue
+            if cliente_id is not None and fila['cliente_id'] != cliente_id:
+                continue
+            if condicion is None or condicion(fila):
+                yield dict(fila)
+
+    def lotes(self, tabla, desde=None, hasta=None, condicion=None, cliente_id=None):
+        """
+        Como `filas`, pero agrupadas por segmento (listas no vacías), para
+        procesar el archivo sin tenerlo entero en memoria.
+        """
+        desde = str(desde)[:10] if desde else None
+        hasta = str(hasta)[:10] if hasta else None
+        for segmento in self.segmentos(tabla, desde, hasta, cliente_id):
+            filas = list(self._filas_segmento(segmento, desde, hasta, condicion, cliente_id))
+            if filas:
+                yield filas
+
+    def filas(self, tabla, desde=None, hasta=None, condicion=None, cliente_id=None):
+        """
+        Filas archivadas de `tabla` con la columna de fecha en [desde, hasta]
+        (fechas o cadenas ISO, inclusive) que cumplen `condicion(fila)`.
+        """
+        for filas in self.lotes(tabla, desde, hasta, condicion, cliente_id):
+            yield from filas
+
+    def recientes(self, tabla, limite, clave, desde=None, hasta=None, condicion=None, cliente_id=None):
+        """
+        Las `limite` filas de mayor `clave(fila)` entre las de `filas`. La
+        clave debe empezar por la columna de fecha: los segmentos se leen del
+        más reciente al más antiguo y se deja de leer cuando ninguno de los
+        que faltan puede mejorar el resultado.
+        """
+        columna = FUENTES[tabla].columna
+        desde = str(desde)[:10] if desde else None
+        hasta = str(hasta)[:10] if hasta else None
+        elegidas = []
+        candidatos = sorted(self.segmentos(tabla, desde, hasta, cliente_id), key=lambda s: s['hasta'], reverse=True)
+        for segmento in candidatos:
+            if len(elegidas) >= limite and segmento['hasta'] < elegidas[-1][columna][:10]:
+                break
+            nuevas = self._filas_segmento(segmento, desde, hasta, condicion, cliente_id)
+            elegidas = heapq.nlargest(limite, [*elegidas, *nuevas], key=clave)
+        return elegidas
+
+
+def _tiene_cliente(segmento, cliente_id):
+    # Los segmentos anteriores a la lista de clientes no se pueden descartar
+    clientes = segmento.get('clientes')
+    if clientes is None:
+        return True
+    i = bisect.bisect_left(clientes, cliente_id)
+    return i < len(clientes) and clientes[i] == cliente_id
+
+
+_archivo = None
+
+
+def obtener_archivo():
+    global _archivo
+    if _archivo is None:
+        _archivo = Archivo()
+    return _archivo
+
+
+def origen(tabla, filas):
+    """
+    Fragmento FROM para leer `tabla` junto con `filas` archivadas, y sus
+    parámetros. Sin filas archivadas es la tabla sola, sin costo extra.
+    Las condiciones de la consulta se aplican a ambas partes (y las de fecha
+    siguen descartando particiones de la tabla).
+    """
+    if not filas:
+        return tabla, []
+    sql, params = origen_archivadas(tabla, filas)
+    return f'(SELECT * FROM {tabla} UNION ALL SELECT * FROM {sql})', params
+
+
+def origen_archivadas(tabla, filas):
+    """Fragmento FROM con sólo `filas` archivadas, con los tipos de `tabla`."""
+    return f'json_populate_recordset(NULL::{tabla}, %s::json)', [json.dumps(filas, default=_valor_json)]
+
+
+# ---------------------------------------------------------------------------
+# Escritura
+# ---------------------------------------------------------------------------
+
+def _entrada(relativa, filas, columna, datos):
+    dias = [fila[columna][:10] for fila in filas]
+    entrada = {
+        'tabla': relativa.split('/')[0],
+        'mes': relativa.split('/')[1],
+        'archivo': relativa,
+        'filas': len(filas),
+        'id_min': filas[0]['id'],
+        'id_max': filas[-1]['id'],
+        'desde': min(dias),
+        'hasta': max(dias),
+        'bytes': len(datos),
+        'sha256': hashlib.sha256(datos).hexdigest(),
+        'creado': datetime.now().isoformat(timespec='seconds'),
+    }
+    if 'cliente_id' in filas[0]:
+        entrada['clientes'] = sorted({fila['cliente_id'] for fila in filas})
+    return entrada
+
+
+class Archivador:
+    def __init__(self, directorio=DIRECTORIO):
+        self.directorio = directorio
+        self.ruta_manifiesto = os.path.join(directorio, MANIFIESTO)
+
+    def leer_manifiesto(self):
+        try:
+            with open(self.ruta_manifiesto, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'version': 1, 'segmentos': []}
+
+    def _guardar_manifiesto(self, manifiesto):
+        manifiesto['segmentos'].sort(key=lambda s: (s['tabla'], s['desde'], s['id_min']))
+        temporal = self.ruta_manifiesto + '.tmp'
+        _escribir_sincronizado(temporal, json.dumps(manifiesto, indent=1).encode())
+        os.replace(temporal, self.ruta_manifiesto)
+        _sincronizar_directorio(self.directorio)
+
+    def _registrar(self, relativa, filas, datos):
+        manifiesto = self.leer_manifiesto()
+        if not any(s['archivo'] == relativa for s in manifiesto['segmentos']):
+            columna = FUENTES[relativa.split('/')[0]].columna
+            manifiesto['segmentos'].append(_entrada(relativa, filas, columna, datos))
+            self._guardar_manifiesto(manifiesto)
+
+    def escribir_pendiente(self, tabla, filas):
+        """Escribe el segmento como .pendiente; devuelve (ruta relativa final, datos)."""
+        columna = FUENTES[tabla].columna
+        mes = str(filas[0][columna])[:7]
+        relativa = f"{tabla}/{mes}/{filas[0]['id']:010d}-{filas[-1]['id']:010d}{EXTENSION}"
+        destino = os.path.join(self.directorio, relativa)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        lineas = ''.join(json.dumps(fila, default=_valor_json, ensure_ascii=False) + '\n' for fila in filas)
+        datos = gzip.compress(lineas.encode('utf-8'), mtime=0)
+        _escribir_sincronizado(destino + PENDIENTE, datos)
+        return relativa, datos
+
+    def confirmar(self, relativa, datos):
+        destino = os.path.join(self.directorio, relativa)
+        os.replace(destino + PENDIENTE, destino)
+        _sincronizar_directorio(os.path.dirname(destino))
+        filas = [json.loads(linea) for linea in gzip.decompress(datos).decode('utf-8').splitlines()]
+        self._registrar(relativa, filas, datos)
+
+    def recuperar(self, cursor):
+        """Resuelve los segmentos que quedaron a medias en una ejecución interrumpida."""
+        registrados = {s['archivo'] for s in self.leer_manifiesto()['segmentos']}
+        resueltos = []
+        for tabla in FUENTES:
+            base = os.path.join(self.directorio, tabla)
+            if not os.path.isdir(base):
+                continue
+            for raiz, _, archivos in os.walk(base):
+                for nombre in sorted(archivos):
+                    ruta = os.path.join(raiz, nombre)
+                    relativa = os.path.relpath(ruta, self.directorio).replace(os.sep, '/')
+                    if nombre.endswith(EXTENSION + PENDIENTE):
+                        relativa = relativa[:-len(PENDIENTE)]
+                        with open(ruta, 'rb') as f:
+                            datos = f.read()
+                        ids = [json.loads(l)['id'] for l in gzip.decompress(datos).decode('utf-8').splitlines()]
+                        cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {tabla} WHERE id = ANY(%s)) AS vivas', (ids,))
+                        if cursor.fetchone()['vivas']:
+                            os.remove(ruta)       # la transacción no se confirmó
+                            resueltos.append((relativa, 'descartado'))
+                        else:
+                            self.confirmar(relativa, datos)
+                            resueltos.append((relativa, 'completado'))
+                    elif nombre.endswith(EXTENSION) and relativa not in registrados:
+                        with open(ruta, 'rb') as f:
+                            datos = f.read()
+                        filas = [json.loads(l) for l in gzip.decompress(datos).decode('utf-8').splitlines()]
+                        self._registrar(relativa, filas, datos)
+                        resueltos.append((relativa, 'registrado'))
+        return resueltos
+
+    def _mover_lote(self, conn, fuente, desde, hasta, lote):
+        """Mueve un lote; devuelve cuántas filas movió."""
+        cursor = conn.cursor()
+        extra = EXTRA_RETIROS if fuente.tabla == 'retiros' else ''
+        try:
+            cursor.execute(SQL_MOVER.format(tabla=fuente.tabla, columna=fuente.columna,
+                                            filtro=fuente.filtro, extra=extra),
+                           {'desde': desde, 'hasta': hasta, 'lote': lote})
+            filas = [dict(fila) for fila in cursor.fetchall()]
+            if not filas:
+                conn.rollback()
+                return 0
+            relativa, datos = self.escribir_pendiente(fuente.tabla, filas)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        self.confirmar(relativa, datos)
+        marcar_cambios(fuente.tabla)
+        return len(filas)
+
+    def archivar(self, retencion_meses=RETENCION_MESES, lote=LOTE_DEFECTO, hoy=None):
+        """
+        Mueve al archivo las filas anteriores al primer día del mes
+        `retencion_meses` meses atrás. Devuelve {tabla: filas movidas}, o
+        None si otro proceso está archivando.
+        """
+        if self.directorio == DIRECTORIO and not os.environ.get('ARCHIVO_DIR'):
+            raise RuntimeError("ARCHIVO_DIR no está configurado: el archivo debe estar en un disco persistente")
+        corte = sumar_meses((hoy or date.today()).replace(day=1), -retencion_meses)
+        os.makedirs(self.directorio, exist_ok=True)
+        conn = psycopg2.connect(**parametros_conexion())
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT pg_try_advisory_lock(hashtext(%s)) AS obtenido', (CLAVE_LOCK,))
+            obtenido = cursor.fetchone()['obtenido']
+            conn.commit()
+            if not obtenido:
+                return None
+            try:
+                for relativa, resultado in self.recuperar(cursor):
+                    log.info("   ↪️  %s: %s", relativa, resultado)
+                conn.commit()
+                movidas = {}
+                for fuente in FUENTES.values():
+                    movidas[fuente.tabla] = 0
+                    while True:
+                        cursor.execute(SQL_MAS_ANTIGUA.format(**fuente._asdict()), {'corte': corte})
+                        minima = cursor.fetchone()['minima']
+                        conn.commit()
+                        if minima is None:
+                            break
+                        desde = minima.replace(day=1)
+                        hasta = min(sumar_meses(desde, 1), corte)
+                        while True:
+                            filas = self._mover_lote(conn, fuente, desde, hasta, lote)
+                            movidas[fuente.tabla] += filas
+                            if filas:
+                                log.info("   %s %s: %d filas archivadas", fuente.tabla, f"{desde:%Y-%m}", filas)
+                            if filas < lote:
+                                break
+                return movidas
+            finally:
+                cursor.execute('SELECT pg_advisory_unlock(hashtext(%s))', (CLAVE_LOCK,))
+                conn.commit()
+        finally:
+            conn.close()
+
+
+def tarea_programada():
+    """Punto de entrada para el programador de tareas del servidor."""
+    movidas = Archivador().archivar()
+    if movidas and any(movidas.values()):
+        log.info("📦 Archivado: %s", ', '.join(f'{t} {n}' for t, n in movidas.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archivo frío de retiros, agendamientos e inventario')
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    p_archivar = comandos.add_parser('archivar', help='mover al archivo las filas fuera de la retención')
+    p_archivar.add_argument('--retencion-meses', type=int, default=RETENCION_MESES)
+    p_archivar.add_argument('--lote', type=int, default=LOTE_DEFECTO)
+    comandos.add_parser('estado', help='resumen del manifiesto')
+    args = parser.parse_args()
+    registro.configurar(formato='texto')
+
+    if args.comando == 'estado':
+        segmentos = Archivador().leer_manifiesto()['segmentos']
+        if not segmentos:
+            print(f"Archivo vacío ({DIRECTORIO})")
+        for tabla in FUENTES:
+            propios = [s for s in segmentos if s['tabla'] == tabla]
+            if propios:
+                print(f"{tabla:<14} {len(propios):>5} segmentos {sum(s['filas'] for s in propios):>10} filas "
+                      f"{sum(s['bytes'] for s in propios) / 1024 / 1024:>8.1f} MB  "
+                      f"{min(s['desde'] for s in propios)} .. {max(s['hasta'] for s in propios)}")
+        return
+
+    if not os.environ.get('DATABASE_URL'):
+        print("ERROR: DATABASE_URL no esta configurada")
+        sys.exit(1)
+    if not os.environ.get('ARCHIVO_DIR'):
+        print("ERROR: ARCHIVO_DIR no esta configurada (debe apuntar a un disco persistente)")
+        sys.exit(1)
+
+    print(f"📦 Archivando filas anteriores a {args.retencion_meses} meses en {DIRECTORIO}...")
+    movidas = Archivador().archivar(retencion_meses=args.retencion_meses, lote=args.lote)
+    if movidas is None:
+        print("⚠️ Otro proceso está archivando")
+        sys.exit(1)
+    print(f"✅ Archivado: {', '.join(f'{t} {n}' for t, n in movidas.items())}")
+
+
+if __name__ == '__main__':
+    main()
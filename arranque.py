@@ -0,0 +1,82 @@
+"""
+Medición del arranque en frío de server.py.
+
+En el plan free de Render el servicio se apaga por inactividad y la primera
+petición paga todo el arranque. Este módulo registra cuánto tarda cada fase
+(imports, definición de rutas, primera conexión, verificación del esquema,
+primera respuesta) y avisa si el total supera el presupuesto.
+
+Variables de entorno:
+    ARRANQUE_PRESUPUESTO_MS   Presupuesto hasta la primera respuesta (defecto 1500)
+"""
+
+import logging
+import os
+import threading
+import time
+from functools import wraps
+
+log = logging.getLogger(__name__)
+
+_INICIO = time.perf_counter()
+PRESUPUESTO_MS = float(os.environ.get('ARRANQUE_PRESUPUESTO_MS', 1500))
+
+_fases = []
+_ultima = _INICIO
+_lock = threading.Lock()
+_primera_respuesta_ms = None
+
+
+def fase(nombre):
+    """Registra que terminó la fase `nombre` (duración desde la fase anterior)."""
+    global _ultima
+    with _lock:
+        ahora = time.perf_counter()
+        _fases.append((nombre, round((ahora - _ultima) * 1000, 2), round((ahora - _INICIO) * 1000, 2)))
+        _ultima = ahora
+
+
+def medir(nombre):
+    """Decorador: la función es una fase propia, separada del tiempo previo."""
+    def decorador(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            global _ultima
+            with _lock:
+                _ultima = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                fase(nombre)
+        return decorated
+    return decorador
+
+
+def primera_respuesta():
+    """Llamar al terminar cada respuesta; sólo la primera deja registro."""
+    global _primera_respuesta_ms
+    if _primera_respuesta_ms is not None:
+        return
+    with _lock:
+        if _primera_respuesta_ms is not None:
+            return
+        _primera_respuesta_ms = round((time.perf_counter() - _INICIO) * 1000, 2)
+    detalle = ', '.join(f"{nombre} {ms:.0f}ms" for nombre, ms, _ in _fases)
+    en_presupuesto = _primera_respuesta_ms <= PRESUPUESTO_MS
+    log.log(logging.INFO if en_presupuesto else logging.WARNING,
+            "⏱️ Arranque: primera respuesta a los %.0fms (presupuesto %.0fms) %s | %s",
+            _primera_respuesta_ms, PRESUPUESTO_MS, '✅' if en_presupuesto else '⚠️ FUERA DE PRESUPUESTO', detalle,
+            extra={'primera_respuesta_ms': _primera_respuesta_ms})
+
+
+def resumen():
+    with _lock:
+        return {
+            'pid': os.getpid(),
+            'fases': [{'fase': nombre, 'ms': ms, 'acumulado_ms': acumulado} for nombre, ms, acumulado in _fases],
+            'primera_respuesta_ms': _primera_respuesta_ms,
+            'presupuesto_ms': PRESUPUESTO_MS,
+            'dentro_del_presupuesto': (_primera_respuesta_ms is not None
+                                       and _primera_respuesta_ms <= PRESUPUESTO_MS),
+            'activo_desde_seg': round(time.perf_counter() - _INICIO, 1),
+        }
@@ -0,0 +1,129 @@
+"""
+Benchmark del arranque en frío: ejecuta el startCommand de render.yaml (con
+un worker) tal como lo hace Render, mide el tiempo hasta la primera respuesta de / y
+hasta la primera petición que usa la base de datos, y muestra el desglose
+por fases que registra arranque.py (GET /api/sistema/arranque).
+
+Repite el arranque N veces y compara la mediana con el presupuesto; sale
+con código 1 si lo supera.
+
+Uso:
+    DATABASE_URL=postgresql://... python benchmarks/arranque.py [--repeticiones 5] [--presupuesto-ms 1500]
+                                                               [--comando "gunicorn ..."]
+"""
+
+import argparse
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+
+from comun import RAIZ, conexion_directa
+
+
+def comando_inicio():
+    """El startCommand de render.yaml, para medir exactamente lo que corre en Render."""
+    with open(os.path.join(RAIZ, 'render.yaml'), encoding='utf-8') as f:
+        for linea in f:
+            clave, _, valor = linea.strip().partition(':')
+            if clave == 'startCommand':
+                return valor.strip()
+    raise SystemExit('render.yaml no define startCommand')
+
+
+def pedir(url, headers=None, timeout=5):
+    with urllib.request.urlopen(urllib.request.Request(url, headers=headers or {}), timeout=timeout) as r:
+        return r.status, r.read()
+
+
+def esperar_respuesta(url, inicio, limite_seg):
+    """Reintenta hasta que el servidor responde; devuelve ms desde `inicio`."""
+    while time.perf_counter() - inicio < limite_seg:
+        try:
+            pedir(url, timeout=1)
+            return (time.perf_counter() - inicio) * 1000
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.005)
+    raise SystemExit(f'El servidor no respondió en {limite_seg}s')
+
+
+def token_admin():
+    import jwt
+    cursor = conexion_directa().cursor()
+    cursor.execute("SELECT id FROM usuarios WHERE usuario = 'admin'")
+    token = jwt.encode({
+        'usuario': 'admin',
+        'id': cursor.fetchone()['id'],
+        'es_admin': True,
+        'exp': datetime.utcnow() + timedelta(hours=1)
+    }, os.environ.get('SECRET_KEY', 'tu_clave_secreta_muy_segura'), algorithm='HS256')
+    return {'Authorization': f'Bearer {token}'}
+
+
+def un_arranque(comando, puerto, headers, presupuesto_ms):
+    # El intérprete actual va primero en PATH: `gunicorn` y `python` del comando
+    # son los de este entorno
+    ruta = os.pathsep.join([os.path.dirname(sys.executable), os.environ.get('PATH', '')])
+    entorno = dict(os.environ, PORT=str(puerto), WEB_CONCURRENCY='1', PATH=ruta,
+                   RESET_PROGRAMADO='0', ARRANQUE_PRESUPUESTO_MS=str(presupuesto_ms))
+    base = f'http://127.0.0.1:{puerto}'
+    inicio = time.perf_counter()
+    # exec: la señal de parada llega a gunicorn y no al shell
+    proceso = subprocess.Popen(['/bin/sh', '-c', f'exec {comando}'], cwd=RAIZ, env=entorno,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        primera_ms = esperar_respuesta(base + '/', inicio, 30)
+        pedir(base + '/api/inventario/estado', headers)
+        con_db_ms = (time.perf_counter() - inicio) * 1000
+        _, cuerpo = pedir(base + '/api/sistema/arranque', headers)
+        return primera_ms, con_db_ms, json.loads(cuerpo)
+    finally:
+        proceso.send_signal(signal.SIGTERM)
+        proceso.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--presupuesto-ms', type=float, default=float(os.environ.get('ARRANQUE_PRESUPUESTO_MS', 1500)))
+    parser.add_argument('--puerto', type=int, default=8765)
+    parser.add_argument('--comando', help='comando de inicio (defecto: startCommand de render.yaml)')
+    args = parser.parse_args()
+    comando = args.comando or comando_inicio()
+
+    if not os.environ.get('DATABASE_URL'):
+        print("ERROR: DATABASE_URL no esta configurada")
+        sys.exit(1)
+    headers = token_admin()
+
+    print("=" * 72)
+    print(f"Comando: {comando}")
+    print(f"{'#':>3} {'primera resp. ms':>17} {'primera con DB ms':>18}  fases del worker (ms)")
+    print("-" * 72)
+    primeras, con_db = [], []
+    for i in range(1, args.repeticiones + 1):
+        primera_ms, con_db_ms, resumen = un_arranque(comando, args.puerto, headers, args.presupuesto_ms)
+        primeras.append(primera_ms)
+        con_db.append(con_db_ms)
+        fases = ', '.join(f"{f['fase']} {f['ms']:.0f}" for f in resumen['fases'])
+        print(f"{i:>3} {primera_ms:>17.0f} {con_db_ms:>18.0f}  {fases}")
+
+    mediana = statistics.median(primeras)
+    mediana_db = statistics.median(con_db)
+    print("-" * 72)
+    print(f"Mediana primera respuesta: {mediana:.0f} ms | con base de datos: {mediana_db:.0f} ms "
+          f"| presupuesto: {args.presupuesto_ms:.0f} ms")
+    print("=" * 72)
+    if mediana_db > args.presupuesto_ms:
+        print("⚠️ El arranque en frío supera el presupuesto")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark de GET /api/clientes?busqueda=...: carga N clientes generados
+(100.000 por defecto), compara la búsqueda anterior (LIKE con comodín
+inicial sobre nombre y dirección) con la búsqueda indexada por nombre,
+cédula, placa y teléfono, y borra los clientes al terminar.
+
+Uso:
+    DATABASE_URL=postgresql://... python benchmarks/busqueda_clientes.py [--clientes 100000] [--repeticiones 50]
+"""
+
+import argparse
+import time
+
+from comun import cargar_servidor, conexion_directa, percentil, token_admin
+
+PREFIJO_CEDULA = 'Q-'
+
+NOMBRES = ['MARIA', 'JOSE', 'LUIS', 'CARMEN', 'CARLOS', 'ANA', 'JUAN', 'ROSA', 'PEDRO', 'YOLIMAR',
+           'JESUS', 'ANDREINA', 'RAFAEL', 'GABRIELA', 'MIGUEL', 'DANIELA', 'ÁNGEL', 'MARÍA JOSÉ']
+APELLIDOS = ['GONZALEZ', 'RODRIGUEZ', 'PEREZ', 'HERNANDEZ', 'GARCIA', 'MARTINEZ', 'LOPEZ', 'DIAZ',
+             'SANCHEZ', 'ROMERO', 'TORRES', 'RAMIREZ', 'MENDOZA', 'SUÁREZ', 'ROJAS', 'MUÑOZ', 'CASTILLO']
+
+SQL_GENERAR = '''
+    INSERT INTO clientes (nombre, cedula, placa, telefono, direccion, litros_mes, litros_disponibles)
+    SELECT (%(nombres)s::text[])[1 + i %% cardinality(%(nombres)s::text[])] || ' ' ||
+           (%(apellidos)s::text[])[1 + (i / 7) %% cardinality(%(apellidos)s::text[])] || ' ' ||
+           (%(apellidos)s::text[])[1 + (i / 11) %% cardinality(%(apellidos)s::text[])],
+           %(prefijo)s || (10000000 + i),
+           'Q' || lpad(i::text, 6, '0'),
+           '0414-' || lpad((i * 7919 %% 10000000)::text, 7, '0'),
+           'CALLE ' || (i %% 300) || ', SECTOR ' || (i %% 40),
+           60, 60
+    FROM generate_series(1, %(total)s) AS i
+'''
+
+# Búsqueda anterior de obtener_clientes, para comparar
+SQL_ANTERIOR = 'SELECT * FROM clientes WHERE activo = TRUE AND (nombre LIKE %s OR direccion LIKE %s)'
+
+
+def busqueda_anterior(server, cursor, termino):
+    """Lo que hacía obtener_clientes: la consulta dos veces y todo serializado."""
+    patron = f'%{termino}%'
+    for _ in range(2):
+        cursor.execute(SQL_ANTERIOR, (patron, patron))
+        clientes = [dict(fila) for fila in cursor.fetchall()]
+    return server.app.json.dumps(clientes), len(clientes)
+
+
+def limpiar(conn):
+    conn.cursor().execute('DELETE FROM clientes WHERE cedula LIKE %s', (PREFIJO_CEDULA + '%',))
+
+
+def medir(funcion, repeticiones):
+    latencias = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    return latencias, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--clientes', type=int, default=100000)
+    parser.add_argument('--repeticiones', type=int, default=50)
+    args = parser.parse_args()
+
+    server = cargar_servidor()
+    conn = conexion_directa()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM usuarios WHERE usuario = 'admin'")
+    headers = token_admin(server.app, cursor.fetchone()['id'])
+    cliente = server.app.test_client()
+    limpiar(conn)
+
+    inicio = time.perf_counter()
+    cursor.execute(SQL_GENERAR, {'nombres': NOMBRES, 'apellidos': APELLIDOS,
+                                 'prefijo': PREFIJO_CEDULA, 'total': args.clientes})
+    cursor.execute('ANALYZE clientes')
+    cursor.execute('ANALYZE clientes_busqueda')
+    print(f"{args.clientes} clientes generados en {time.perf_counter() - inicio:.1f}s")
+
+    medio = args.clientes // 2
+    busquedas = [
+        ('nombre (prefijo)', 'yoli'),
+        ('nombre completo', 'maria gonzalez'),
+        ('nombre con acento', 'suárez'),
+        ('cédula exacta', f'{PREFIJO_CEDULA}{10000000 + medio}'),
+        ('cédula (dígitos)', str(10000000 + medio)[:6]),
+        ('placa', f'Q{medio:06d}'),
+        ('teléfono (prefijo)', f'0414-{medio * 7919 % 10000000:07d}'[:10]),
+        ('sin resultados', 'zzzzz'),
+    ]
+
+    try:
+        print("=" * 100)
+        print(f"{'búsqueda':<20} {'término':<16} {'anterior p50':>13} {'filas':>6} {'nueva p50':>10} "
+              f"{'nueva p95':>10} {'filas':>6}  primer resultado")
+        print("-" * 100)
+        for nombre, termino in busquedas:
+            with server.app.app_context():
+                anteriores, (_, filas_anterior) = medir(lambda: busqueda_anterior(server, cursor, termino),
+                                                        max(1, args.repeticiones // 10))
+            nuevas, r = medir(lambda: cliente.get('/api/clientes', query_string={'busqueda': termino},
+                                                  headers=headers), args.repeticiones)
+            if r.status_code != 200:
+                raise SystemExit(f'Búsqueda fallida ({r.status_code}): {r.get_data(as_text=True)[:300]}')
+            filas = r.get_json()
+            primero = f"{filas[0]['nombre']} ({filas[0]['cedula']})" if filas else '-'
+            print(f"{nombre:<20} {termino:<16} {percentil(anteriores, 50):>10.1f} ms {filas_anterior:>6} "
+                  f"{percentil(nuevas, 50):>7.1f} ms {percentil(nuevas, 95):>7.1f} ms {len(filas):>6}  {primero}")
+        print("=" * 100)
+        print("anterior: LIKE '%término%' sobre nombre y dirección (distingue mayúsculas y acentos), sin límite; "
+              "nueva: petición completa a /api/clientes (límite 50)")
+    finally:
+        limpiar(conn)
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+Prueba de carga de POST /api/agendamientos: reserva 10.000 tickets en
+paralelo para una misma fecha y verifica que ningún código de ticket se
+repite. Mientras dura, el límite diario de gasolina se sube para que entren
+todos los tickets; al terminar se restauran el límite y la capacidad
+reservada de la fecha de prueba.
+
+La fecha de prueba es el último día del mes más lejano con partición
+creada por adelantado (particiones.py): fuera de las particiones
+existentes el agendamiento se rechaza.
+
+Uso:
+    DATABASE_URL=postgresql://... python benchmarks/carga_tickets.py [--tickets 10000] [--concurrencia 32]
+"""
+
+import argparse
+from datetime import date, timedelta
+
+from comun import (cargar_servidor, conexion_directa, ejecutar_concurrente,
+                   guardar_inventario, percentil, restaurar_inventario,
+                   token_admin)
+
+import particiones
+
+# Último día del último mes con partición (el actual más MESES_ADELANTE)
+FECHA_PRUEBA = (particiones.sumar_meses(date.today().replace(day=1), particiones.MESES_ADELANTE + 1)
+                - timedelta(days=1)).isoformat()
+LITROS_POR_TICKET = 1.0
+
+
+def guardar_limites(conn):
+    """Foto del límite diario configurado y de la capacidad reservada en la fecha de prueba."""
+    cursor = conn.cursor()
+    cursor.execute('SELECT limite_diario_gasolina FROM sistema_config WHERE id = 1')
+    config = cursor.fetchone()
+    cursor.execute('SELECT * FROM limites_diarios WHERE fecha = %s', (FECHA_PRUEBA,))
+    return (config['limite_diario_gasolina'] if config else None), [dict(fila) for fila in cursor.fetchall()]
+
+
+def restaurar_limites(conn, foto):
+    limite, filas = foto
+    cursor = conn.cursor()
+    cursor.execute('UPDATE sistema_config SET limite_diario_gasolina = %s WHERE id = 1', (limite,))
+    cursor.execute('DELETE FROM limites_diarios WHERE fecha = %s', (FECHA_PRUEBA,))
+    for fila in filas:
+        columnas = ', '.join(fila)
+        cursor.execute(f'INSERT INTO limites_diarios ({columnas}) VALUES ({", ".join(["%s"] * len(fila))})',
+                       list(fila.values()))
+
+
+def preparar_datos(server, conn, tickets):
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM usuarios WHERE usuario = 'admin'")
+    usuario_id = cursor.fetchone()['id']
+    litros = tickets * LITROS_POR_TICKET
+    # Con el límite por defecto (LIMITE_DIARIO_DEFECTO) sólo entrarían 2000
+    # tickets de 1 L; lo ya reservado en la fecha también ocupa capacidad
+    cursor.execute('SELECT COALESCE(SUM(litros_agendados + litros_procesados), 0) AS ocupados '
+                   "FROM limites_diarios WHERE fecha = %s AND tipo_combustible = 'gasolina'", (FECHA_PRUEBA,))
+    ocupados = cursor.fetchone()['ocupados']
+    cursor.execute('UPDATE sistema_config SET limite_diario_gasolina = %s WHERE id = 1', (ocupados + litros,))
+    cursor.execute('''
+        INSERT INTO clientes (nombre, cedula, litros_mes, litros_disponibles,
+                              litros_mes_gasolina, litros_disponibles_gasolina)
+        VALUES ('CLIENTE CARGA TICKETS', %s, %s, %s, %s, %s)
+        RETURNING id
+    ''', (f'CARGA-TICKETS-{id(conn)}', litros, litros, litros, litros))
+    cliente_id = cursor.fetchone()['id']
+    cursor.execute(server.SQL_ENTRADA_INVENTARIO, {
+        'tipo': 'gasolina',
+        'litros': litros,
+        'usuario_id': usuario_id,
+        'observaciones': 'Prueba de carga de tickets'
+    })
+    return usuario_id, cliente_id
+
+
+def verificar(conn, cliente_id, esperados):
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT COUNT(*) AS total,
+               COUNT(DISTINCT codigo_ticket) AS distintos,
+               COUNT(*) FILTER (WHERE codigo_ticket IS NULL) AS sin_ticket
+        FROM agendamientos
+        WHERE cliente_id = %s AND fecha_agendada = %s
+    ''', (cliente_id, FECHA_PRUEBA))
+    fila = cursor.fetchone()
+    cursor.execute('''
+        SELECT codigo_ticket, COUNT(*) AS veces
+        FROM agendamientos
+        WHERE fecha_agendada = %s
+        GROUP BY codigo_ticket
+        HAVING COUNT(*) > 1
+        LIMIT 10
+    ''', (FECHA_PRUEBA,))
+    duplicados = cursor.fetchall()
+
+    print(f"Agendamientos creados: {fila['total']} (esperados {esperados})")
+    print(f"Tickets distintos: {fila['distintos']} | Sin ticket: {fila['sin_ticket']}")
+    assert fila['total'] == esperados, 'faltan agendamientos'
+    assert fila['sin_ticket'] == 0, 'hay agendamientos sin código de ticket'
+    assert not duplicados, f'códigos de ticket duplicados: {[dict(d) for d in duplicados]}'
+    assert fila['distintos'] == esperados, 'códigos de ticket repetidos'
+    print("✅ Sin tickets duplicados")
+
+
+def limpiar(conn, cliente_id, foto_inventario, foto_limites):
+    restaurar_inventario(conn, foto_inventario)
+    restaurar_limites(conn, foto_limites)
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM agendamientos WHERE cliente_id = %s', (cliente_id,))
+    cursor.execute("DELETE FROM ticket_counters WHERE fecha = %s", (FECHA_PRUEBA,))
+    cursor.execute('DELETE FROM clientes WHERE id = %s', (cliente_id,))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--tickets', type=int, default=10000)
+    parser.add_argument('--concurrencia', type=int, default=32)
+    parser.add_argument('--conservar', action='store_true', help='no borrar los datos de prueba')
+    args = parser.parse_args()
+
+    server = cargar_servidor(pool_max=args.concurrencia)
+    particiones.crear_futuras()
+    conn = conexion_directa()
+    cursor = conn.cursor()
+    cursor.execute('SELECT COUNT(*) AS total FROM agendamientos WHERE fecha_agendada = %s', (FECHA_PRUEBA,))
+    if cursor.fetchone()['total']:
+        print(f"ERROR: ya existen agendamientos para {FECHA_PRUEBA}; limpie la fecha de prueba primero")
+        raise SystemExit(1)
+
+    foto_inventario = guardar_inventario(conn)
+    foto_limites = guardar_limites(conn)
+    usuario_id, cliente_id = preparar_datos(server, conn, args.tickets)
+    headers = token_admin(server.app, usuario_id)
+    cliente = server.app.test_client()
+    cuerpo = {
+        'cliente_id': cliente_id,
+        'litros': LITROS_POR_TICKET,
+        'tipo_combustible': 'gasolina',
+        'fecha_agendada': FECHA_PRUEBA,
+    }
+
+    def agendar(_):
+        r = cliente.post('/api/agendamientos', json=cuerpo, headers=headers)
+        if r.status_code != 201:
+            raise RuntimeError(f'{r.status_code}: {r.get_data(as_text=True)}')
+
+    try:
+        segundos, latencias, errores = ejecutar_concurrente(agendar, args.concurrencia, args.tickets)
+        print("=" * 60)
+        print(f"{args.tickets} agendamientos con {args.concurrencia} hilos en {segundos:.2f}s "
+              f"({args.tickets / segundos:.1f}/s)")
+        print(f"p50 {percentil(latencias, 50) * 1000:.2f} ms | p95 {percentil(latencias, 95) * 1000:.2f} ms | "
+              f"p99 {percentil(latencias, 99) * 1000:.2f} ms")
+        print(f"Errores: {len(errores)}")
+        if errores:
+            print(f"   primer error: {errores[0]}")
+        print("=" * 60)
+        verificar(conn, cliente_id, args.tickets - len(errores))
+        assert not errores, 'hubo agendamientos fallidos'
+    finally:
+        if not args.conservar:
+            limpiar(conn, cliente_id, foto_inventario, foto_limites)
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
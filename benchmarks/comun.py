@@ -0,0 +1,139 @@
+"""
+Utilidades compartidas por los benchmarks y pruebas de carga.
+
+Todos los scripts de esta carpeta trabajan contra la base de datos indicada
+en DATABASE_URL. Crean sus propios datos de prueba: NO ejecutarlos contra
+la base de datos de producción.
+"""
+
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+
+def cargar_servidor(pool_max=None):
+    """Importa server.py con un pool dimensionado para la concurrencia pedida."""
+    if not os.environ.get('DATABASE_URL'):
+        print("ERROR: DATABASE_URL no esta configurada")
+        sys.exit(1)
+    if pool_max:
+        os.environ['DB_POOL_MAX'] = str(pool_max)
+    import registro
+    registro.configurar(formato='texto')
+    import server
+    return server
+
+
+def token_admin(app, usuario_id):
+    import jwt
+    token = jwt.encode({
+        'usuario': 'admin',
+        'id': usuario_id,
+        'es_admin': True,
+        'exp': datetime.utcnow() + timedelta(hours=2)
+    }, app.config['SECRET_KEY'], algorithm='HS256')
+    return {'Authorization': f'Bearer {token}'}
+
+
+def conexion_directa():
+    import psycopg2
+    from conexiones import parametros_conexion
+    conn = psycopg2.connect(**parametros_conexion())
+    conn.autocommit = True
+    return conn
+
+
+def guardar_inventario(conn):
+    """Foto de la existencia actual y del último movimiento del libro."""
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM inventario_actual')
+    existencias = [dict(fila) for fila in cursor.fetchall()]
+    cursor.execute('SELECT COALESCE(MAX(id), 0) AS ultimo FROM inventario')
+    return existencias, cursor.fetchone()['ultimo']
+
+
+def restaurar_inventario(conn, foto):
+    """Deshace los movimientos de inventario hechos por una prueba."""
+    existencias, ultimo = foto
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM inventario WHERE id > %s', (ultimo,))
+    cursor.execute('DELETE FROM inventario_actual')
+    for fila in existencias:
+        cursor.execute('''
+            INSERT INTO inventario_actual (tipo_combustible, litros_disponibles, ultimo_movimiento_id, fecha_actualizacion)
+            VALUES (%(tipo_combustible)s, %(litros_disponibles)s, %(ultimo_movimiento_id)s, %(fecha_actualizacion)s)
+        ''', fila)
+
+
+def descontar_consumo(conn, cliente_id):
+    """Quita del resumen consumo_diario los retiros de un cliente de prueba."""
+    cursor = conn.cursor()
+    cursor.execute('''
+        WITH totales AS (
+            SELECT fecha, tipo_combustible, SUM(litros) AS litros
+            FROM retiros
+            WHERE cliente_id = %(cliente_id)s
+            GROUP BY fecha, tipo_combustible
+        ),
+        clientes AS (
+            DELETE FROM consumo_diario_clientes
+            WHERE cliente_id = %(cliente_id)s
+            RETURNING fecha, tipo_combustible
+        )
+        UPDATE consumo_diario c
+        SET litros = c.litros - t.litros,
+            clientes = c.clientes - (SELECT COUNT(*) FROM clientes x
+                                     WHERE x.fecha = t.fecha AND x.tipo_combustible = t.tipo_combustible)
+        FROM totales t
+        WHERE c.fecha = t.fecha AND c.tipo_combustible = t.tipo_combustible
+    ''', {'cliente_id': cliente_id})
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, int(round(p / 100 * (len(ordenados) - 1)))))
+    return ordenados[indice]
+
+
+def ejecutar_concurrente(funcion, concurrencia, total):
+    """
+    Ejecuta `funcion(i)` `total` veces repartidas entre `concurrencia` hilos.
+
+    Devuelve (segundos_totales, latencias_en_segundos, errores).
+    """
+    siguiente = iter(range(total))
+    lock = threading.Lock()
+    latencias = []
+    errores = []
+
+    def trabajador():
+        while True:
+            with lock:
+                i = next(siguiente, None)
+            if i is None:
+                return
+            inicio = time.perf_counter()
+            try:
+                funcion(i)
+            except Exception as e:
+                with lock:
+                    errores.append(e)
+            duracion = time.perf_counter() - inicio
+            with lock:
+                latencias.append(duracion)
+
+    hilos = [threading.Thread(target=trabajador) for _ in range(concurrencia)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return time.perf_counter() - inicio, latencias, errores
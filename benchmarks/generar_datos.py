@@ -0,0 +1,412 @@
+"""
+Generador de datos sintéticos con la forma de los de producción, para
+pruebas de carga y de capacidad.
+
+A partir de una semilla genera siempre los mismos datos:
+  - clientes de todas las categorías de src/config/categories.ts, más
+    'Persona Natural', con cupos diarios de gasolina y gasoil;
+  - subclientes bajo los clientes institucionales (pocos tienen muchos);
+  - un año de retiros, con más movimiento en la hora pico de la mañana y
+    menos los fines de semana;
+  - agendamientos entregados, pendientes vencidos (no se presentaron) y
+    pendientes para los próximos días, sin pasarse de la capacidad diaria;
+  - el libro de inventario que corresponde a todo lo anterior: una salida
+    por retiro y por agendamiento y la recepción de una cisterna cada vez
+    que la existencia baja del mínimo.
+
+Los datos se cargan con COPY sobre el esquema base (migración 0001) de una
+base vacía, y después se aplican las demás migraciones, que calculan las
+tablas derivadas (contadores de tickets, consumo_diario, limites_diarios,
+inventario_actual, particiones...) con el mismo código que en producción.
+
+`--escala 1` es el tamaño aproximado de producción (ver PRODUCCION);
+`--escala 10` diez veces eso. `--sesgo` controla cuánto se concentra la
+actividad en pocos clientes (ley de Zipf; 0 = todos por igual) y `--pico`
+la fracción de los retiros que cae en la hora pico de la mañana.
+
+Uso:
+    DATABASE_URL=postgresql://.../base_vacia python benchmarks/generar_datos.py
+        [--escala 1] [--semilla 42] [--sesgo 1.0] [--pico 0.45] [--hasta 2026-10-17]
+"""
+
+import argparse
+import bisect
+import csv
+import itertools
+import os
+import re
+import tempfile
+import time
+from datetime import date, datetime, time as hora_dia, timedelta
+from random import Random
+
+from comun import RAIZ
+
+RUTA_CATEGORIAS = os.path.join(RAIZ, 'src', 'config', 'categories.ts')
+PERSONA_NATURAL = 'Persona Natural'
+
+# Tamaño aproximado de producción (escala 1)
+PRODUCCION = {
+    'clientes': 3000,
+    'retiros_dia': 150,
+    'agendamientos_dia': 40,
+    'limite_diario_gasolina': 2000,
+}
+DIAS_HISTORIA = 365
+FRACCION_INSTITUCIONAL = 0.3
+FRACCION_INACTIVOS = 0.03
+NO_PRESENTADOS = 0.06           # agendamientos vencidos que siguen pendientes
+OCUPACION_MAXIMA = 0.8          # de la capacidad diaria de gasolina
+ANTICIPACION_MAXIMA = 14        # días entre que se agenda y la fecha agendada
+FACTOR_DIA_SEMANA = (1.0, 1.0, 1.0, 1.0, 1.05, 0.7, 0.35)     # lunes ... domingo
+TANQUE_LITROS = 200             # máximo de un retiro o agendamiento
+CISTERNA_LITROS = 36000
+EXISTENCIA_MINIMA = 0.25        # fracción de la cisterna que dispara una recepción
+
+NOMBRES = ('JOSE', 'MARIA', 'LUIS', 'CARMEN', 'CARLOS', 'ANA', 'JUAN', 'ROSA', 'PEDRO', 'LUISA',
+           'MIGUEL', 'YOLANDA', 'RAFAEL', 'GLADYS', 'JESUS', 'MARIELA', 'FRANCISCO', 'YENNY',
+           'ANTONIO', 'DAYANA', 'MANUEL', 'ELENA', 'RICARDO', 'NELLY', 'ALEJANDRO', 'ZULAY')
+APELLIDOS = ('GONZALEZ', 'RODRIGUEZ', 'PEREZ', 'HERNANDEZ', 'GARCIA', 'MARTINEZ', 'LOPEZ',
+             'RAMIREZ', 'SANCHEZ', 'TORRES', 'DIAZ', 'ROJAS', 'MORENO', 'MENDOZA', 'CASTILLO',
+             'MEDINA', 'SUAREZ', 'BRICEÑO', 'BLANCO', 'CONTRERAS', 'VARGAS', 'GUERRERO')
+UNIDADES = ('UNIDAD', 'VEHICULO', 'CAMION', 'MOTO', 'AMBULANCIA', 'PATRULLA', 'COBRA')
+SECTORES = ('CATIA LA MAR', 'MAIQUETIA', 'LA GUAIRA', 'MACUTO', 'CARABALLEDA', 'NAIGUATA',
+            'CARAYACA', 'EL JUNKO', 'TANAGUARENA', 'CAMURI GRANDE')
+PREFIJOS_TELEFONO = ('0412', '0414', '0416', '0424', '0426')
+
+COLUMNAS = {
+    'clientes': ('id', 'nombre', 'direccion', 'telefono', 'cedula', 'rif', 'placa', 'categoria',
+                 'subcategoria', 'exonerado', 'huella', 'litros_mes', 'litros_disponibles',
+                 'litros_mes_gasolina', 'litros_disponibles_gasolina',
+                 'litros_mes_gasoil', 'litros_disponibles_gasoil', 'activo'),
+    'subclientes': ('id', 'cliente_padre_id', 'nombre', 'cedula', 'placa',
+                    'litros_mes_gasolina', 'litros_disponibles_gasolina',
+                    'litros_mes_gasoil', 'litros_disponibles_gasoil', 'activo'),
+    'retiros': ('id', 'cliente_id', 'fecha', 'hora', 'litros', 'usuario_id', 'tipo_combustible'),
+    'agendamientos': ('id', 'cliente_id', 'subcliente_id', 'tipo_combustible', 'litros', 'fecha_agendada',
+                      'codigo_ticket', 'estado', 'fecha_creacion'),
+    'inventario': ('id', 'tipo_combustible', 'litros_ingresados', 'litros_disponibles', 'fecha_ingreso',
+                   'usuario_id', 'observaciones'),
+}
+
+
+def leer_categorias(ruta=RUTA_CATEGORIAS):
+    """
+    Categorías principales y subcategorías de src/config/categories.ts, para
+    que los datos sigan al frontend sin duplicar la lista aquí.
+    """
+    with open(ruta, encoding='utf-8') as f:
+        fuente = f.read()
+    principales = re.search(r'MAIN_CATEGORIES\s*=\s*\[(.*?)\]', fuente, re.S)
+    bloque = re.search(r'SUBCATEGORIES\s*:[^=]*=\s*\{(.*?)\n\};', fuente, re.S)
+    if not principales or not bloque:
+        raise ValueError(f'No se encontraron MAIN_CATEGORIES/SUBCATEGORIES en {ruta}')
+    cadena = r"'((?:[^'\\]|\\.)*)'"
+    subcategorias = {
+        categoria: re.findall(cadena, lista)
+        for categoria, lista in re.findall(r"'((?:[^'\\]|\\.)*)'\s*:\s*\[(.*?)\]", bloque.group(1), re.S)
+    }
+    return re.findall(cadena, principales.group(1)), subcategorias
+
+
+class Tabla:
+    """Archivo temporal con las filas en CSV, listo para COPY ... FROM STDIN."""
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.filas = 0
+        self._archivo = tempfile.TemporaryFile('w+', encoding='utf-8', newline='')
+        self._escritor = csv.writer(self._archivo, lineterminator='\n')
+
+    def agregar(self, *valores):
+        self._escritor.writerow(valores)
+        self.filas += 1
+
+    def copiar(self, cursor):
+        self._archivo.seek(0)
+        cursor.copy_expert(f"COPY {self.nombre} ({', '.join(COLUMNAS[self.nombre])}) "
+                           f"FROM STDIN WITH (FORMAT csv)", self._archivo)
+        self._archivo.close()
+
+
+class Generador:
+    """
+    Genera todas las tablas en memoria de archivos temporales. Los ids se
+    asignan aquí, en orden cronológico, como quedarían en producción.
+    """
+
+    def __init__(self, escala=1.0, semilla=42, sesgo=1.0, pico=0.45, hasta=None, usuario_id=1):
+        self.escala = escala
+        self.rng = Random(semilla)
+        self.sesgo = sesgo
+        self.pico = pico
+        self.hasta = hasta or date.today()
+        self.usuario_id = usuario_id
+        self.limite_gasolina = round(PRODUCCION['limite_diario_gasolina'] * max(escala, 1))
+        self.tablas = {nombre: Tabla(nombre) for nombre in COLUMNAS}
+        self.clientes = []
+        self.subclientes = {}
+        self._pesos = []
+        self._ids = {nombre: itertools.count(1) for nombre in ('retiros', 'agendamientos', 'inventario')}
+        self._existencia = {'gasolina': 0.0, 'gasoil': 0.0}
+        self._tickets = {}
+        self._gasolina_agendada = {}
+
+    # -- clientes -----------------------------------------------------------
+
+    def _cupo(self, institucional):
+        if institucional:
+            gasolina = self.rng.choice((0, 60, 100, 150, 200, 300, 500))
+            gasoil = self.rng.choice((0, 0, 100, 200, 400, 1000))
+        else:
+            gasolina = self.rng.choice((20, 30, 30, 40, 40, 40, 60))
+            gasoil = self.rng.choice((0, 0, 0, 0, 20, 40))
+        return gasolina or (0 if gasoil else 60), gasoil
+
+    def _placa(self):
+        letras = 'ABCDEFGHJKLMNPRSTUVWXYZ'
+        return (''.join(self.rng.choice(letras) for _ in range(2)) + f'{self.rng.randrange(1000):03d}'
+                + ''.join(self.rng.choice(letras) for _ in range(2)))
+
+    def _telefono(self):
+        return self.rng.choice(PREFIJOS_TELEFONO) + f'{self.rng.randrange(10 ** 7):07d}'
+
+    def generar_clientes(self):
+        principales, subcategorias = leer_categorias()
+        total = max(int(PRODUCCION['clientes'] * self.escala), 1)
+        for cliente_id in range(1, total + 1):
+            institucional = self.rng.random() < FRACCION_INSTITUCIONAL
+            if institucional:
+                categoria = self.rng.choice(principales)
+                subcategoria = self.rng.choice(subcategorias.get(categoria) or [None])
+                nombre = f"{(subcategoria or categoria).upper()} - {self.rng.choice(UNIDADES)} {cliente_id}"
+                cedula, rif = f'J{30000000 + cliente_id}', f'J-{30000000 + cliente_id}-{cliente_id % 10}'
+            else:
+                categoria, subcategoria = PERSONA_NATURAL, None
+                nombre = (f'{self.rng.choice(NOMBRES)} {self.rng.choice(NOMBRES)} '
+                          f'{self.rng.choice(APELLIDOS)} {self.rng.choice(APELLIDOS)}')
+                cedula, rif = f'V{5000000 + cliente_id * 7}', None
+            gasolina, gasoil = self._cupo(institucional)
+            if institucional:
+                # Lo asignado a los subclientes no puede pasar del cupo del
+                # padre (lo valida POST /api/clientes/<id>/subclientes)
+                asignado_gasolina, asignado_gasoil = self._generar_subclientes(cliente_id, nombre)
+                gasolina = max(gasolina, round(asignado_gasolina / 0.85))
+                gasoil = max(gasoil, round(asignado_gasoil / 0.85))
+            activo = self.rng.random() >= FRACCION_INACTIVOS
+            # El reset diario deja los cupos completos: no hay retiros de hoy
+            self.tablas['clientes'].agregar(
+                cliente_id, nombre, f'{self.rng.choice(SECTORES)}, CALLE {self.rng.randint(1, 40)}',
+                self._telefono(), cedula, rif, self._placa(), categoria, subcategoria,
+                self.rng.random() < 0.05, self.rng.random() < 0.3,
+                gasolina + gasoil, gasolina + gasoil, gasolina, gasolina, gasoil, gasoil, activo)
+            if activo:
+                self.clientes.append((cliente_id, gasolina, gasoil, institucional))
+
+        # Actividad según Zipf sobre un orden aleatorio (no correlacionado
+        # con el id); los institucionales retiran más seguido
+        orden = list(range(len(self.clientes)))
+        self.rng.shuffle(orden)
+        pesos = [0.0] * len(self.clientes)
+        for rango, indice in enumerate(orden, 1):
+            pesos[indice] = (3 if self.clientes[indice][3] else 1) / rango ** self.sesgo
+        self._pesos = list(itertools.accumulate(pesos))
+
+    def _generar_subclientes(self, padre_id, nombre_padre):
+        # Pareto: la mayoría tiene pocos o ninguno y unos pocos tienen cientos.
+        # Devuelve los litros asignados a los activos (gasolina, gasoil)
+        cantidad = min(int(self.rng.paretovariate(1.3) * 2) - 2, 250)
+        tabla = self.tablas['subclientes']
+        ids = []
+        asignado = [0, 0]
+        for n in range(1, cantidad + 1):
+            gasolina, gasoil = self.rng.choice(((40, 0), (60, 0), (0, 100), (40, 40), (100, 200)))
+            subcliente_id = tabla.filas + 1
+            activo = self.rng.random() >= FRACCION_INACTIVOS
+            tabla.agregar(subcliente_id, padre_id, f'{self.rng.choice(UNIDADES)} {n} - {nombre_padre[:40]}',
+                          f'S{padre_id}-{n}', self._placa(), gasolina, gasolina, gasoil, gasoil, activo)
+            if activo:
+                ids.append(subcliente_id)
+                asignado[0] += gasolina
+                asignado[1] += gasoil
+        if ids:
+            self.subclientes[padre_id] = ids
+        return asignado
+
+    def _cliente(self):
+        indice = bisect.bisect(self._pesos, self.rng.random() * self._pesos[-1])
+        return self.clientes[min(indice, len(self.clientes) - 1)]
+
+    def _clientes_del_dia(self, cantidad):
+        """
+        Clientes distintos para los retiros de un día: el cupo es diario, así
+        que los más activos retiran a lo sumo una vez y el resto de sus
+        retiros pasa a otros clientes.
+        """
+        elegidos = {}
+        for _ in range(min(cantidad * 3, len(self.clientes) * 3)):
+            if len(elegidos) >= min(cantidad, len(self.clientes)):
+                break
+            cliente = self._cliente()
+            elegidos.setdefault(cliente[0], cliente)
+        return elegidos.values()
+
+    def _tipo_y_litros(self, gasolina, gasoil):
+        if gasoil and (not gasolina or self.rng.random() < gasoil / (gasolina + gasoil)):
+            tipo, cupo = 'gasoil', gasoil
+        else:
+            tipo, cupo = 'gasolina', gasolina
+        # La mayoría llena el cupo completo (o el tanque, en los institucionales)
+        return tipo, max(round(min(cupo, TANQUE_LITROS) * self.rng.choice((1, 1, 1, 0.75, 0.5))), 1)
+
+    # -- movimientos --------------------------------------------------------
+
+    def _hora(self):
+        if self.rng.random() < self.pico:
+            minutos = self.rng.triangular(6 * 60, 9 * 60, 7.5 * 60)
+        else:
+            minutos = self.rng.uniform(9 * 60, 18 * 60)
+        segundos = int(minutos * 60)
+        return hora_dia(segundos // 3600, segundos // 60 % 60, segundos % 60)
+
+    def _cantidad(self, base, dia):
+        media = base * self.escala * FACTOR_DIA_SEMANA[dia.weekday()]
+        return max(int(self.rng.gauss(media, media ** 0.5)), 0)
+
+    def _movimiento(self, momento, tipo, litros, observaciones):
+        """Anota un movimiento en el libro; recibe una cisterna antes si hace falta."""
+        cisterna = CISTERNA_LITROS * max(self.escala, 1)
+        if litros < 0 and self._existencia[tipo] + litros < cisterna * EXISTENCIA_MINIMA:
+            self._movimiento(momento - timedelta(minutes=1), tipo, cisterna, 'Recepción de cisterna')
+        self._existencia[tipo] += litros
+        self.tablas['inventario'].agregar(
+            next(self._ids['inventario']), tipo, litros, self._existencia[tipo],
+            momento.isoformat(sep=' '), self.usuario_id, observaciones)
+
+    def _agendamiento(self, dia, momento):
+        cliente_id, gasolina, gasoil, institucional = self._cliente()
+        anticipacion = min(int(self.rng.expovariate(1 / 2.5)) + 1, ANTICIPACION_MAXIMA)
+        fecha = dia + timedelta(days=anticipacion)
+        tipo, litros = self._tipo_y_litros(gasolina, gasoil)
+        if tipo == 'gasolina':
+            agendada = self._gasolina_agendada.get(fecha, 0)
+            if agendada + litros > self.limite_gasolina * OCUPACION_MAXIMA:
+                if not gasoil:
+                    return None
+                tipo, litros = 'gasoil', min(litros, gasoil)
+            else:
+                self._gasolina_agendada[fecha] = agendada + litros
+        subclientes = self.subclientes.get(cliente_id) if institucional else None
+        subcliente_id = self.rng.choice(subclientes) if subclientes and self.rng.random() < 0.6 else None
+        if fecha >= self.hasta or self.rng.random() < NO_PRESENTADOS:
+            estado = 'pendiente'
+        else:
+            estado = 'entregado'
+        ticket = self._tickets[fecha] = self._tickets.get(fecha, 0) + 1
+        self.tablas['agendamientos'].agregar(
+            next(self._ids['agendamientos']), cliente_id, subcliente_id, tipo, litros, fecha,
+            ticket, estado, momento.isoformat(sep=' '))
+        return momento, tipo, -litros, f'Agendamiento #{ticket} - Cliente ID: {cliente_id}'
+
+    def generar_movimientos(self):
+        """Retiros y agendamientos día por día, con sus salidas del libro."""
+        inicio = self.hasta - timedelta(days=DIAS_HISTORIA)
+        for tipo in self._existencia:
+            self._movimiento(datetime.combine(inicio, hora_dia(5)), tipo, CISTERNA_LITROS * max(self.escala, 1),
+                             'Existencia inicial')
+        for numero in range(DIAS_HISTORIA):
+            dia = inicio + timedelta(days=numero)
+            retiros = sorted((self._hora(), cliente) for cliente in self._clientes_del_dia(
+                self._cantidad(PRODUCCION['retiros_dia'], dia)))
+            salidas = []
+            for hora, (cliente_id, gasolina, gasoil, _) in retiros:
+                tipo, litros = self._tipo_y_litros(gasolina, gasoil)
+                retiro_id = next(self._ids['retiros'])
+                self.tablas['retiros'].agregar(retiro_id, cliente_id, dia, hora.isoformat(), litros,
+                                               self.usuario_id, tipo)
+                salidas.append((datetime.combine(dia, hora), tipo, -litros,
+                                f'Retiro #{retiro_id} - Cliente ID: {cliente_id}'))
+            momentos = sorted(datetime.combine(dia, hora_dia(7)) + timedelta(seconds=self.rng.randrange(13 * 3600))
+                              for _ in range(self._cantidad(PRODUCCION['agendamientos_dia'], dia)))
+            for momento in momentos:
+                salida = self._agendamiento(dia, momento)
+                if salida:
+                    salidas.append(salida)
+            for salida in sorted(salidas, key=lambda s: s[0]):
+                self._movimiento(*salida)
+
+    def cargar(self, cursor):
+        for tabla in self.tablas.values():
+            tabla.copiar(cursor)
+        for nombre in COLUMNAS:
+            cursor.execute(f"SELECT setval(pg_get_serial_sequence('{nombre}', 'id'), "
+                           f"(SELECT COALESCE(MAX(id), 0) + 1 FROM {nombre}), false)")
+        cursor.execute('UPDATE sistema_config SET limite_diario_gasolina = %s WHERE id = 1',
+                       (self.limite_gasolina,))
+        return {nombre: tabla.filas for nombre, tabla in self.tablas.items()}
+
+
+def poblar(escala=1.0, semilla=42, sesgo=1.0, pico=0.45, hasta=None):
+    """
+    Aplica el esquema base, carga los datos generados y aplica el resto de
+    migraciones. Devuelve las filas cargadas por tabla.
+    """
+    import psycopg2
+    import psycopg2.extras
+    import migraciones
+    from conexiones import parametros_conexion
+
+    conn = psycopg2.connect(**parametros_conexion())
+    try:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cursor.execute("SELECT to_regclass('schema_version') IS NOT NULL AS existe")
+        if cursor.fetchone()['existe']:
+            cursor.execute('SELECT COALESCE(MAX(version), 0) AS version FROM schema_version')
+            if cursor.fetchone()['version'] > 1:
+                raise RuntimeError('La base ya tiene migraciones aplicadas: el generador necesita una base vacía')
+        conn.commit()
+        migraciones.aplicar(hasta=1)
+        migraciones.asegurar_admin()
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM clientes) AS hay_clientes')
+        if cursor.fetchone()['hay_clientes']:
+            raise RuntimeError('La base ya tiene clientes: el generador necesita una base vacía')
+        cursor.execute("SELECT id FROM usuarios WHERE usuario = 'admin'")
+        generador = Generador(escala, semilla, sesgo, pico, hasta, cursor.fetchone()['id'])
+        generador.generar_clientes()
+        generador.generar_movimientos()
+        filas = generador.cargar(cursor)
+        conn.commit()
+    finally:
+        conn.close()
+    migraciones.aplicar()
+    conn = psycopg2.connect(**parametros_conexion())
+    conn.autocommit = True
+    conn.cursor().execute('VACUUM ANALYZE')
+    conn.close()
+    return filas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--escala', type=float, default=1.0, help='1 = tamaño aproximado de producción')
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--sesgo', type=float, default=1.0,
+                        help='exponente de Zipf de la actividad por cliente (0 = uniforme)')
+    parser.add_argument('--pico', type=float, default=0.45, help='fracción de retiros entre 6:00 y 9:00')
+    parser.add_argument('--hasta', type=date.fromisoformat, help='último día de historia + 1 (defecto hoy)')
+    args = parser.parse_args()
+    import registro
+    registro.configurar(formato='texto')
+
+    if not os.environ.get('DATABASE_URL'):
+        print("ERROR: DATABASE_URL no esta configurada")
+        raise SystemExit(1)
+    inicio = time.perf_counter()
+    filas = poblar(args.escala, args.semilla, args.sesgo, args.pico, args.hasta)
+    print(f"\n✅ Datos generados en {time.perf_counter() - inicio:.1f}s (escala {args.escala}, semilla {args.semilla})")
+    for nombre, cantidad in filas.items():
+        print(f"   {nombre:15} {cantidad:>10,}")
+
+
+if __name__ == '__main__':
+    main()
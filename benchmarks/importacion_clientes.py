@@ -0,0 +1,83 @@
+"""
+Benchmark de POST /api/clientes/bulk: importa N clientes generados (50.000
+por defecto) en CSV y NDJSON, primero como altas y luego como
+actualizaciones del mismo archivo, y borra los clientes al terminar.
+
+Uso:
+    DATABASE_URL=postgresql://... python benchmarks/importacion_clientes.py [--clientes 50000]
+"""
+
+import argparse
+import json
+import time
+
+from comun import cargar_servidor, conexion_directa, token_admin
+
+PREFIJO_CEDULA = 'BULK-'
+
+
+def generar_csv(total):
+    lineas = ['nombre,cedula,telefono,placa,categoria,litros_mes_gasolina,litros_mes_gasoil,exonerado']
+    for i in range(total):
+        lineas.append(f'CLIENTE IMPORTADO {i},{PREFIJO_CEDULA}{i},0414{i:07d},AB{i:05d},'
+                      f'Persona Natural,{20 + i % 40},{i % 15},{"si" if i % 10 == 0 else "no"}')
+    return ('\n'.join(lineas) + '\n').encode()
+
+
+def generar_ndjson(total):
+    return ''.join(json.dumps({
+        'nombre': f'CLIENTE IMPORTADO {i}',
+        'cedula': f'{PREFIJO_CEDULA}{i}',
+        'telefono': f'0414{i:07d}',
+        'litros_mes_gasolina': 20 + i % 40,
+        'litros_mes_gasoil': i % 15,
+    }) + '\n' for i in range(total)).encode()
+
+
+def limpiar(conn):
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM clientes WHERE cedula LIKE %s', (PREFIJO_CEDULA + '%',))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--clientes', type=int, default=50000)
+    args = parser.parse_args()
+
+    server = cargar_servidor()
+    conn = conexion_directa()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM usuarios WHERE usuario = 'admin'")
+    headers = token_admin(server.app, cursor.fetchone()['id'])
+    cliente = server.app.test_client()
+    limpiar(conn)
+
+    cuerpos = {
+        'csv': (generar_csv(args.clientes), 'text/csv'),
+        'ndjson': (generar_ndjson(args.clientes), 'application/x-ndjson'),
+    }
+
+    print("=" * 72)
+    print(f"{'formato':>8} {'pasada':>14} {'MB':>7} {'segundos':>9} {'filas/s':>10} {'nuevos':>8} {'act.':>8}")
+    print("-" * 72)
+    try:
+        for formato, (cuerpo, tipo) in cuerpos.items():
+            for pasada in ('altas', 'actualizacion'):
+                inicio = time.perf_counter()
+                r = cliente.post('/api/clientes/bulk', data=cuerpo,
+                                 headers={**headers, 'Content-Type': tipo})
+                segundos = time.perf_counter() - inicio
+                reporte = r.get_json()
+                if r.status_code != 200 or reporte['total_errores']:
+                    raise SystemExit(f'Importación fallida ({r.status_code}): {r.get_data(as_text=True)[:500]}')
+                print(f"{formato:>8} {pasada:>14} {len(cuerpo) / 1e6:>7.2f} {segundos:>9.2f} "
+                      f"{args.clientes / segundos:>10.0f} {reporte['insertados']:>8} {reporte['actualizados']:>8}")
+            limpiar(conn)
+        print("=" * 72)
+    finally:
+        limpiar(conn)
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""
+Microbenchmark del costo del registro (logging) por petición: compara los
+print() que hacía crear_agendamiento con el registro por cola de
+registro.py.
+
+Cada variante corre en un proceso hijo cuyo stdout es un pipe, como el de
+gunicorn en Render. El proceso padre lee el pipe de forma continua o con
+pausas (un recolector de logs que se atrasa: el pipe se llena y write()
+bloquea). El hijo simula N peticiones: las dos líneas de depuración del
+descuento de saldo e inventario y una espera entre peticiones (el tiempo
+que la petición pasa en PostgreSQL). Se mide sólo el tiempo de las
+llamadas de registro.
+
+Variantes:
+    print            los print(f"DEBUG: ...") anteriores
+    logging_directo  logging con un StreamHandler síncrono en formato JSON
+    cola_inactivo    registro.py con DEBUG desactivado (producción)
+    cola_muestreo    registro.py con LOG_DEBUG=agendamientos=0.01
+    cola_activo      registro.py con todo el DEBUG activo
+
+No usa la base de datos.
+
+Uso:
+    python benchmarks/registro_overhead.py [--peticiones 20000] [--lector continuo|pausas|ambos]
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from comun import RAIZ, percentil
+
+VARIANTES = ('print', 'logging_directo', 'cola_inactivo', 'cola_muestreo', 'cola_activo')
+LOGGER = 'agendamientos'
+
+
+def peticiones_con_print(total, pausa):
+    tiempos = []
+    for i in range(total):
+        litros, tipo, cliente_id, antes = 20.0, 'gasolina', 1000 + i % 3000, 4000.0 - i % 1000
+        inicio = time.perf_counter_ns()
+        print(f"DEBUG: Descontando {litros}L de {tipo} al cliente {cliente_id}")
+        print(f"DEBUG: Descontando {litros}L de inventario de {tipo}. Antes: {antes}L, Después: {antes - litros}L")
+        tiempos.append(time.perf_counter_ns() - inicio)
+        time.sleep(pausa)
+    return tiempos
+
+
+def peticiones_con_logging(total, pausa):
+    log = logging.getLogger(LOGGER)
+    tiempos = []
+    for i in range(total):
+        litros, tipo, cliente_id, antes = 20.0, 'gasolina', 1000 + i % 3000, 4000.0 - i % 1000
+        inicio = time.perf_counter_ns()
+        log.debug("Descontando %sL de %s al cliente %s", litros, tipo, cliente_id)
+        log.debug("Descontando %sL de inventario de %s. Antes: %sL, Después: %sL",
+                  litros, tipo, antes, antes - litros)
+        tiempos.append(time.perf_counter_ns() - inicio)
+        time.sleep(pausa)
+    return tiempos
+
+
+def hijo(variante, total, pausa, ruta_resultado):
+    """Corre en el proceso hijo: simula las peticiones y guarda las latencias."""
+    from flask import Flask
+    import registro
+
+    if variante == 'logging_directo':
+        salida = logging.StreamHandler(sys.stdout)
+        salida.setFormatter(registro.FormatoJSON())
+        logging.getLogger().addHandler(salida)
+        logging.getLogger().setLevel(logging.DEBUG)
+    elif variante != 'print':
+        os.environ['LOG_DEBUG'] = {'cola_inactivo': '', 'cola_muestreo': f'{LOGGER}=0.01',
+                                   'cola_activo': LOGGER}[variante]
+        registro.configurar()
+
+    # Dentro de una petición, como en el servidor (registro.py agrega método y ruta)
+    app = Flask(__name__)
+    with app.test_request_context('/api/agendamientos', method='POST'):
+        simular = peticiones_con_print if variante == 'print' else peticiones_con_logging
+        tiempos = simular(total, pausa)
+
+    inicio = time.perf_counter()
+    registro.detener()
+    sys.stdout.flush()
+    drenado_ms = (time.perf_counter() - inicio) * 1000
+    with open(ruta_resultado, 'w', encoding='utf-8') as f:
+        json.dump({'tiempos': tiempos, 'drenado_ms': drenado_ms}, f)
+
+
+def leer_pipe(pipe, pausas, cuenta):
+    """Vacía el stdout del hijo; con `pausas` se detiene 300ms de cada 400ms."""
+    ultima_pausa = time.monotonic()
+    while True:
+        bloque = os.read(pipe.fileno(), 65536)
+        if not bloque:
+            return
+        cuenta[0] += len(bloque)
+        if pausas and time.monotonic() - ultima_pausa >= 0.1:
+            time.sleep(0.3)
+            ultima_pausa = time.monotonic()
+
+
+def medir(variante, lector, args):
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        ruta = f.name
+    try:
+        entorno = dict(os.environ, LOG_FORMATO='json', LOG_NIVEL='INFO')
+        entorno.pop('LOG_DEBUG', None)
+        comando = [sys.executable, os.path.abspath(__file__), '--hijo', variante, '--peticiones', str(args.peticiones),
+                   '--pausa-us', str(args.pausa_us), '--resultado', ruta]
+        inicio = time.perf_counter()
+        proceso = subprocess.Popen(comando, cwd=RAIZ, env=entorno, stdout=subprocess.PIPE)
+        cuenta = [0]
+        lector_hilo = threading.Thread(target=leer_pipe, args=(proceso.stdout, lector == 'pausas', cuenta))
+        lector_hilo.start()
+        proceso.wait()
+        lector_hilo.join()
+        total_seg = time.perf_counter() - inicio
+        if proceso.returncode:
+            raise SystemExit(f'La variante {variante} terminó con código {proceso.returncode}')
+        with open(ruta, encoding='utf-8') as f:
+            resultado = json.load(f)
+    finally:
+        os.unlink(ruta)
+
+    micros = [t / 1000 for t in resultado['tiempos']]
+    return {
+        'variante': variante, 'lector': lector,
+        'p50': percentil(micros, 50), 'p99': percentil(micros, 99), 'p999': percentil(micros, 99.9),
+        'max': max(micros), 'total_ms': sum(micros) / 1000,
+        'drenado_ms': resultado['drenado_ms'], 'kb': cuenta[0] / 1024, 'segundos': total_seg,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--peticiones', type=int, default=20000)
+    parser.add_argument('--pausa-us', type=int, default=100, help='espera entre peticiones simuladas')
+    parser.add_argument('--lector', choices=('continuo', 'pausas', 'ambos'), default='ambos')
+    parser.add_argument('--variantes', default=','.join(VARIANTES))
+    parser.add_argument('--hijo', choices=VARIANTES, help=argparse.SUPPRESS)
+    parser.add_argument('--resultado', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.hijo:
+        hijo(args.hijo, args.peticiones, args.pausa_us / 1e6, args.resultado)
+        return
+
+    lectores = ('continuo', 'pausas') if args.lector == 'ambos' else (args.lector,)
+    print("=" * 100)
+    print(f"Registro por petición: {args.peticiones} peticiones, 2 líneas de depuración cada una, "
+          f"{args.pausa_us}µs entre peticiones")
+    print("-" * 100)
+    print(f"{'lector':<9} {'variante':<16} {'p50 µs':>8} {'p99 µs':>8} {'p99.9 µs':>9} {'max µs':>9} "
+          f"{'total ms':>9} {'drenado ms':>11} {'KB escritos':>12}")
+    for lector in lectores:
+        for variante in args.variantes.split(','):
+            r = medir(variante, lector, args)
+            print(f"{r['lector']:<9} {r['variante']:<16} {r['p50']:>8.2f} {r['p99']:>8.2f} {r['p999']:>9.1f} "
+                  f"{r['max']:>9.0f} {r['total_ms']:>9.1f} {r['drenado_ms']:>11.1f} {r['kb']:>12.0f}")
+    print("=" * 100)
+
+
+if __name__ == '__main__':
+    main()
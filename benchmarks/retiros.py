@@ -0,0 +1,119 @@
+"""
+Benchmark de POST /api/retiros con 1, 8 y 32 clientes concurrentes.
+
+Crea un cliente de prueba, dispara retiros en paralelo a través del
+cliente de pruebas de Flask y verifica al final que el saldo y el
+inventario descontados coinciden con la suma de los retiros registrados
+(ninguna actualización perdida). Si no hay existencia de gasolina en
+inventario_actual (base recién migrada) se crea una; el inventario se
+restaura al terminar.
+
+Uso:
+    DATABASE_URL=postgresql://... python benchmarks/retiros.py [--retiros 2000]
+"""
+
+import argparse
+
+from comun import (cargar_servidor, conexion_directa, descontar_consumo,
+                   ejecutar_concurrente, guardar_inventario, percentil,
+                   restaurar_inventario, token_admin)
+
+CONCURRENCIAS = (1, 8, 32)
+LITROS_POR_RETIRO = 1.0
+
+
+def preparar_datos(conn, litros):
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM usuarios WHERE usuario = 'admin'")
+    usuario_id = cursor.fetchone()['id']
+    # Sin fila de gasolina el retiro no descuenta inventario y la
+    # verificación no tendría con qué comparar
+    cursor.execute('''
+        INSERT INTO inventario_actual (tipo_combustible, litros_disponibles)
+        VALUES ('gasolina', %s)
+        ON CONFLICT (tipo_combustible) DO NOTHING
+    ''', (litros,))
+    cursor.execute('''
+        INSERT INTO clientes (nombre, cedula, litros_mes, litros_disponibles,
+                              litros_mes_gasolina, litros_disponibles_gasolina)
+        VALUES ('CLIENTE BENCHMARK RETIROS', %s, 0, 0, 0, 0)
+        RETURNING id
+    ''', (f'BENCH-RETIROS-{id(conn)}',))
+    cliente_id = cursor.fetchone()['id']
+    return usuario_id, cliente_id
+
+
+def existencia_gasolina(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT litros_disponibles FROM inventario_actual WHERE tipo_combustible = 'gasolina'")
+    fila = cursor.fetchone()
+    return fila['litros_disponibles'] if fila else 0.0
+
+
+def estado(conn, cliente_id):
+    cursor = conn.cursor()
+    cursor.execute('SELECT litros_disponibles_gasolina FROM clientes WHERE id = %s', (cliente_id,))
+    saldo = cursor.fetchone()['litros_disponibles_gasolina']
+    inventario = existencia_gasolina(conn)
+    cursor.execute('SELECT COALESCE(SUM(litros), 0) AS total FROM retiros WHERE cliente_id = %s', (cliente_id,))
+    retirado = cursor.fetchone()['total']
+    return saldo, inventario, retirado
+
+
+def limpiar(conn, cliente_id, foto_inventario):
+    restaurar_inventario(conn, foto_inventario)
+    descontar_consumo(conn, cliente_id)
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM retiros WHERE cliente_id = %s', (cliente_id,))
+    cursor.execute('DELETE FROM clientes WHERE id = %s', (cliente_id,))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--retiros', type=int, default=2000, help='retiros por nivel de concurrencia')
+    parser.add_argument('--conservar', action='store_true', help='no borrar los datos de prueba')
+    args = parser.parse_args()
+
+    server = cargar_servidor(pool_max=max(CONCURRENCIAS))
+    conn = conexion_directa()
+    foto_inventario = guardar_inventario(conn)
+    usuario_id, cliente_id = preparar_datos(conn, args.retiros * len(CONCURRENCIAS) * LITROS_POR_RETIRO)
+    inventario_inicial = existencia_gasolina(conn)
+    headers = token_admin(server.app, usuario_id)
+    cliente = server.app.test_client()
+    cuerpo = {'cliente_id': cliente_id, 'litros': LITROS_POR_RETIRO, 'tipo_combustible': 'gasolina'}
+
+    def retirar(_):
+        r = cliente.post('/api/retiros', json=cuerpo, headers=headers)
+        if r.status_code != 201:
+            raise RuntimeError(f'{r.status_code}: {r.get_data(as_text=True)}')
+
+    print("=" * 72)
+    print(f"{'concurrencia':>12} {'retiros/s':>12} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'errores':>8}")
+    print("-" * 72)
+    try:
+        for concurrencia in CONCURRENCIAS:
+            segundos, latencias, errores = ejecutar_concurrente(retirar, concurrencia, args.retiros)
+            print(f"{concurrencia:>12} {len(latencias) / segundos:>12.1f} "
+                  f"{percentil(latencias, 50) * 1000:>10.2f} {percentil(latencias, 95) * 1000:>10.2f} "
+                  f"{percentil(latencias, 99) * 1000:>10.2f} {len(errores):>8}")
+            if errores:
+                print(f"   primer error: {errores[0]}")
+        print("=" * 72)
+
+        saldo, inventario, retirado = estado(conn, cliente_id)
+        # inventario_actual es REAL: cada descuento redondea a float4
+        consistente = (abs(saldo + retirado) < 1e-6
+                       and abs(inventario - (inventario_inicial - retirado)) < 1e-2)
+        print(f"Saldo final: {saldo} | Inventario final: {inventario} | Total retirado: {retirado} | "
+              f"{'CONSISTENTE' if consistente else 'INCONSISTENTE'}")
+        if not consistente:
+            raise SystemExit(1)
+    finally:
+        if not args.conservar:
+            limpiar(conn, cliente_id, foto_inventario)
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
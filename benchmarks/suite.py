@@ -0,0 +1,778 @@
+"""
+Suite de benchmarks de todas las rutas de server.py.
+
+Levanta un PostgreSQL desechable, siembra datos a la escala pedida y mide
+cada ruta de dos formas:
+  - con el cliente de pruebas de Flask (sin red);
+  - por HTTP real, con un servidor werkzeug en un hilo del mismo proceso.
+
+Por ruta informa las latencias p50/p95/p99, el throughput y las consultas
+SQL por petición, y guarda todo en un JSON para comparar corridas.
+
+El PostgreSQL desechable se crea con initdb en un directorio temporal.
+Escucha sólo en un socket Unix, sin fsync, y se borra al terminar. Con
+--servidor se usa en cambio un servidor existente: se crea una base de
+datos temporal y se borra al final. La base se siembra antes de las
+migraciones 0002 en adelante, así que las tablas derivadas (consumo_diario,
+limites_diarios, inventario_actual, particiones...) las calcula el mismo
+código que en producción.
+
+Primero se miden las lecturas y después las escrituras. Las que afectan a
+todo el sistema (reset de litros, reset de inventario) van al final y con
+pocas repeticiones. Las rutas con caché (@cacheada, modelo de clientes) se
+miden en caliente, como las ve un usuario después de la primera petición.
+
+Uso:
+    python benchmarks/suite.py [--escala 1] [--peticiones 200] [--concurrencia 8]
+                               [--modo flask|http|ambos] [--solo retiros,clientes]
+                               [--salida resultados.json]
+    python benchmarks/suite.py --generador --escala 10   # datos de generar_datos.py
+    python benchmarks/suite.py --servidor postgresql://postgres@localhost/postgres
+    python benchmarks/suite.py --comparar antes.json despues.json
+
+Variables de entorno:
+    PG_BIN   Directorio con initdb y pg_ctl (defecto: el de pg_config o el PATH)
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import Counter, namedtuple
+from datetime import date, datetime, timedelta
+
+import psycopg2
+
+import generar_datos
+from comun import RAIZ, ejecutar_concurrente, percentil, token_admin
+# Módulos de la raíz (comun la agrega al path)
+import instrumentacion
+import registro
+from cache_respuestas import cache
+
+DIRECTORIO_RESULTADOS = os.path.join(RAIZ, 'benchmarks', 'resultados')
+BASE_BENCHMARK = 'benchmark_suite'
+
+# Tareas de fondo que ensuciarían el conteo de consultas y las latencias
+TAREAS_DESACTIVADAS = ('RESET_PROGRAMADO', 'PARTICIONES_PROGRAMADAS', 'LIBRO_PROGRAMADO', 'ARCHIVO_PROGRAMADO')
+
+
+# ---------------------------------------------------------------------------
+# PostgreSQL desechable
+# ---------------------------------------------------------------------------
+
+def _directorio_binarios():
+    if os.environ.get('PG_BIN'):
+        return os.environ['PG_BIN']
+    if shutil.which('pg_config'):
+        salida = subprocess.run(['pg_config', '--bindir'], capture_output=True, text=True)
+        if salida.returncode == 0 and os.path.exists(os.path.join(salida.stdout.strip(), 'initdb')):
+            return salida.stdout.strip()
+    initdb = shutil.which('initdb')
+    return os.path.dirname(initdb) if initdb else None
+
+
+class PostgresDesechable:
+    """Clúster temporal con initdb/pg_ctl; se detiene y se borra al salir."""
+
+    def __init__(self, directorio_binarios=None):
+        self.binarios = directorio_binarios or _directorio_binarios()
+        if not self.binarios:
+            raise RuntimeError('No se encontró initdb: instale PostgreSQL, defina PG_BIN o use --servidor')
+        if hasattr(os, 'geteuid') and os.geteuid() == 0:
+            raise RuntimeError('initdb no se puede ejecutar como root: use otro usuario o --servidor')
+
+    def _ejecutar(self, programa, *argumentos):
+        subprocess.run([os.path.join(self.binarios, programa), *argumentos], check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def __enter__(self):
+        self.directorio = tempfile.mkdtemp(prefix='bench_pg_')
+        self.datos = os.path.join(self.directorio, 'datos')
+        self._ejecutar('initdb', '-D', self.datos, '-U', 'postgres', '-A', 'trust', '-E', 'UTF8', '--no-sync')
+        opciones = (f"-k {self.directorio} -c listen_addresses='' -c max_connections=200 "
+                    "-c fsync=off -c synchronous_commit=off -c full_page_writes=off")
+        self._ejecutar('pg_ctl', '-D', self.datos, '-l', os.path.join(self.directorio, 'postgres.log'),
+                       '-o', opciones, '-w', 'start')
+        conn = psycopg2.connect(host=self.directorio, user='postgres', dbname='postgres')
+        conn.autocommit = True
+        conn.cursor().execute(f'CREATE DATABASE {BASE_BENCHMARK}')
+        conn.close()
+        os.environ['PGHOST'] = self.directorio
+        # La URL no distingue este clúster de otro servidor local: los
+        # contadores de cambios.py van en su propio directorio
+        os.environ['CAMBIOS_ARCHIVO'] = os.path.join(self.directorio, 'cambios.bin')
+        self.database_url = f'postgresql://postgres@/{BASE_BENCHMARK}'
+        return self
+
+    def __exit__(self, *_):
+        try:
+            self._ejecutar('pg_ctl', '-D', self.datos, '-m', 'immediate', 'stop')
+        finally:
+            shutil.rmtree(self.directorio, ignore_errors=True)
+
+
+class BaseTemporal:
+    """Base de datos temporal en un servidor existente (--servidor)."""
+
+    def __init__(self, servidor):
+        self.servidor = servidor
+        partes = urllib.parse.urlparse(servidor)
+        self.database_url = urllib.parse.urlunparse(partes._replace(path='/' + BASE_BENCHMARK))
+
+    def _admin(self, sql):
+        conn = psycopg2.connect(self.servidor)
+        conn.autocommit = True
+        try:
+            conn.cursor().execute(sql)
+        finally:
+            conn.close()
+
+    def __enter__(self):
+        self._admin(f'DROP DATABASE IF EXISTS {BASE_BENCHMARK} WITH (FORCE)')
+        self._admin(f'CREATE DATABASE {BASE_BENCHMARK}')
+        return self
+
+    def __exit__(self, *_):
+        self._admin(f'DROP DATABASE IF EXISTS {BASE_BENCHMARK} WITH (FORCE)')
+
+
+# ---------------------------------------------------------------------------
+# Datos
+# ---------------------------------------------------------------------------
+
+CATEGORIAS = ['Persona Natural', 'Gobernación', 'Grupo Empresarial', 'Alcaldía',
+              'Categorias y Subcategorias', 'Apoyos']
+
+# Siembra determinista (setseed) sobre el esquema base. `escala` 1 equivale a
+# 2000 clientes, 50000 retiros en el último año, 5000 agendamientos y un
+# libro de inventario de un año.
+SQL_SEMBRAR = '''
+    SELECT setseed(%(semilla)s);
+
+    INSERT INTO clientes (nombre, direccion, telefono, cedula, placa, categoria,
+                          litros_mes, litros_disponibles,
+                          litros_mes_gasolina, litros_disponibles_gasolina,
+                          litros_mes_gasoil, litros_disponibles_gasoil)
+    SELECT 'CLIENTE ' || g, 'DIRECCION ' || g, '0414' || lpad(g::text, 7, '0'),
+           'V' || (10000000 + g), 'PL' || lpad(g::text, 5, '0'),
+           (%(categorias)s::text[])[1 + g %% array_length(%(categorias)s::text[], 1)],
+           1000000, 1000000, 500000, 500000, 500000, 500000
+    FROM generate_series(1, %(clientes)s) g;
+
+    INSERT INTO subclientes (cliente_padre_id, nombre, cedula, placa,
+                             litros_mes_gasolina, litros_disponibles_gasolina,
+                             litros_mes_gasoil, litros_disponibles_gasoil)
+    SELECT 1 + (g %% GREATEST(%(clientes)s / 20, 1)), 'SUBCLIENTE ' || g, 'S' || g, 'SPL' || g, 100, 100, 50, 50
+    FROM generate_series(1, %(subclientes)s) g;
+
+    INSERT INTO retiros (cliente_id, fecha, hora, litros, usuario_id, tipo_combustible, codigo_ticket)
+    SELECT 1 + floor(random() * %(clientes)s)::int,
+           CURRENT_DATE - floor(random() * 365)::int,
+           TIME '06:00' + random() * INTERVAL '12 hours',
+           5 + floor(random() * 40), %(usuario_id)s,
+           CASE WHEN random() < 0.7 THEN 'gasolina' ELSE 'gasoil' END,
+           g
+    FROM generate_series(1, %(retiros)s) g;
+
+    -- Entregados en el pasado y pendientes para los próximos días
+    INSERT INTO agendamientos (cliente_id, tipo_combustible, litros, fecha_agendada, codigo_ticket, estado, fecha_creacion)
+    SELECT 1 + floor(random() * %(clientes)s)::int,
+           CASE WHEN random() < 0.8 THEN 'gasolina' ELSE 'gasoil' END,
+           5 + floor(random() * 20),
+           fecha, row_number() OVER (PARTITION BY fecha ORDER BY g),
+           CASE WHEN fecha < CURRENT_DATE THEN 'entregado' ELSE 'pendiente' END,
+           fecha - 1 + random() * INTERVAL '1 day'
+    FROM (SELECT g, CASE WHEN g %% 4 = 0 THEN CURRENT_DATE + 1 + g %% 30
+                         ELSE CURRENT_DATE - 1 - floor(random() * 180)::int END AS fecha
+          FROM generate_series(1, %(agendamientos)s) g) a;
+
+    -- Libro de inventario: una entrada diaria y las salidas de los agendamientos
+    INSERT INTO inventario (tipo_combustible, litros_ingresados, litros_disponibles, fecha_ingreso, usuario_id, observaciones)
+    SELECT tipo, litros, 1000000 + SUM(litros) OVER (PARTITION BY tipo ORDER BY fecha, orden),
+           fecha, %(usuario_id)s, observaciones
+    FROM (
+        SELECT t.tipo, 5000 AS litros, d + INTERVAL '5 hours' AS fecha, 0 AS orden, 'Entrada diaria' AS observaciones
+        FROM generate_series(CURRENT_DATE - 365, CURRENT_DATE - 1, INTERVAL '1 day') d,
+             (VALUES ('gasolina'), ('gasoil')) t(tipo)
+        UNION ALL
+        SELECT tipo_combustible, -litros, fecha_creacion, id, 'Agendamiento ' || id
+        FROM agendamientos
+    ) m
+    ORDER BY fecha, orden;
+'''
+
+
+def sembrar(escala, semilla):
+    """Aplica el esquema base, siembra los datos y aplica el resto de migraciones."""
+    import migraciones
+    from conexiones import parametros_conexion
+
+    inicio = time.perf_counter()
+    migraciones.aplicar(hasta=1)
+    migraciones.asegurar_admin()
+    conn = psycopg2.connect(**parametros_conexion())
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM usuarios WHERE usuario = 'admin'")
+        usuario_id = cursor.fetchone()['id']
+        cursor.execute(SQL_SEMBRAR, {
+            'semilla': semilla, 'categorias': CATEGORIAS, 'usuario_id': usuario_id,
+            'clientes': int(2000 * escala), 'subclientes': int(200 * escala),
+            'retiros': int(50000 * escala), 'agendamientos': int(5000 * escala),
+        })
+        conn.commit()
+    finally:
+        conn.close()
+    migraciones.aplicar()
+    conn = psycopg2.connect(**parametros_conexion())
+    conn.autocommit = True
+    conn.cursor().execute('VACUUM ANALYZE')
+    conn.close()
+    return time.perf_counter() - inicio
+
+
+class Contexto:
+    """Valores reales de la base sembrada que usan los escenarios."""
+
+    def __init__(self, cursor, modo):
+        self.modo = modo
+        self._lock = threading.Lock()
+        # Con cupo de los dos combustibles: los escenarios de escritura
+        # alternan gasolina y gasoil
+        cursor.execute('''
+            SELECT * FROM clientes
+            WHERE activo = TRUE AND litros_disponibles_gasolina >= 10 AND litros_disponibles_gasoil >= 10
+            ORDER BY id LIMIT 200
+        ''')
+        self.clientes = [dict(fila) for fila in cursor.fetchall()]
+        cursor.execute('''
+            SELECT DISTINCT s.cliente_padre_id AS id
+            FROM subclientes s JOIN clientes c ON c.id = s.cliente_padre_id AND c.activo
+            ORDER BY 1 LIMIT 50
+        ''')
+        self.padres = [fila['id'] for fila in cursor.fetchall()]
+        cursor.execute("SELECT id FROM agendamientos WHERE estado = 'pendiente' ORDER BY id")
+        self._pendientes = [fila['id'] for fila in cursor.fetchall()]
+        self.manana = (date.today() + timedelta(days=1)).isoformat()
+        self.hoy = date.today()
+
+    def cliente(self, i):
+        return self.clientes[i % len(self.clientes)]
+
+    def tomar_pendiente(self):
+        with self._lock:
+            return self._pendientes.pop() if self._pendientes else 0
+
+
+# ---------------------------------------------------------------------------
+# Escenarios
+# ---------------------------------------------------------------------------
+
+# `ruta(ctx, i)` arma la URL y `cuerpo(ctx, i)` el cuerpo JSON (o bytes con
+# su Content-Type). `maximo` limita las repeticiones de las rutas pesadas y
+# `concurrencia` fija la de las que no admiten peticiones simultáneas.
+Escenario = namedtuple('Escenario', 'nombre metodo regla ruta cuerpo autenticado maximo flujo tipo concurrencia',
+                       defaults=(None, True, None, False, None, None))
+
+
+def _fijo(ruta):
+    return lambda ctx, i: ruta
+
+
+def _csv_clientes(ctx, i):
+    filas = ['nombre,cedula,telefono,categoria,litros_mes_gasolina']
+    filas += [f'IMPORTADO {ctx.modo} {i}-{j},BULK-{ctx.modo}-{i}-{j},0412000{j:04d},Apoyos,50' for j in range(20)]
+    return ('\n'.join(filas) + '\n').encode()
+
+
+def _agendamiento(ctx, i):
+    return {'cliente_id': ctx.cliente(i)['id'], 'litros': 1, 'tipo_combustible': 'gasoil' if i % 2 else 'gasolina',
+            'fecha_agendada': (ctx.hoy + timedelta(days=1 + i % 60)).isoformat()}
+
+
+def _actualizacion(ctx, i):
+    cliente = dict(ctx.cliente(i))
+    return {clave: valor for clave, valor in cliente.items() if not isinstance(valor, (date, datetime))}
+
+
+LECTURAS = [
+    Escenario('raiz', 'GET', '/', _fijo('/'), autenticado=False),
+    Escenario('login', 'POST', '/api/login', _fijo('/api/login'), autenticado=False,
+              cuerpo=lambda ctx, i: {'usuario': 'admin', 'contrasena': ctx.password}),
+    Escenario('login_cliente', 'POST', '/api/clientes/login', _fijo('/api/clientes/login'), autenticado=False,
+              cuerpo=lambda ctx, i: {'cedula': ctx.cliente(i)['cedula']}),
+    Escenario('clientes', 'GET', '/api/clientes', _fijo('/api/clientes'), maximo=20),
+    Escenario('clientes_busqueda', 'GET', '/api/clientes',
+              lambda ctx, i: f"/api/clientes?busqueda=cliente {ctx.cliente(i)['id']}".replace(' ', '%20')),
+    Escenario('clientes_simple', 'GET', '/api/clientes/simple', _fijo('/api/clientes/simple'), autenticado=False),
+    Escenario('clientes_lista', 'GET', '/api/clientes/lista', _fijo('/api/clientes/lista'), maximo=20),
+    Escenario('cliente', 'GET', '/api/clientes/<int:cliente_id>',
+              lambda ctx, i: f"/api/clientes/{ctx.cliente(i)['id']}"),
+    Escenario('cliente_tickets', 'GET', '/api/clientes/<int:cliente_id>/tickets',
+              lambda ctx, i: f"/api/clientes/{ctx.cliente(i)['id']}/tickets"),
+    Escenario('subclientes', 'GET', '/api/clientes/<int:cliente_id>/subclientes',
+              lambda ctx, i: f"/api/clientes/{ctx.padres[i % len(ctx.padres)]}/subclientes"),
+    Escenario('cliente_telefono', 'GET', '/api/clientes/telefono/<telefono>',
+              lambda ctx, i: f"/api/clientes/telefono/{ctx.cliente(i)['telefono']}", autenticado=False),
+    Escenario('retiros_completo', 'GET', '/api/retiros', _fijo('/api/retiros'), maximo=5),
+    Escenario('retiros_pagina', 'GET', '/api/retiros', _fijo('/api/retiros?limit=50')),
+    Escenario('retiros_cliente_mes', 'GET', '/api/retiros',
+              lambda ctx, i: (f"/api/retiros?limit=50&cliente_id={ctx.cliente(i)['id']}"
+                              f"&fecha_inicio={ctx.hoy.replace(day=1)}&fecha_fin={ctx.hoy}")),
+    Escenario('estadisticas', 'GET', '/api/estadisticas', _fijo('/api/estadisticas')),
+    Escenario('estadisticas_retiros', 'GET', '/api/estadisticas/retiros', _fijo('/api/estadisticas/retiros')),
+    Escenario('agendamientos_dia', 'GET', '/api/agendamientos/dia/<fecha>',
+              lambda ctx, i: f'/api/agendamientos/dia/{ctx.manana}', autenticado=False),
+    Escenario('agendamientos_cliente', 'GET', '/api/agendamientos/cliente/<int:cliente_id>',
+              lambda ctx, i: f"/api/agendamientos/cliente/{ctx.cliente(i)['id']}", autenticado=False),
+    Escenario('limites', 'GET', '/api/sistema/limites', _fijo('/api/sistema/limites'), autenticado=False),
+    Escenario('bloqueo', 'GET', '/api/sistema/bloqueo', _fijo('/api/sistema/bloqueo')),
+    Escenario('pool', 'GET', '/api/sistema/pool', _fijo('/api/sistema/pool')),
+    Escenario('cache', 'GET', '/api/sistema/cache', _fijo('/api/sistema/cache')),
+    Escenario('eventos', 'GET', '/api/sistema/eventos', _fijo('/api/sistema/eventos')),
+    Escenario('modelo_clientes', 'GET', '/api/sistema/modelo-clientes', _fijo('/api/sistema/modelo-clientes')),
+    Escenario('arranque', 'GET', '/api/sistema/arranque', _fijo('/api/sistema/arranque')),
+    Escenario('metricas', 'GET', '/metrics', _fijo('/metrics'), autenticado=False),
+    Escenario('reset_diario_estado', 'GET', '/api/admin/reset-diario', _fijo('/api/admin/reset-diario')),
+    Escenario('inventario_estado', 'GET', '/api/inventario/estado', _fijo('/api/inventario/estado'),
+              autenticado=False),
+    Escenario('inventario', 'GET', '/api/inventario', _fijo('/api/inventario')),
+    Escenario('inventario_historial', 'GET', '/api/inventario/historial',
+              _fijo('/api/inventario/historial'), maximo=10),
+    Escenario('inventario_historial_pagina', 'GET', '/api/inventario/historial',
+              _fijo('/api/inventario/historial?limit=100')),
+    Escenario('inventario_historial_dias', 'GET', '/api/inventario/historial',
+              _fijo('/api/inventario/historial?granularity=day&limit=60')),
+    # Hasta el primer evento (conectado); la conexión se cierra después
+    Escenario('stream', 'GET', '/api/stream', _fijo('/api/stream'), flujo=True, maximo=50),
+    Escenario('export_retiros', 'GET', '/api/export/retiros', _fijo('/api/export/retiros'), maximo=5),
+    Escenario('export_inventario', 'GET', '/api/export/inventario', _fijo('/api/export/inventario'), maximo=5),
+]
+
+ESCRITURAS = [
+    Escenario('crear_cliente', 'POST', '/api/clientes', _fijo('/api/clientes'),
+              cuerpo=lambda ctx, i: {'nombre': f'NUEVO {ctx.modo} {i}', 'cedula': f'NUEVO-{ctx.modo}-{i}',
+                                     'telefono': '0416', 'litros_mes_gasolina': 100}),
+    Escenario('actualizar_cliente', 'PUT', '/api/clientes/<int:id>',
+              lambda ctx, i: f"/api/clientes/{ctx.cliente(i)['id']}", cuerpo=_actualizacion),
+    Escenario('crear_subcliente', 'POST', '/api/clientes/<int:cliente_id>/subclientes',
+              lambda ctx, i: f"/api/clientes/{ctx.padres[i % len(ctx.padres)]}/subclientes",
+              cuerpo=lambda ctx, i: {'nombre': f'SUB {ctx.modo} {i}', 'cedula': f'SUB-{ctx.modo}-{i}',
+                                     'litros_mes_gasolina': 0, 'litros_mes_gasoil': 0}),
+    Escenario('importar_clientes', 'POST', '/api/clientes/bulk', _fijo('/api/clientes/bulk?formato=csv'),
+              cuerpo=_csv_clientes, tipo='text/csv', maximo=50),
+    Escenario('crear_retiro', 'POST', '/api/retiros', _fijo('/api/retiros'),
+              cuerpo=lambda ctx, i: {'cliente_id': ctx.cliente(i)['id'], 'litros': 1,
+                                     'tipo_combustible': 'gasolina'}),
+    Escenario('crear_agendamiento', 'POST', '/api/agendamientos', _fijo('/api/agendamientos'), cuerpo=_agendamiento),
+    Escenario('entregar_agendamiento', 'PATCH', '/api/agendamientos/<int:agendamiento_id>/entregar',
+              lambda ctx, i: f'/api/agendamientos/{ctx.tomar_pendiente()}/entregar'),
+    Escenario('crear_inventario', 'POST', '/api/inventario', _fijo('/api/inventario'),
+              cuerpo=lambda ctx, i: {'tipo_combustible': 'gasolina', 'litros_ingresados': 100}),
+    Escenario('cambiar_bloqueo', 'POST', '/api/sistema/bloqueo', _fijo('/api/sistema/bloqueo'),
+              cuerpo=lambda ctx, i: {'bloqueado': False}),
+]
+
+# Afectan a todo el sistema (dejan el inventario en 0): se miden después de
+# las demás en todos los modos, pocas veces y de a una (el reset de litros
+# responde 409 si ya hay otro en curso).
+FINALES = [
+    Escenario('reset_litros', 'POST', '/api/admin/reset-litros', _fijo('/api/admin/reset-litros'),
+              maximo=3, concurrencia=1),
+    Escenario('reset_inventario', 'POST', '/api/inventario/reset', _fijo('/api/inventario/reset'),
+              maximo=3, concurrencia=1),
+]
+
+ESCENARIOS = LECTURAS + ESCRITURAS + FINALES
+
+# Máximo de consultas SQL de una petición con la caché de respuestas vacía
+# (ver instrumentacion.presupuesto). Pasarse, o repetir una misma consulta,
+# cuenta como error del escenario. Las rutas en 0 responden desde memoria
+# (modelo de clientes, métricas) o con conexiones propias.
+PRESUPUESTOS = {
+    'raiz': 0, 'login': 1, 'login_cliente': 1,
+    'clientes': 1, 'clientes_busqueda': 1, 'clientes_simple': 0, 'clientes_lista': 1,
+    'cliente': 0, 'cliente_tickets': 1, 'subclientes': 2, 'cliente_telefono': 0,
+    'retiros_completo': 1, 'retiros_pagina': 1, 'retiros_cliente_mes': 1,
+    'estadisticas': 2, 'estadisticas_retiros': 3,
+    'agendamientos_dia': 1, 'agendamientos_cliente': 1,
+    'limites': 1, 'bloqueo': 1, 'pool': 0, 'cache': 0, 'eventos': 0, 'modelo_clientes': 0,
+    'arranque': 0, 'metricas': 0, 'reset_diario_estado': 0,
+    'inventario_estado': 1, 'inventario': 1, 'inventario_historial': 1,
+    'inventario_historial_pagina': 1, 'inventario_historial_dias': 1,
+    'stream': 0, 'export_retiros': 1, 'export_inventario': 1,
+    'crear_cliente': 1, 'actualizar_cliente': 1, 'crear_subcliente': 3, 'importar_clientes': 3,
+    'crear_retiro': 1, 'crear_agendamiento': 7, 'entregar_agendamiento': 2,
+    'crear_inventario': 1, 'cambiar_bloqueo': 2,
+    'reset_litros': 0, 'reset_inventario': 2,
+}
+
+
+def rutas_sin_escenario(app):
+    cubiertas = {(e.regla, e.metodo) for e in ESCENARIOS}
+    faltan = []
+    for regla in app.url_map.iter_rules():
+        if regla.endpoint == 'static':
+            continue
+        for metodo in sorted(regla.methods - {'HEAD', 'OPTIONS'}):
+            if (regla.rule, metodo) not in cubiertas:
+                faltan.append(f'{metodo} {regla.rule}')
+    return faltan
+
+
+# ---------------------------------------------------------------------------
+# Conteo de consultas
+# ---------------------------------------------------------------------------
+
+class ContadorConsultas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.total = 0
+
+    def sumar(self):
+        with self._lock:
+            self.total += 1
+
+    def reiniciar(self):
+        with self._lock:
+            self.total = 0
+
+
+contador = ContadorConsultas()
+
+
+def cursor_contado(base):
+    """Subclase del cursor del pool que cuenta las sentencias enviadas a PostgreSQL."""
+
+    class CursorContado(base):
+        def execute(self, query, vars=None):
+            contador.sumar()
+            return super().execute(query, vars)
+
+        def executemany(self, query, vars_list):
+            contador.sumar()
+            return super().executemany(query, vars_list)
+
+        def copy_expert(self, sql, file, size=8192):
+            contador.sumar()
+            return super().copy_expert(sql, file, size)
+
+    return CursorContado
+
+
+def instalar_contador(server):
+    """
+    Los cursores del pool de server.py pasan a contar sentencias. Las
+    consultas de conexiones propias (reset_diario, LISTEN de eventos y del
+    modelo de clientes) no se cuentan.
+    """
+    server.envolver_cursores(cursor_contado)
+    server.obtener_pool().cerrar()
+
+
+# ---------------------------------------------------------------------------
+# Ejecutores: cliente de pruebas de Flask y HTTP
+# ---------------------------------------------------------------------------
+
+def _preparar(escenario, ctx, i, headers):
+    ruta = escenario.ruta(ctx, i)
+    cabeceras = dict(headers) if escenario.autenticado else {}
+    datos = None
+    if escenario.cuerpo:
+        cuerpo = escenario.cuerpo(ctx, i)
+        if isinstance(cuerpo, bytes):
+            datos = cuerpo
+            cabeceras['Content-Type'] = escenario.tipo
+        else:
+            datos = json.dumps(cuerpo).encode()
+            cabeceras['Content-Type'] = 'application/json'
+    return ruta, cabeceras, datos
+
+
+class EjecutorFlask:
+    modo = 'flask'
+
+    def __init__(self, app):
+        self.cliente = app.test_client()
+
+    def __call__(self, escenario, ctx, i, headers):
+        ruta, cabeceras, datos = _preparar(escenario, ctx, i, headers)
+        respuesta = self.cliente.open(ruta, method=escenario.metodo, headers=cabeceras, data=datos,
+                                      buffered=not escenario.flujo)
+        try:
+            if escenario.flujo:
+                next(iter(respuesta.response))
+            else:
+                respuesta.get_data()
+        finally:
+            respuesta.close()
+        return respuesta.status_code
+
+
+class EjecutorHTTP:
+    """Servidor werkzeug con hilos en este mismo proceso; una conexión keep-alive por hilo cliente."""
+    modo = 'http'
+
+    def __init__(self, app):
+        from werkzeug.serving import WSGIRequestHandler, make_server
+        WSGIRequestHandler.protocol_version = 'HTTP/1.1'
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)   # sin una línea por petición
+        self.servidor = make_server('127.0.0.1', 0, app, threaded=True)
+        self.puerto = self.servidor.server_port
+        self.hilo = threading.Thread(target=self.servidor.serve_forever, daemon=True)
+        self.hilo.start()
+        self.local = threading.local()
+
+    def _conexion(self, nueva=False):
+        if nueva or getattr(self.local, 'conexion', None) is None:
+            self.local.conexion = http.client.HTTPConnection('127.0.0.1', self.puerto, timeout=120)
+        return self.local.conexion
+
+    def __call__(self, escenario, ctx, i, headers):
+        ruta, cabeceras, datos = _preparar(escenario, ctx, i, headers)
+        if escenario.flujo:
+            conexion = self._conexion(nueva=True)
+            conexion.request(escenario.metodo, ruta, body=datos, headers=cabeceras)
+            respuesta = conexion.getresponse()
+            while respuesta.readline() not in (b'\n', b'\r\n', b''):
+                pass
+            conexion.close()
+            self.local.conexion = None
+            return respuesta.status
+        conexion = self._conexion()
+        try:
+            conexion.request(escenario.metodo, ruta, body=datos, headers=cabeceras)
+            respuesta = conexion.getresponse()
+        except (http.client.HTTPException, ConnectionError):
+            conexion = self._conexion(nueva=True)
+            conexion.request(escenario.metodo, ruta, body=datos, headers=cabeceras)
+            respuesta = conexion.getresponse()
+        respuesta.read()
+        return respuesta.status
+
+    def cerrar(self):
+        self.servidor.shutdown()
+
+
+# ---------------------------------------------------------------------------
+# Medición
+# ---------------------------------------------------------------------------
+
+def medir(escenario, ejecutor, ctx, headers, peticiones, concurrencia):
+    total = min(peticiones, escenario.maximo or peticiones)
+    concurrencia = min(escenario.concurrencia or concurrencia, total)
+    estados = Counter()
+    lock = threading.Lock()
+
+    def una(i):
+        estado = ejecutor(escenario, ctx, i, headers)
+        with lock:
+            estados[estado] += 1
+        if estado >= 500:
+            raise RuntimeError(f'{escenario.nombre}: HTTP {estado}')
+
+    # Presupuesto de consultas, con la caché de respuestas vacía
+    maximo = PRESUPUESTOS.get(escenario.nombre)
+    excedido = None
+    if maximo is not None:
+        cache.limpiar()
+        try:
+            with instrumentacion.presupuesto(consultas=maximo, repetidas=1):
+                ejecutor(escenario, ctx, total + 1, headers)
+        except AssertionError as e:
+            excedido = str(e)
+            print(f"   ⚠️ {escenario.nombre}: {excedido}")
+
+    # Una petición de calentamiento (cachés, planes, conexiones del pool)
+    ejecutor(escenario, ctx, total, headers)
+    contador.reiniciar()
+    segundos, latencias, errores = ejecutar_concurrente(una, concurrencia, total)
+    latencias_ms = [latencia * 1000 for latencia in latencias]
+    return {
+        'nombre': escenario.nombre,
+        'metodo': escenario.metodo,
+        'ruta': escenario.regla,
+        'modo': ejecutor.modo,
+        'peticiones': total,
+        'concurrencia': concurrencia,
+        'segundos': round(segundos, 4),
+        'peticiones_por_segundo': round(total / segundos, 1) if segundos else None,
+        'p50_ms': round(percentil(latencias_ms, 50), 3),
+        'p95_ms': round(percentil(latencias_ms, 95), 3),
+        'p99_ms': round(percentil(latencias_ms, 99), 3),
+        'max_ms': round(max(latencias_ms), 3) if latencias_ms else 0,
+        'consultas_por_peticion': round(contador.total / total, 2),
+        'estados': {str(estado): n for estado, n in sorted(estados.items())},
+        'errores': len(errores) + (1 if excedido else 0),
+        'presupuesto': maximo,
+        'presupuesto_excedido': excedido,
+    }
+
+
+def imprimir(resultado):
+    print(f"   {resultado['nombre']:<30} {resultado['peticiones']:>5} req "
+          f"{resultado['peticiones_por_segundo'] or 0:>9.1f} req/s  "
+          f"p50 {resultado['p50_ms']:>8.2f}  p95 {resultado['p95_ms']:>8.2f}  p99 {resultado['p99_ms']:>8.2f} ms  "
+          f"{resultado['consultas_por_peticion']:>6.2f} consultas  {resultado['estados']}"
+          + (f"  ⚠️ {resultado['errores']} errores" if resultado['errores'] else ''))
+
+
+def metadatos(cursor, args, segundos_siembra):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    cursor.execute('SHOW server_version')
+    version = cursor.fetchone()['server_version']
+    tablas = {}
+    for tabla in ('clientes', 'subclientes', 'retiros', 'agendamientos', 'inventario'):
+        cursor.execute(f'SELECT COUNT(*) AS filas FROM {tabla}')
+        tablas[tabla] = cursor.fetchone()['filas']
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'postgres': version,
+        'plataforma': platform.platform(),
+        'escala': args.escala,
+        'semilla': args.semilla,
+        'generador': args.generador,
+        'peticiones': args.peticiones,
+        'concurrencia': args.concurrencia,
+        'filas': tablas,
+        'segundos_siembra': round(segundos_siembra, 2),
+    }
+
+
+def ejecutar_suite(args, database_url):
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['DB_POOL_MAX'] = str(max(args.concurrencia + 2, 5))
+    os.environ.setdefault('ARCHIVO_DIR', tempfile.mkdtemp(prefix='bench_archivo_'))
+    for variable in TAREAS_DESACTIVADAS:
+        os.environ[variable] = '0'
+
+    print(f"🌱 Sembrando escala {args.escala} (semilla {args.semilla})...")
+    if args.generador:
+        inicio = time.perf_counter()
+        generar_datos.poblar(args.escala, args.semilla)
+        segundos_siembra = time.perf_counter() - inicio
+    else:
+        segundos_siembra = sembrar(args.escala, args.semilla)
+    print(f"   listo en {segundos_siembra:.1f}s")
+
+    import migraciones
+    import server
+    instalar_contador(server)
+    app = server.app
+    # La primera conexión verifica el esquema; se hace antes de medir para
+    # que no cuente en el presupuesto del primer escenario
+    with app.app_context():
+        server.get_db()
+
+    faltan = rutas_sin_escenario(app)
+    if faltan:
+        print(f"⚠️ Rutas sin escenario: {', '.join(faltan)}")
+
+    from conexiones import parametros_conexion
+    conn = psycopg2.connect(**parametros_conexion())
+    conn.autocommit = True
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM usuarios WHERE usuario = 'admin'")
+    headers = token_admin(app, cursor.fetchone()['id'])
+    resultado = {'metadatos': metadatos(cursor, args, segundos_siembra), 'resultados': []}
+
+    solo = set(args.solo.split(',')) if args.solo else None
+    modos = ('flask', 'http') if args.modo == 'ambos' else (args.modo,)
+    ejecutores = {}
+    try:
+        for grupo in (LECTURAS + ESCRITURAS, FINALES):
+            escenarios = [e for e in grupo if not solo or e.nombre in solo]
+            for modo in modos if escenarios else ():
+                if modo not in ejecutores:
+                    ejecutores[modo] = EjecutorFlask(app) if modo == 'flask' else EjecutorHTTP(app)
+                ctx = Contexto(cursor, modo)
+                ctx.password = os.environ.get('ADMIN_PASSWORD', migraciones.ADMIN_PASSWORD_DEFECTO)
+                print(f"\n📊 Modo {modo} ({args.peticiones} peticiones, concurrencia {args.concurrencia})")
+                for escenario in escenarios:
+                    medicion = medir(escenario, ejecutores[modo], ctx, headers, args.peticiones, args.concurrencia)
+                    resultado['resultados'].append(medicion)
+                    imprimir(medicion)
+    finally:
+        if 'http' in ejecutores:
+            ejecutores['http'].cerrar()
+    conn.close()
+    server.obtener_pool().cerrar()
+    return resultado
+
+
+def comparar(ruta_antes, ruta_despues):
+    with open(ruta_antes, encoding='utf-8') as f:
+        antes = {(r['modo'], r['nombre']): r for r in json.load(f)['resultados']}
+    with open(ruta_despues, encoding='utf-8') as f:
+        despues = json.load(f)['resultados']
+
+    def cambio(a, b):
+        return f"{(b - a) / a * 100:+7.1f}%" if a else '      -'
+
+    print(f"{'modo':<6} {'escenario':<30} {'p50 ms':>18} {'p95 ms':>18} {'req/s':>18} {'consultas':>12}")
+    for r in despues:
+        a = antes.get((r['modo'], r['nombre']))
+        if not a:
+            print(f"{r['modo']:<6} {r['nombre']:<30} (nuevo)")
+            continue
+        print(f"{r['modo']:<6} {r['nombre']:<30} "
+              f"{r['p50_ms']:>9.2f} {cambio(a['p50_ms'], r['p50_ms'])} "
+              f"{r['p95_ms']:>9.2f} {cambio(a['p95_ms'], r['p95_ms'])} "
+              f"{r['peticiones_por_segundo'] or 0:>9.1f} "
+              f"{cambio(a['peticiones_por_segundo'] or 0, r['peticiones_por_segundo'] or 0)} "
+              f"{a['consultas_por_peticion']:>5.1f}→{r['consultas_por_peticion']:<5.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--escala', type=float, default=1.0, help='1 = 2000 clientes y 50000 retiros')
+    parser.add_argument('--semilla', type=float, default=0.42, help='semilla de la siembra (entre -1 y 1)')
+    parser.add_argument('--peticiones', type=int, default=200, help='peticiones por escenario')
+    parser.add_argument('--concurrencia', type=int, default=8)
+    parser.add_argument('--modo', choices=('flask', 'http', 'ambos'), default='ambos')
+    parser.add_argument('--solo', help='escenarios a medir, separados por comas')
+    parser.add_argument('--generador', action='store_true',
+                        help='datos realistas de generar_datos.py (escala 1 = producción) en lugar de la siembra simple')
+    parser.add_argument('--servidor', help='URL de un PostgreSQL existente en lugar del desechable')
+    parser.add_argument('--salida', help='archivo JSON de resultados (defecto benchmarks/resultados/<fecha>.json)')
+    parser.add_argument('--comparar', nargs=2, metavar=('ANTES', 'DESPUES'), help='comparar dos resultados')
+    args = parser.parse_args()
+    registro.configurar(formato='texto')
+
+    if args.comparar:
+        comparar(*args.comparar)
+        return
+
+    try:
+        entorno = BaseTemporal(args.servidor) if args.servidor else PostgresDesechable()
+    except RuntimeError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    salida = args.salida or os.path.join(DIRECTORIO_RESULTADOS, f"{datetime.now():%Y%m%d_%H%M%S}.json")
+    with entorno:
+        resultado = ejecutar_suite(args, entorno.database_url)
+        os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+        with open(salida, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, indent=1, ensure_ascii=False)
+    errores = sum(r['errores'] for r in resultado['resultados'])
+    print(f"\n{'✅' if not errores else '⚠️'} Resultados en {salida}" + (f" ({errores} errores)" if errores else ''))
+
+
+if __name__ == '__main__':
+    main()
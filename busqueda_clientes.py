@@ -0,0 +1,80 @@
+"""
+Búsqueda de clientes para GET /api/clientes?busqueda=...
+
+Los pisteros buscan por nombre, cédula, placa o teléfono varias veces por
+minuto. La consulta usa el índice GIN de texto completo de
+clientes_busqueda (clientes activos, mantenida por triggers; ver
+migrations/0007_busqueda_clientes.sql) en lugar de LIKE con comodín
+inicial, que recorría la tabla completa.
+
+Cada palabra del término se busca por prefijo ('jua pe' encuentra
+'JUAN PÉREZ'), sin distinguir mayúsculas ni acentos. Las cédulas, placas y
+teléfonos se comparan sin separadores: 'v12345', 'V-12.345' y '12345'
+encuentran 'V-12.345.678'. Los resultados se ordenan por relevancia: primero
+las coincidencias exactas de cédula, placa o teléfono (el término completo,
+sin separadores, es una palabra del documento), luego las que tienen
+todas las palabras completas ('jose' antes que 'josefina'), luego por
+ts_rank y por nombre.
+"""
+
+import re
+import unicodedata
+
+LIMITE_DEFECTO = 50
+LIMITE_MAXIMO = 500
+MAX_PALABRAS = 8
+
+SQL_BUSCAR = '''
+    SELECT c.*
+    FROM (
+        SELECT b.cliente_id, b.nombre,
+               b.documento @@ to_tsquery('simple', %(compacto)s) AS identificador,
+               b.documento @@ to_tsquery('simple', %(exacta)s) AS completa,
+               ts_rank(b.documento, q) AS rango
+        FROM clientes_busqueda b, to_tsquery('simple', %(consulta)s) q
+        WHERE b.documento @@ q
+        ORDER BY identificador DESC, completa DESC, rango DESC, b.nombre ASC
+        LIMIT %(limite)s
+    ) r
+    JOIN clientes c ON c.id = r.cliente_id
+    WHERE c.activo = TRUE
+    ORDER BY r.identificador DESC, r.completa DESC, r.rango DESC, r.nombre ASC
+'''
+
+
+def normalizar(texto):
+    """Minúsculas sin acentos, igual que busqueda_normalizar() en SQL."""
+    descompuesto = unicodedata.normalize('NFKD', texto.lower())
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def preparar(busqueda):
+    """
+    Devuelve (consulta_prefijos, consulta_exacta, compacto) o None si el
+    término no tiene letras ni dígitos. Las palabras sólo contienen
+    [a-z0-9], así que las consultas tsquery no necesitan escapes.
+    """
+    palabras = re.findall(r'[a-z0-9]+', normalizar(busqueda))[:MAX_PALABRAS]
+    if not palabras:
+        return None
+    compacto = ''.join(palabras)
+    exacta = ' & '.join(palabras)
+    consulta = ' & '.join(f'{p}:*' for p in palabras)
+    if len(palabras) > 1:
+        # 'V-12.345' son dos palabras; también se busca el identificador unido
+        consulta = f'({consulta}) | {compacto}:*'
+    return consulta, exacta, compacto
+
+
+def buscar(cursor, busqueda, limite=LIMITE_DEFECTO):
+    preparada = preparar(busqueda)
+    if preparada is None:
+        return []
+    consulta, exacta, compacto = preparada
+    cursor.execute(SQL_BUSCAR, {
+        'consulta': consulta,
+        'exacta': exacta,
+        'compacto': compacto,
+        'limite': max(1, min(limite, LIMITE_MAXIMO)),
+    })
+    return [dict(fila) for fila in cursor.fetchall()]
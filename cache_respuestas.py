@@ -0,0 +1,186 @@
+"""
+Caché de respuestas para rutas de lectura muy consultadas.
+
+Cada entrada guarda el cuerpo ya serializado junto con las versiones de las
+tablas de las que depende (ver cambios.py). Una entrada se descarta cuando
+alguna de esas tablas cambió, cuando vence su TTL o cuando sale por LRU.
+
+Las versiones avanzan con las escrituras de este host al instante y con
+las de cualquier otro proceso (scripts, psql, otra instancia) en cuanto
+llega su aviso de la base, normalmente milisegundos después del commit.
+Si la escucha de avisos está caída no se usa la caché ni el ETag, así que
+una respuesta nunca queda vieja por más que ese retraso; CACHE_TTL_SEG es
+un límite adicional, no la garantía de frescura.
+
+Las mismas versiones sirven para GET condicional (`con_etag`): el ETag se
+calcula sin tocar la base de datos y, si el cliente ya tiene esa versión,
+se responde 304 antes de ejecutar la consulta.
+
+Variables de entorno:
+    CACHE_TTL_SEG     Vida máxima de una entrada (defecto 30)
+    CACHE_CAPACIDAD   Entradas por proceso antes de expulsar por LRU (defecto 256)
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, request
+from werkzeug.http import http_date
+
+from cambios import al_dia, obtener_cambios
+
+log = logging.getLogger(__name__)
+
+
+class CacheRespuestas:
+    def __init__(self, capacidad=256, ttl=30):
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self._entradas = OrderedDict()   # clave -> (versiones, expira, valor)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidadas = 0
+        self.expiradas = 0
+        self.expulsadas = 0
+
+    def obtener(self, clave, versiones):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            versiones_guardadas, expira, valor = entrada
+            if versiones_guardadas != versiones:
+                del self._entradas[clave]
+                self.invalidadas += 1
+                self.fallos += 1
+                return None
+            if expira < time.monotonic():
+                del self._entradas[clave]
+                self.expiradas += 1
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def guardar(self, clave, versiones, valor, ttl=None):
+        expira = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entradas[clave] = (versiones, expira, valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.capacidad:
+                self._entradas.popitem(last=False)
+                self.expulsadas += 1
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'pid': os.getpid(),
+                'entradas': len(self._entradas),
+                'capacidad': self.capacidad,
+                'ttl_seg': self.ttl,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': round(self.aciertos / consultas, 4) if consultas else 0,
+                'invalidadas': self.invalidadas,
+                'expiradas': self.expiradas,
+                'expulsadas': self.expulsadas,
+            }
+
+
+cache = CacheRespuestas(
+    capacidad=int(os.environ.get('CACHE_CAPACIDAD', 256)),
+    ttl=float(os.environ.get('CACHE_TTL_SEG', 30)),
+)
+
+
+def cacheada(*tablas, ttl=None, clave_extra=None):
+    """
+    Decorador para rutas GET cuya respuesta sólo depende de `tablas`, de la
+    ruta y de sus parámetros. `clave_extra` es una función opcional que
+    aporta más datos a la clave (p. ej. la fecha actual). Sólo se guardan
+    respuestas 200.
+    """
+    def decorador(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            clave = (request.endpoint, request.path, tuple(sorted(request.args.items(multi=True))))
+            if clave_extra is not None:
+                clave += (clave_extra(),)
+
+            try:
+                if not al_dia():
+                    return f(*args, **kwargs)
+                versiones = obtener_cambios().versiones(*tablas)
+            except Exception as e:
+                log.warning("⚠️ Caché deshabilitada para %s: %s", request.endpoint, e)
+                return f(*args, **kwargs)
+
+            guardada = cache.obtener(clave, versiones)
+            if guardada is not None:
+                cuerpo, mimetype = guardada
+                respuesta = Response(cuerpo, mimetype=mimetype)
+                respuesta.headers['X-Cache'] = 'HIT'
+                return respuesta
+
+            respuesta = f(*args, **kwargs)
+            if isinstance(respuesta, Response) and respuesta.status_code == 200 and not respuesta.is_streamed:
+                cache.guardar(clave, versiones, (respuesta.get_data(), respuesta.mimetype), ttl=ttl)
+                respuesta.headers['X-Cache'] = 'MISS'
+            return respuesta
+        return decorated
+    return decorador
+
+
+def con_etag(*tablas):
+    """
+    Decorador para rutas GET de listas: agrega ETag y Last-Modified a partir
+    de las versiones de `tablas` y responde 304 si el ETag de If-None-Match
+    sigue vigente, sin ejecutar la ruta. Mientras no hay escucha de avisos
+    de la base (`cambios.al_dia()`), responde sin ETag.
+    """
+    def decorador(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            try:
+                if not al_dia():
+                    return f(*args, **kwargs)
+                cambios = obtener_cambios()
+                versiones = cambios.versiones(*tablas)
+                ultimo_cambio = cambios.ultimo_cambio(*tablas)
+            except Exception as e:
+                log.warning("⚠️ ETag deshabilitado para %s: %s", request.endpoint, e)
+                return f(*args, **kwargs)
+
+            # La URL completa entra en el ETag: /dia/<fecha> y los parámetros
+            # de consulta son representaciones distintas
+            base = repr((request.full_path, versiones)).encode()
+            etag = hashlib.sha1(base).hexdigest()[:20]
+
+            if request.if_none_match.contains_weak(etag):
+                respuesta = Response(status=304)
+            else:
+                respuesta = f(*args, **kwargs)
+                if not isinstance(respuesta, Response) or respuesta.status_code != 200:
+                    return respuesta
+
+            respuesta.set_etag(etag, weak=True)
+            if ultimo_cambio is not None:
+                respuesta.headers['Last-Modified'] = http_date(ultimo_cambio)
+            # El navegador puede guardar la lista pero debe revalidarla siempre
+            respuesta.headers['Cache-Control'] = 'private, no-cache'
+            return respuesta
+        return decorated
+    return decorador
@@ -0,0 +1,254 @@
+"""
+Contadores de cambios por tabla compartidos entre los workers de gunicorn.
+
+Cada escritura confirmada incrementa el contador de las tablas que tocó
+(`marcar`). Los contadores viven en un archivo mapeado en memoria, de modo
+que todos los procesos del mismo host ven el mismo valor al instante y
+leerlo no requiere ir a la base de datos. La caché de respuestas y los
+ETag usan estas versiones para saber si un resultado sigue vigente.
+
+Las escrituras que no pasan por el servidor (scripts de mantenimiento,
+psql, cron, otra instancia) también cuentan: un trigger por sentencia en
+cada tabla publica su nombre en el canal 'cambios_tablas' (migración
+0014) y cada worker mantiene una conexión en LISTEN que marca la tabla al
+recibir el aviso, que PostgreSQL sólo entrega tras el commit. Mientras esa
+escucha no está activa, `al_dia()` devuelve False y quien cachea debe ir a
+la base de datos; al reconectar se marcan todas las tablas, porque los
+avisos de ese intervalo se perdieron.
+
+Variables de entorno:
+    CAMBIOS_ARCHIVO  Ruta del archivo compartido (por defecto en el
+                     directorio temporal, uno por DATABASE_URL)
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import random
+import select
+import struct
+import tempfile
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+from conexiones import parametros_conexion
+
+try:
+    import fcntl
+except ImportError:  # Windows: sólo hay un proceso en desarrollo
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+# El orden es parte del formato del archivo: agregar tablas sólo al final.
+TABLAS = (
+    'clientes',
+    'subclientes',
+    'retiros',
+    'agendamientos',
+    'inventario',
+    'limites_diarios',
+    'sistema_config',
+    'usuarios',
+)
+
+CANAL = 'cambios_tablas'
+
+_MAGICO = b'DGCAMB01'
+_MAX_TABLAS = 64
+_CABECERA = struct.Struct('<8sQ')   # mágico, época del archivo
+_RANURA = struct.Struct('<Qd')      # contador, instante del último cambio
+_TAMANO = _CABECERA.size + _RANURA.size * _MAX_TABLAS
+
+_INDICES = {tabla: i for i, tabla in enumerate(TABLAS)}
+
+
+def _ruta_por_defecto():
+    base = os.environ.get('DATABASE_URL', '')
+    sufijo = hashlib.sha1(base.encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f'despacho_gas_cambios_{sufijo}.bin')
+
+
+class Cambios:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._fd = os.open(ruta, os.O_RDWR | os.O_CREAT, 0o600)
+        self._bloquear(exclusivo=True)
+        try:
+            if os.fstat(self._fd).st_size < _TAMANO:
+                # Archivo nuevo: una época aleatoria distingue sus contadores
+                # de los de un archivo anterior (p. ej. tras reiniciar el host)
+                epoca = random.SystemRandom().getrandbits(63)
+                os.ftruncate(self._fd, _TAMANO)
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                os.write(self._fd, _CABECERA.pack(_MAGICO, epoca))
+            self._mapa = mmap.mmap(self._fd, _TAMANO)
+        finally:
+            self._desbloquear()
+        magico, self.epoca = _CABECERA.unpack_from(self._mapa, 0)
+        if magico != _MAGICO:
+            raise RuntimeError(f"Archivo de cambios inválido: {ruta}")
+
+    def _bloquear(self, exclusivo):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX if exclusivo else fcntl.LOCK_SH)
+
+    def _desbloquear(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _desplazamiento(tabla):
+        return _CABECERA.size + _RANURA.size * _INDICES[tabla]
+
+    def marcar(self, *tablas):
+        """Registra que `tablas` cambiaron (llamar después del commit)."""
+        ahora = time.time()
+        with self._lock:
+            self._bloquear(exclusivo=True)
+            try:
+                for tabla in tablas:
+                    desplazamiento = self._desplazamiento(tabla)
+                    contador, _ = _RANURA.unpack_from(self._mapa, desplazamiento)
+                    _RANURA.pack_into(self._mapa, desplazamiento, contador + 1, ahora)
+            finally:
+                self._desbloquear()
+
+    def leer(self, *tablas):
+        """Devuelve [(contador, instante_ultimo_cambio)] para cada tabla."""
+        with self._lock:
+            self._bloquear(exclusivo=False)
+            try:
+                return [_RANURA.unpack_from(self._mapa, self._desplazamiento(t)) for t in tablas]
+            finally:
+                self._desbloquear()
+
+    def versiones(self, *tablas):
+        """Tupla de contadores; cambia cada vez que alguna de las tablas cambia."""
+        return (self.epoca,) + tuple(contador for contador, _ in self.leer(*tablas))
+
+    def ultimo_cambio(self, *tablas):
+        """Instante (epoch) del cambio más reciente entre `tablas`, o None."""
+        instantes = [instante for _, instante in self.leer(*tablas) if instante]
+        return max(instantes) if instantes else None
+
+
+class Escucha:
+    """Conexión en LISTEN que lleva a los contadores los avisos de la base."""
+
+    def __init__(self, cambios, canal=CANAL):
+        self.cambios = cambios
+        self.canal = canal
+        self.conectado = threading.Event()
+        self._hilo = None
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.avisos_recibidos = 0
+        self.reconexiones = 0
+
+    def asegurar(self):
+        # El hilo no sobrevive al fork: cada proceso arranca el suyo
+        if self._pid != os.getpid():
+            self._lock = threading.Lock()
+            self.conectado = threading.Event()
+            self._hilo = None
+            self._pid = os.getpid()
+        if self._hilo is None or not self._hilo.is_alive():
+            with self._lock:
+                if self._hilo is None or not self._hilo.is_alive():
+                    self._hilo = threading.Thread(target=self._escuchar, name='cambios-listen', daemon=True)
+                    self._hilo.start()
+
+    def _escuchar(self):
+        espera = 1
+        primera = True
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**parametros_conexion())
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                conn.cursor().execute(f'LISTEN {self.canal}')
+                # Lo cacheado antes de escuchar pudo perderse avisos
+                self.cambios.marcar(*TABLAS)
+                if not primera:
+                    self.reconexiones += 1
+                primera = False
+                espera = 1
+                self.conectado.set()
+                log.info("📡 Escuchando cambios de tablas en '%s'", self.canal)
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        conn.cursor().execute('SELECT 1')
+                    conn.poll()
+                    tablas = set()
+                    while conn.notifies:
+                        tablas.add(conn.notifies.pop(0).payload)
+                    tablas &= _INDICES.keys()
+                    if tablas:
+                        self.avisos_recibidos += len(tablas)
+                        self.cambios.marcar(*tablas)
+            except Exception as e:
+                self.conectado.clear()
+                log.warning("⚠️ Escucha de cambios interrumpida: %s. Reintentando en %ss", e, espera)
+                time.sleep(espera)
+                espera = min(espera * 2, 30)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+
+_cambios = None
+_cambios_lock = threading.Lock()
+_escucha = None
+
+
+def obtener_cambios():
+    global _cambios
+    if _cambios is None:
+        with _cambios_lock:
+            if _cambios is None:
+                _cambios = Cambios(os.environ.get('CAMBIOS_ARCHIVO') or _ruta_por_defecto())
+    return _cambios
+
+
+def al_dia():
+    """
+    True si los contadores reflejan también las escrituras hechas fuera de
+    este host; arranca la escucha la primera vez. Con False, la caché y los
+    ETag deben ignorarse.
+    """
+    global _escucha
+    if _escucha is None:
+        cambios = obtener_cambios()
+        with _cambios_lock:
+            if _escucha is None:
+                _escucha = Escucha(cambios)
+    _escucha.asegurar()
+    return _escucha.conectado.is_set()
+
+
+def marcar(*tablas):
+    """Atajo para registrar cambios; un fallo aquí nunca debe tumbar la petición."""
+    try:
+        obtener_cambios().marcar(*tablas)
+    except Exception as e:
+        log.warning("⚠️ No se pudo registrar el cambio en %s: %s", tablas, e)
+
+
+def _despues_de_fork():
+    global _cambios_lock
+    _cambios_lock = threading.Lock()
+    if _cambios is not None:
+        _cambios._lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_despues_de_fork)
@@ -0,0 +1,303 @@
+"""
+Pool de conexiones PostgreSQL compartido por todo el proceso.
+
+Cada worker de gunicorn mantiene su propio pool: las conexiones se abren
+bajo demanda (hasta DB_POOL_MAX), se verifican al entregarlas y se
+reutilizan entre peticiones en lugar de abrir una conexión TCP/TLS nueva
+por cada request.
+
+Variables de entorno:
+    DATABASE_URL           URL de conexión (obligatoria)
+    DB_POOL_MIN            Conexiones que se abren en el primer uso (defecto 1)
+    DB_POOL_MAX            Máximo de conexiones abiertas por proceso (defecto 5)
+    DB_POOL_TIMEOUT        Segundos que se espera por una conexión libre (defecto 30)
+    DB_POOL_VERIFICAR_SEG  Segundos de inactividad tras los cuales se hace
+                           un SELECT 1 antes de entregar la conexión (defecto 30)
+"""
+
+import os
+import threading
+import time
+import urllib.parse
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+
+
+class PoolAgotado(Exception):
+    """No se obtuvo una conexión libre dentro del tiempo de espera."""
+
+
+def parametros_conexion(database_url=None):
+    """Convierte DATABASE_URL en los argumentos de psycopg2.connect."""
+    database_url = database_url or os.environ.get('DATABASE_URL')
+    if not database_url:
+        raise Exception("DATABASE_URL no está configurada")
+
+    result = urllib.parse.urlparse(database_url)
+    return {
+        'database': result.path[1:],
+        'user': result.username,
+        'password': result.password,
+        'host': result.hostname,
+        'port': result.port,
+        'cursor_factory': psycopg2.extras.RealDictCursor,
+    }
+
+
+def _entero_env(nombre, defecto):
+    try:
+        return int(os.environ.get(nombre, defecto))
+    except ValueError:
+        return defecto
+
+
+class PoolConexiones:
+    def __init__(self, parametros, minimo=1, maximo=5, timeout=30, verificar_seg=30):
+        self.parametros = parametros
+        self.minimo = max(0, minimo)
+        self.maximo = max(1, maximo, self.minimo)
+        self.timeout = timeout
+        self.verificar_seg = verificar_seg
+
+        self._cond = threading.Condition()
+        self._libres = []       # [(conexion, instante_devolucion)]
+        self._abiertas = 0      # libres + en uso
+        self._en_uso = 0
+        self._prellenado = False
+        self._pid = os.getpid()
+        # Conexiones heredadas de un proceso padre tras fork(). Nunca se
+        # cierran desde el hijo: cerrar el socket compartido mataría la
+        # sesión del padre.
+        self._heredadas = []
+        self._reiniciar_metricas()
+
+    def _reiniciar_metricas(self):
+        self._checkouts = 0
+        self._esperas = 0
+        self._timeouts = 0
+        self._creadas = 0
+        self._descartadas = 0
+        self._checkout_total = 0.0
+        self._checkout_max = 0.0
+
+    # -- ciclo de vida -------------------------------------------------
+
+    def _conectar(self):
+        conn = psycopg2.connect(**self.parametros)
+        conn.set_session(autocommit=False)
+        with self._cond:
+            self._creadas += 1
+        return conn
+
+    def _descartar(self, conn):
+        with self._cond:
+            self._descartadas += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _verificar_fork(self):
+        if self._pid != os.getpid():
+            self.despues_de_fork()
+
+    def despues_de_fork(self):
+        """Olvida las conexiones del proceso padre; el hijo abre las suyas."""
+        self._cond = threading.Condition()
+        self._heredadas.extend(conn for conn, _ in self._libres)
+        self._libres = []
+        self._abiertas = 0
+        self._en_uso = 0
+        self._prellenado = False
+        self._pid = os.getpid()
+        self._reiniciar_metricas()
+
+    def _prellenar(self):
+        self._prellenado = True
+        for _ in range(self.minimo):
+            with self._cond:
+                if self._abiertas >= self.maximo:
+                    return
+                self._abiertas += 1
+            try:
+                conn = self._conectar()
+            except Exception:
+                with self._cond:
+                    self._abiertas -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._libres.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def _sana(self, conn, devuelta_en):
+        """Verifica una conexión libre antes de entregarla."""
+        if conn.closed:
+            return False
+        if time.monotonic() - devuelta_en < self.verificar_seg:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1')
+            cursor.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    # -- API pública ---------------------------------------------------
+
+    def obtener(self):
+        """Entrega una conexión sana; espera hasta `timeout` si no hay libres."""
+        self._verificar_fork()
+        if not self._prellenado:
+            self._prellenar()
+
+        inicio = time.perf_counter()
+        limite = time.monotonic() + self.timeout
+        esperado = False
+        while True:
+            conn = None
+            with self._cond:
+                while not self._libres and self._abiertas >= self.maximo:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        self._timeouts += 1
+                        raise PoolAgotado(
+                            f"No hay conexiones libres tras {self.timeout}s "
+                            f"(máximo {self.maximo})"
+                        )
+                    if not esperado:
+                        esperado = True
+                        self._esperas += 1
+                    self._cond.wait(restante)
+
+                if self._libres:
+                    conn, devuelta_en = self._libres.pop()
+                else:
+                    self._abiertas += 1
+                self._en_uso += 1
+
+            if conn is not None and not self._sana(conn, devuelta_en):
+                self._descartar(conn)
+                conn = None
+
+            if conn is None:
+                try:
+                    conn = self._conectar()
+                except Exception:
+                    with self._cond:
+                        self._abiertas -= 1
+                        self._en_uso -= 1
+                        self._cond.notify()
+                    raise
+
+            duracion = time.perf_counter() - inicio
+            with self._cond:
+                self._checkouts += 1
+                self._checkout_total += duracion
+                self._checkout_max = max(self._checkout_max, duracion)
+            return conn
+
+    def devolver(self, conn):
+        """Devuelve la conexión al pool descartando cualquier transacción abierta."""
+        if self._pid != os.getpid():
+            # Conexión obtenida antes de un fork; no pertenece a este proceso
+            return
+
+        reutilizable = not conn.closed
+        if reutilizable:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if conn.autocommit:
+                    conn.autocommit = False
+            except Exception:
+                reutilizable = False
+
+        if not reutilizable:
+            self._descartar(conn)
+
+        with self._cond:
+            self._en_uso -= 1
+            if reutilizable:
+                self._libres.append((conn, time.monotonic()))
+            else:
+                self._abiertas -= 1
+            self._cond.notify()
+
+    def cerrar(self):
+        with self._cond:
+            libres, self._libres = self._libres, []
+            self._abiertas -= len(libres)
+        for conn, _ in libres:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def metricas(self):
+        with self._cond:
+            return {
+                'pid': self._pid,
+                'minimo': self.minimo,
+                'maximo': self.maximo,
+                'abiertas': self._abiertas,
+                'en_uso': self._en_uso,
+                'libres': len(self._libres),
+                'checkouts': self._checkouts,
+                'esperas': self._esperas,
+                'timeouts': self._timeouts,
+                'conexiones_creadas': self._creadas,
+                'conexiones_descartadas': self._descartadas,
+                'checkout_ms_promedio': round(self._checkout_total * 1000 / self._checkouts, 3) if self._checkouts else 0,
+                'checkout_ms_max': round(self._checkout_max * 1000, 3),
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_envoltorios_cursor = []
+
+
+def envolver_cursores(envoltorio):
+    """
+    Registra `envoltorio(clase_cursor) -> subclase` para los cursores del
+    pool (métricas, instrumentación). Se aplica al crear el pool; si ya
+    existe, a las conexiones que abra desde ahora.
+    """
+    _envoltorios_cursor.append(envoltorio)
+    if _pool is not None:
+        _pool.parametros['cursor_factory'] = envoltorio(_pool.parametros['cursor_factory'])
+
+
+def obtener_pool():
+    """Pool del proceso actual, creado en el primer uso a partir del entorno."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                parametros = parametros_conexion()
+                for envoltorio in _envoltorios_cursor:
+                    parametros['cursor_factory'] = envoltorio(parametros['cursor_factory'])
+                _pool = PoolConexiones(
+                    parametros,
+                    minimo=_entero_env('DB_POOL_MIN', 1),
+                    maximo=_entero_env('DB_POOL_MAX', 5),
+                    timeout=_entero_env('DB_POOL_TIMEOUT', 30),
+                    verificar_seg=_entero_env('DB_POOL_VERIFICAR_SEG', 30),
+                )
+    return _pool
+
+
+def _despues_de_fork():
+    global _pool_lock
+    _pool_lock = threading.Lock()
+    if _pool is not None:
+        _pool.despues_de_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_despues_de_fork)
@@ -0,0 +1,225 @@
+"""
+Difusión de eventos en tiempo real (Server-Sent Events) vía LISTEN/NOTIFY.
+
+Las rutas de escritura publican un aviso con pg_notify() dentro de su propia
+transacción, así que PostgreSQL sólo lo entrega si el cambio se confirmó.
+Cada worker mantiene UNA conexión dedicada en LISTEN, en un hilo (o greenlet
+con el worker gevent) que reparte cada aviso a las colas de los clientes
+conectados a /api/stream. N pantallas abiertas cuestan una conexión de
+escucha por worker, no N consultas periódicas.
+
+Variables de entorno:
+    EVENTOS_COLA_MAX       Avisos pendientes por suscriptor antes de pedirle
+                           que recargue (defecto 100)
+    EVENTOS_LATIDO_SEG     Intervalo de comentarios keep-alive (defecto 15)
+"""
+
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+from conexiones import parametros_conexion
+
+log = logging.getLogger(__name__)
+
+CANAL = 'despacho_eventos'
+LATIDO_SEG = float(os.environ.get('EVENTOS_LATIDO_SEG', 15))
+
+# Eventos que se envían al cliente además de los publicados por las rutas
+EVENTO_RECARGAR = 'recargar'   # se perdieron avisos: volver a pedir el estado
+
+
+def notificar(cursor, evento, **datos):
+    """Publica `evento` en el canal; se entrega al confirmar la transacción."""
+    datos['evento'] = evento
+    cursor.execute('SELECT pg_notify(%s, %s)', (CANAL, json.dumps(datos, default=str)))
+
+
+class Suscripcion:
+    def __init__(self, capacidad, filtro=None):
+        self.cola = queue.Queue(maxsize=capacidad)
+        self.filtro = filtro
+        self.desbordada = False
+
+    def acepta(self, datos):
+        return self.filtro is None or self.filtro(datos)
+
+
+class Difusor:
+    def __init__(self, canal=CANAL, capacidad_cola=100):
+        self.canal = canal
+        self.capacidad_cola = capacidad_cola
+        self._suscriptores = set()
+        self._lock = threading.Lock()
+        self._hilo = None
+        self._pid = os.getpid()
+        self._secuencia = 0
+        self.conectado = threading.Event()   # LISTEN activo en este momento
+        self.avisos_recibidos = 0
+        self.avisos_descartados = 0
+        self.reconexiones = 0
+
+    def suscribir(self, filtro=None):
+        suscripcion = Suscripcion(self.capacidad_cola, filtro)
+        with self._lock:
+            self._suscriptores.add(suscripcion)
+            self._asegurar_hilo()
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            self._suscriptores.discard(suscripcion)
+
+    def _asegurar_hilo(self):
+        # El hilo de escucha se crea con el primer suscriptor de cada proceso
+        if self._hilo is None or not self._hilo.is_alive():
+            self._hilo = threading.Thread(target=self._escuchar, name='eventos-listen', daemon=True)
+            self._hilo.start()
+
+    def _publicar(self, carga):
+        try:
+            datos = json.loads(carga)
+        except ValueError:
+            log.warning("⚠️ Aviso con formato inválido en %s: %s", self.canal, carga[:200])
+            return
+        evento = datos.pop('evento', 'mensaje')
+        with self._lock:
+            self._secuencia += 1
+            mensaje = (self._secuencia, evento, datos)
+            suscriptores = list(self._suscriptores)
+        self.avisos_recibidos += 1
+        for suscripcion in suscriptores:
+            if not suscripcion.acepta(datos):
+                continue
+            try:
+                suscripcion.cola.put_nowait(mensaje)
+            except queue.Full:
+                # Cliente lento: se le pedirá recargar en vez de crecer sin límite
+                suscripcion.desbordada = True
+                self.avisos_descartados += 1
+
+    def _pedir_recarga(self):
+        with self._lock:
+            suscriptores = list(self._suscriptores)
+        for suscripcion in suscriptores:
+            suscripcion.desbordada = True
+            try:
+                suscripcion.cola.put_nowait(None)   # despierta al generador
+            except queue.Full:
+                pass
+
+    def _escuchar(self):
+        espera = 1
+        primera = True
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**parametros_conexion())
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                conn.cursor().execute(f'LISTEN {self.canal}')
+                self.conectado.set()
+                if not primera:
+                    # Durante la reconexión pudieron perderse avisos
+                    self.reconexiones += 1
+                    self._pedir_recarga()
+                primera = False
+                espera = 1
+                log.info("📡 Escuchando eventos en '%s'", self.canal)
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        # Sin avisos: comprobar que la conexión sigue viva
+                        conn.cursor().execute('SELECT 1')
+                    conn.poll()
+                    while conn.notifies:
+                        self._publicar(conn.notifies.pop(0).payload)
+            except Exception as e:
+                self.conectado.clear()
+                log.warning("⚠️ Escucha de eventos interrumpida: %s. Reintentando en %ss", e, espera)
+                time.sleep(espera)
+                espera = min(espera * 2, 30)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def metricas(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'suscriptores': len(self._suscriptores),
+                'escuchando': self.conectado.is_set(),
+                'avisos_recibidos': self.avisos_recibidos,
+                'avisos_descartados': self.avisos_descartados,
+                'reconexiones': self.reconexiones,
+            }
+
+
+def formato_sse(evento, datos, id_evento=None):
+    lineas = []
+    if id_evento is not None:
+        lineas.append(f'id: {id_evento}')
+    lineas.append(f'event: {evento}')
+    lineas.append(f'data: {json.dumps(datos, default=str)}')
+    return '\n'.join(lineas) + '\n\n'
+
+
+def transmitir(suscripcion, difusor, latido=LATIDO_SEG):
+    """Generador SSE para una suscripción; la cancela al cerrarse la conexión."""
+    try:
+        yield 'retry: 5000\n\n'
+        yield formato_sse('conectado', {'pid': os.getpid()})
+        while True:
+            try:
+                mensaje = suscripcion.cola.get(timeout=latido)
+            except queue.Empty:
+                yield ': latido\n\n'
+                continue
+            if suscripcion.desbordada:
+                # Vaciar lo pendiente: el cliente debe pedir el estado completo
+                suscripcion.desbordada = False
+                while True:
+                    try:
+                        suscripcion.cola.get_nowait()
+                    except queue.Empty:
+                        break
+                yield formato_sse(EVENTO_RECARGAR, {})
+                continue
+            if mensaje is None:
+                continue
+            secuencia, evento, datos = mensaje
+            yield formato_sse(evento, datos, secuencia)
+    finally:
+        difusor.cancelar(suscripcion)
+
+
+_difusor = None
+_difusor_lock = threading.Lock()
+
+
+def obtener_difusor():
+    global _difusor
+    if _difusor is None or _difusor._pid != os.getpid():
+        with _difusor_lock:
+            if _difusor is None or _difusor._pid != os.getpid():
+                _difusor = Difusor(capacidad_cola=int(os.environ.get('EVENTOS_COLA_MAX', 100)))
+    return _difusor
+
+
+def _despues_de_fork():
+    # El hilo de escucha no sobrevive al fork: el hijo crea el suyo
+    global _difusor, _difusor_lock
+    _difusor_lock = threading.Lock()
+    _difusor = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_despues_de_fork)
@@ -0,0 +1,49 @@
+"""
+Configuración de gunicorn para producción.
+
+Se usa el worker gevent para que las conexiones largas de /api/stream (SSE)
+no ocupen un worker cada una: cada petición es un greenlet y psycopg2 se
+vuelve cooperativo con psycogreen. Las variables de entorno permiten volver
+a un worker síncrono si hiciera falta (GUNICORN_WORKER_CLASS=sync).
+
+Las métricas de /metrics se comparten entre workers con archivos en
+PROMETHEUS_MULTIPROC_DIR (ver metricas.py). La variable se fija aquí, antes
+de que cualquier proceso importe prometheus_client.
+"""
+
+import os
+import shutil
+import tempfile
+
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'gas_metricas'))
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+# Conexiones simultáneas por worker gevent (incluye los clientes SSE abiertos)
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 500))
+timeout = 120
+graceful_timeout = 30
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        # psycopg2 espera la respuesta del servidor dentro de una llamada C;
+        # sin este parche bloquearía todo el worker en vez de un greenlet
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+
+def on_starting(server):
+    # Los archivos de una ejecución anterior sumarían valores viejos. El
+    # maestro no importa prometheus_client: sólo los workers escriben métricas
+    directorio = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directorio, ignore_errors=True)
+    os.makedirs(directorio, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # Descarta las peticiones en curso del worker que terminó; sus contadores
+    # e histogramas siguen sumando
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,289 @@
+"""
+Importación masiva de clientes (POST /api/clientes/bulk).
+
+El archivo (CSV con encabezados o NDJSON, un objeto por línea) se lee y
+valida fila por fila mientras se envía a PostgreSQL con COPY hacia una tabla
+temporal; no se arma la lista completa en memoria. Después una sola
+sentencia INSERT ... ON CONFLICT (cedula) fusiona la tabla temporal con
+clientes, de modo que reimportar el mismo archivo actualiza en lugar de
+duplicar.
+
+Las filas con errores no se importan y se devuelven en el reporte con su
+número de fila (la fila 1 es la primera de datos).
+"""
+
+import csv
+import io
+import json
+import time
+
+FORMATOS = ('csv', 'ndjson')
+MAX_ERRORES_REPORTE = 1000
+
+# Columnas aceptadas y su largo máximo (igual que en la tabla clientes)
+COLUMNAS_TEXTO = {
+    'nombre': 255,
+    'direccion': None,
+    'telefono': 50,
+    'cedula': 50,
+    'rif': 50,
+    'placa': 50,
+    'categoria': 100,
+    'subcategoria': 100,
+}
+COLUMNAS_BOOLEANAS = ('exonerado', 'huella')
+COLUMNAS_LITROS = ('litros_mes_gasolina', 'litros_mes_gasoil')
+COLUMNAS = tuple(COLUMNAS_TEXTO) + COLUMNAS_BOOLEANAS + COLUMNAS_LITROS
+
+CATEGORIA_DEFECTO = 'Persona Natural'
+VERDADEROS = {'1', 'true', 't', 'si', 'sí', 's', 'yes', 'y', 'x'}
+FALSOS = {'', '0', 'false', 'f', 'no', 'n'}
+
+SQL_CREAR_TEMPORAL = '''
+    CREATE TEMP TABLE clientes_importacion (
+        fila INTEGER NOT NULL,
+        nombre VARCHAR(255) NOT NULL,
+        direccion TEXT,
+        telefono VARCHAR(50),
+        cedula VARCHAR(50) NOT NULL,
+        rif VARCHAR(50),
+        placa VARCHAR(50),
+        categoria VARCHAR(100),
+        subcategoria VARCHAR(100),
+        exonerado BOOLEAN,
+        huella BOOLEAN,
+        litros_mes_gasolina REAL,
+        litros_mes_gasoil REAL
+    ) ON COMMIT DROP
+'''
+
+SQL_COPY = 'COPY clientes_importacion (fila, {columnas}) FROM STDIN WITH (FORMAT csv)'.format(
+    columnas=', '.join(COLUMNAS))
+
+# Mismo criterio que crear_cliente / actualizar_cliente: al crear, el cupo
+# disponible arranca igual al mensual; al actualizar sólo cambia el mensual.
+SQL_FUSIONAR = '''
+    WITH fusion AS (
+        INSERT INTO clientes (
+            nombre, direccion, telefono, cedula, rif, placa,
+            categoria, subcategoria, exonerado, huella,
+            litros_mes, litros_disponibles,
+            litros_mes_gasolina, litros_mes_gasoil,
+            litros_disponibles_gasolina, litros_disponibles_gasoil
+        )
+        SELECT nombre, direccion, telefono, cedula, rif, placa,
+               categoria, subcategoria, exonerado, huella,
+               litros_mes_gasolina + litros_mes_gasoil, litros_mes_gasolina + litros_mes_gasoil,
+               litros_mes_gasolina, litros_mes_gasoil,
+               litros_mes_gasolina, litros_mes_gasoil
+        FROM clientes_importacion
+        ORDER BY fila
+        ON CONFLICT (cedula) DO UPDATE SET
+            nombre = EXCLUDED.nombre,
+            direccion = EXCLUDED.direccion,
+            telefono = EXCLUDED.telefono,
+            rif = EXCLUDED.rif,
+            placa = EXCLUDED.placa,
+            categoria = EXCLUDED.categoria,
+            subcategoria = EXCLUDED.subcategoria,
+            exonerado = EXCLUDED.exonerado,
+            huella = EXCLUDED.huella,
+            litros_mes = EXCLUDED.litros_mes,
+            litros_mes_gasolina = EXCLUDED.litros_mes_gasolina,
+            litros_mes_gasoil = EXCLUDED.litros_mes_gasoil,
+            activo = TRUE
+        RETURNING (xmax = 0) AS insertado
+    )
+    SELECT COUNT(*) FILTER (WHERE insertado) AS insertados,
+           COUNT(*) FILTER (WHERE NOT insertado) AS actualizados
+    FROM fusion
+'''
+
+
+class ErrorFila(ValueError):
+    pass
+
+
+def detectar_formato(formato, content_type, nombre_archivo=None):
+    if formato:
+        formato = formato.lower()
+    elif nombre_archivo and nombre_archivo.lower().endswith(('.ndjson', '.jsonl')):
+        formato = 'ndjson'
+    elif content_type and ('ndjson' in content_type or 'jsonl' in content_type):
+        formato = 'ndjson'
+    else:
+        formato = 'csv'
+    if formato not in FORMATOS:
+        raise ValueError(f'Formato no soportado: {formato}. Use csv o ndjson')
+    return formato
+
+
+def leer_filas(flujo_binario, formato):
+    """Genera (numero_fila, dict) o (numero_fila, ErrorFila) sin cargar el archivo entero."""
+    texto = io.TextIOWrapper(flujo_binario, encoding='utf-8-sig', newline='')
+    if formato == 'csv':
+        lector = csv.DictReader(texto)
+        if lector.fieldnames is None:
+            return
+        lector.fieldnames = [(c or '').strip().lower() for c in lector.fieldnames]
+        for numero, fila in enumerate(lector, start=1):
+            if None in fila:
+                yield numero, ErrorFila('La fila tiene más columnas que el encabezado')
+            else:
+                yield numero, fila
+    else:
+        numero = 0
+        for linea in texto:
+            if not linea.strip():
+                continue
+            numero += 1
+            try:
+                fila = json.loads(linea)
+            except ValueError as e:
+                yield numero, ErrorFila(f'JSON inválido: {e}')
+                continue
+            if not isinstance(fila, dict):
+                yield numero, ErrorFila('Cada línea debe ser un objeto JSON')
+                continue
+            yield numero, {str(k).strip().lower(): v for k, v in fila.items()}
+
+
+def _texto(fila, columna):
+    valor = fila.get(columna)
+    if valor is None:
+        return None
+    valor = str(valor).strip()
+    if not valor:
+        return None
+    maximo = COLUMNAS_TEXTO[columna]
+    if maximo and len(valor) > maximo:
+        raise ErrorFila(f'{columna} supera {maximo} caracteres')
+    return valor
+
+
+def _booleano(fila, columna):
+    valor = fila.get(columna)
+    if isinstance(valor, bool):
+        return valor
+    if valor is None:
+        return False
+    texto = str(valor).strip().lower()
+    if texto in VERDADEROS:
+        return True
+    if texto in FALSOS:
+        return False
+    raise ErrorFila(f'{columna} debe ser sí/no: {valor!r}')
+
+
+def _litros(fila, columna):
+    valor = fila.get(columna)
+    if valor is None or (isinstance(valor, str) and not valor.strip()):
+        return 0.0
+    try:
+        litros = float(str(valor).strip().replace(',', '.'))
+    except ValueError:
+        raise ErrorFila(f'{columna} no es un número: {valor!r}')
+    if litros != litros or litros < 0 or litros == float('inf'):
+        raise ErrorFila(f'{columna} debe ser un número positivo')
+    return litros
+
+
+def validar_fila(fila):
+    """Devuelve la fila normalizada en el orden de COLUMNAS o lanza ErrorFila."""
+    valores = {columna: _texto(fila, columna) for columna in COLUMNAS_TEXTO}
+    if not valores['nombre']:
+        raise ErrorFila('nombre es obligatorio')
+    if not valores['cedula']:
+        raise ErrorFila('cedula es obligatoria')
+    valores['categoria'] = valores['categoria'] or CATEGORIA_DEFECTO
+    for columna in COLUMNAS_BOOLEANAS:
+        valores[columna] = _booleano(fila, columna)
+    for columna in COLUMNAS_LITROS:
+        valores[columna] = _litros(fila, columna)
+    return [valores[columna] for columna in COLUMNAS]
+
+
+class FlujoCopy:
+    """
+    Objeto tipo archivo que psycopg2.copy_expert consume con read(): cada
+    lectura valida más filas del origen y entrega su representación CSV.
+    Los errores y las cédulas repetidas se acumulan en el reporte.
+    """
+
+    def __init__(self, filas):
+        self._filas = filas
+        self._pendiente = b''
+        self._buffer = io.StringIO()
+        self._escritor = csv.writer(self._buffer, lineterminator='\n')
+        self._cedulas = {}
+        self.recibidas = 0
+        self.validas = 0
+        self.errores = []
+        self.total_errores = 0
+
+    def _error(self, numero, cedula, mensaje):
+        self.total_errores += 1
+        if len(self.errores) < MAX_ERRORES_REPORTE:
+            self.errores.append({'fila': numero, 'cedula': cedula, 'error': mensaje})
+
+    def _siguiente_bloque(self, minimo):
+        for numero, fila in self._filas:
+            self.recibidas += 1
+            if isinstance(fila, ErrorFila):
+                self._error(numero, None, str(fila))
+                continue
+            try:
+                valores = validar_fila(fila)
+            except ErrorFila as e:
+                self._error(numero, fila.get('cedula'), str(e))
+                continue
+            cedula = valores[COLUMNAS.index('cedula')]
+            anterior = self._cedulas.get(cedula)
+            if anterior is not None:
+                self._error(numero, cedula, f'cédula repetida en el archivo (fila {anterior})')
+                continue
+            self._cedulas[cedula] = numero
+            self.validas += 1
+            self._escritor.writerow([numero] + valores)
+            if self._buffer.tell() >= minimo:
+                break
+        bloque = self._buffer.getvalue().encode('utf-8')
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return bloque
+
+    def read(self, tamano=65536):
+        tamano = tamano if tamano and tamano > 0 else 65536
+        while len(self._pendiente) < tamano:
+            bloque = self._siguiente_bloque(tamano)
+            if not bloque:
+                break
+            self._pendiente += bloque
+        datos, self._pendiente = self._pendiente[:tamano], self._pendiente[tamano:]
+        return datos
+
+
+def importar(db, flujo_binario, formato):
+    """Valida, copia y fusiona; confirma la transacción y devuelve el reporte."""
+    inicio = time.monotonic()
+    cursor = db.cursor()
+    cursor.execute(SQL_CREAR_TEMPORAL)
+    origen = FlujoCopy(leer_filas(flujo_binario, formato))
+    cursor.copy_expert(SQL_COPY, origen)
+    if origen.validas:
+        cursor.execute(SQL_FUSIONAR)
+        fusion = cursor.fetchone()
+    else:
+        fusion = {'insertados': 0, 'actualizados': 0}
+    db.commit()
+
+    return {
+        'recibidas': origen.recibidas,
+        'validas': origen.validas,
+        'insertados': fusion['insertados'],
+        'actualizados': fusion['actualizados'],
+        'total_errores': origen.total_errores,
+        'errores': origen.errores,
+        'errores_truncados': origen.total_errores > len(origen.errores),
+        'segundos': round(time.monotonic() - inicio, 3),
+    }
@@ -0,0 +1,293 @@
+"""
+Instrumentación de las sentencias SQL de cada petición.
+
+Los cursores del pool (ver conexiones.envolver_cursores) anotan cada
+sentencia con su huella, su duración y sus filas. La huella es el texto
+normalizado: sin comentarios, con espacios colapsados y con parámetros y
+literales reemplazados por `?`. Así las ejecuciones de una misma consulta
+con valores distintos comparten huella.
+
+- SQL lenta: una sentencia que pasa SQL_LENTA_MS se registra (ver
+  registro.py) con evento 'sql_lenta', la huella, la ruta y la duración. Con
+  SQL_LENTA_EXPLAIN=1 se agrega el plan de EXPLAIN (ANALYZE, BUFFERS).
+  ANALYZE vuelve a ejecutar la consulta, así que sólo se hace para SELECT
+  sin efectos conocidos (locks, secuencias, NOTIFY, FOR UPDATE...). Se
+  hace dentro de un SAVEPOINT, a lo sumo una vez por huella cada
+  SQL_EXPLAIN_INTERVALO_SEG.
+- Repetidas (N+1): al terminar la petición, cada huella que se ejecutó
+  SQL_REPETIDAS_UMBRAL veces o más se registra con evento 'sql_repetida'.
+
+Los valores de los parámetros nunca se escriben: pueden llevar datos
+personales o contraseñas.
+
+`presupuesto()` captura las sentencias de un bloque para fijar cuántas
+consultas puede hacer una ruta:
+
+    with instrumentacion.presupuesto(consultas=1):
+        cliente.get('/api/inventario', headers=headers)
+
+Variables de entorno:
+    SQL_INSTRUMENTACION         0 para no instrumentar (defecto 1)
+    SQL_LENTA_MS                Umbral del registro de SQL lenta (defecto 200)
+    SQL_LENTA_EXPLAIN           1 para agregar el plan a las SQL lentas (defecto 0)
+    SQL_EXPLAIN_INTERVALO_SEG   Mínimo entre dos EXPLAIN de la misma huella (defecto 300)
+    SQL_REPETIDAS_UMBRAL        Ejecuciones de una huella por petición que se
+                                informan como N+1 (defecto 5)
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+
+import psycopg2
+import psycopg2.extensions
+from flask import has_request_context, request
+
+
+log = logging.getLogger(__name__)
+
+
+def _entero_env(nombre, defecto):
+    try:
+        return int(os.environ.get(nombre, defecto))
+    except ValueError:
+        return defecto
+
+
+ACTIVA = os.environ.get('SQL_INSTRUMENTACION', '1') != '0'
+LENTA_SEG = _entero_env('SQL_LENTA_MS', 200) / 1000
+EXPLAIN = os.environ.get('SQL_LENTA_EXPLAIN', '0') == '1'
+EXPLAIN_INTERVALO_SEG = _entero_env('SQL_EXPLAIN_INTERVALO_SEG', 300)
+REPETIDAS_UMBRAL = _entero_env('SQL_REPETIDAS_UMBRAL', 5)
+
+CLAVE_REGISTRO = 'instrumentacion.registro'
+MAX_CONSULTAS_REGISTRO = 500      # sentencias detalladas por petición
+MAX_SQL_LOG = 2000                # caracteres de la huella en el log
+
+_RE_COMENTARIOS = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_RE_CADENAS = re.compile(r"'(?:[^']|'')*'")
+_RE_PARAMETROS = re.compile(r'%\(\w+\)s|%s')
+_RE_NUMEROS = re.compile(r'\b\d+(?:\.\d+)?\b')
+_RE_LISTAS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_RE_ESPACIOS = re.compile(r'\s+')
+# SELECT que no se pueden volver a ejecutar con EXPLAIN ANALYZE
+_RE_CON_EFECTOS = re.compile(
+    r'\b(nextval|setval|pg_notify|set_config|pg_\w*advisory\w*|particiones_\w+)\s*\('
+    r'|\bFOR\s+(UPDATE|SHARE|NO\s+KEY|KEY)\b|\bINTO\b', re.I)
+
+
+@lru_cache(maxsize=2048)
+def huella(sql):
+    """(id corto, texto normalizado) de una sentencia."""
+    texto = _RE_COMENTARIOS.sub(' ', sql)
+    texto = _RE_CADENAS.sub('?', texto)
+    texto = _RE_PARAMETROS.sub('?', texto)
+    texto = _RE_NUMEROS.sub('?', texto)
+    texto = _RE_LISTAS.sub('(?...)', texto)
+    texto = _RE_ESPACIOS.sub(' ', texto).strip()
+    return hashlib.md5(texto.encode()).hexdigest()[:12], texto
+
+
+def _texto(query, conn):
+    if isinstance(query, str):
+        return query
+    if isinstance(query, bytes):
+        return query.decode('utf-8', 'replace')
+    return query.as_string(conn)          # psycopg2.sql.Composable
+
+
+def _escribir(evento, **datos):
+    # registro.py agrega el pid, el método y la ruta de la petición
+    log.warning(evento, extra={'evento': evento, **datos})
+
+
+# -- registro por petición y capturas ---------------------------------------
+
+class RegistroPeticion:
+    """Sentencias de una petición: el detalle (acotado) y el total por huella."""
+
+    __slots__ = ('consultas', 'por_huella', 'total')
+
+    def __init__(self):
+        self.consultas = []          # [(id_huella, ms, filas)]
+        self.por_huella = {}         # id_huella -> [veces, segundos, texto]
+        self.total = 0
+
+    def anotar(self, id_huella, texto, segundos, filas):
+        self.total += 1
+        if len(self.consultas) < MAX_CONSULTAS_REGISTRO:
+            self.consultas.append((id_huella, round(segundos * 1000, 3), filas))
+        acumulado = self.por_huella.get(id_huella)
+        if acumulado is None:
+            self.por_huella[id_huella] = [1, segundos, texto]
+        else:
+            acumulado[0] += 1
+            acumulado[1] += segundos
+
+
+def registro_actual():
+    """Registro de la petición en curso (None fuera de una petición)."""
+    if has_request_context():
+        return request.environ.get(CLAVE_REGISTRO)
+    return None
+
+
+_capturas = []
+_capturas_lock = threading.Lock()
+
+
+class Presupuesto:
+    """
+    Captura las sentencias de los cursores del pool mientras está activo (en
+    cualquier hilo) y al salir del bloque verifica los máximos.
+    """
+
+    def __init__(self, consultas=None, repetidas=None):
+        self.maximo = consultas
+        self.maximo_repetidas = repetidas
+        self.consultas = []          # [(id_huella, texto, ms, filas)]
+        self._lock = threading.Lock()
+
+    def anotar(self, id_huella, texto, segundos, filas):
+        with self._lock:
+            self.consultas.append((id_huella, texto, round(segundos * 1000, 3), filas))
+
+    def __enter__(self):
+        with _capturas_lock:
+            _capturas.append(self)
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        with _capturas_lock:
+            _capturas.remove(self)
+        if tipo is None:
+            self.verificar()
+
+    def repetidas(self):
+        return Counter(texto for _, texto, _, _ in self.consultas)
+
+    def verificar(self):
+        problemas = []
+        if self.maximo is not None and len(self.consultas) > self.maximo:
+            problemas.append(f'{len(self.consultas)} consultas, presupuesto {self.maximo}')
+        if self.maximo_repetidas is not None:
+            for texto, veces in self.repetidas().items():
+                if veces > self.maximo_repetidas:
+                    problemas.append(f'{veces} ejecuciones de la misma consulta (máximo '
+                                     f'{self.maximo_repetidas}): {texto[:200]}')
+        if problemas:
+            detalle = '\n'.join(f'  {ms:>9.2f} ms {filas!s:>6} filas  {texto[:160]}'
+                                for _, texto, ms, filas in self.consultas)
+            raise AssertionError('; '.join(problemas) + '\n' + detalle)
+
+
+def presupuesto(consultas=None, repetidas=None):
+    """Bloque que falla con AssertionError si se pasa de `consultas` o repite una más de `repetidas` veces."""
+    return Presupuesto(consultas, repetidas)
+
+
+# -- cursor ------------------------------------------------------------------
+
+_ultimo_explain = {}
+
+
+def _toca_explicar(id_huella, texto):
+    if not texto.upper().startswith('SELECT ') or _RE_CON_EFECTOS.search(texto):
+        return False
+    ahora = time.monotonic()
+    if ahora - _ultimo_explain.get(id_huella, -EXPLAIN_INTERVALO_SEG) < EXPLAIN_INTERVALO_SEG:
+        return False
+    _ultimo_explain[id_huella] = ahora
+    return True
+
+
+def _explicar(conn, sql, vars):
+    """Plan de EXPLAIN (ANALYZE, BUFFERS); un error no afecta a la transacción de la petición."""
+    cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+    punto = not conn.autocommit
+    try:
+        if punto:
+            cursor.execute('SAVEPOINT instrumentacion_explain')
+        try:
+            cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + sql, vars)
+            return [fila[0] for fila in cursor.fetchall()]
+        except psycopg2.Error as e:
+            if punto:
+                cursor.execute('ROLLBACK TO SAVEPOINT instrumentacion_explain')
+            return [f'EXPLAIN falló: {e}'.strip()]
+        finally:
+            if punto:
+                cursor.execute('RELEASE SAVEPOINT instrumentacion_explain')
+    finally:
+        cursor.close()
+
+
+def cursor_instrumentado(base):
+    """Subclase del cursor `base` que anota cada sentencia (ver el docstring del módulo)."""
+
+    class CursorInstrumentado(base):
+        def _anotar(self, query, vars, segundos):
+            registro = registro_actual()
+            capturas = _capturas
+            lenta = segundos >= LENTA_SEG
+            if registro is None and not capturas and not lenta:
+                return
+            sql = _texto(query, self.connection)
+            id_huella, texto = huella(sql)
+            filas = self.rowcount if self.rowcount >= 0 else None
+            if registro is not None:
+                registro.anotar(id_huella, texto, segundos, filas)
+            for captura in list(capturas):
+                captura.anotar(id_huella, texto, segundos, filas)
+            if lenta:
+                datos = {'huella': id_huella, 'sql': texto[:MAX_SQL_LOG],
+                         'ms': round(segundos * 1000, 1), 'filas': filas}
+                if EXPLAIN and not self.name and _toca_explicar(id_huella, texto):
+                    datos['plan'] = _explicar(self.connection, sql, vars)
+                _escribir('sql_lenta', **datos)
+
+        def execute(self, query, vars=None):
+            inicio = time.perf_counter()
+            resultado = super().execute(query, vars)
+            self._anotar(query, vars, time.perf_counter() - inicio)
+            return resultado
+
+        def executemany(self, query, vars_list):
+            inicio = time.perf_counter()
+            resultado = super().executemany(query, vars_list)
+            self._anotar(query, None, time.perf_counter() - inicio)
+            return resultado
+
+        def copy_expert(self, sql, file, size=8192):
+            inicio = time.perf_counter()
+            resultado = super().copy_expert(sql, file, size)
+            self._anotar(sql, None, time.perf_counter() - inicio)
+            return resultado
+
+    CursorInstrumentado.__name__ = f'{base.__name__}Instrumentado'
+    return CursorInstrumentado
+
+
+def instalar(app):
+    """Registra las sentencias de cada petición de `app` e informa las repetidas al terminar."""
+    if not ACTIVA:
+        return
+
+    @app.before_request
+    def _abrir_registro():
+        request.environ[CLAVE_REGISTRO] = RegistroPeticion()
+
+    @app.teardown_request
+    def _cerrar_registro(error):
+        registro = request.environ.pop(CLAVE_REGISTRO, None)
+        if registro is None:
+            return
+        for id_huella, (veces, segundos, texto) in registro.por_huella.items():
+            if veces >= REPETIDAS_UMBRAL:
+                _escribir('sql_repetida', huella=id_huella, sql=texto[:MAX_SQL_LOG], veces=veces,
+                          ms_total=round(segundos * 1000, 1), consultas_peticion=registro.total)
@@ -0,0 +1,277 @@
+"""
+Resumen diario y compactación del libro de inventario.
+
+Cada entrada, retiro, agendamiento y reseteo anota un movimiento en
+`inventario`. Con cientos de agendamientos por día el libro crece rápido, y
+el historial de /api/inventario/historial con él. Este proceso hace dos
+cosas:
+
+  1. Resumir: por cada día cerrado y combustible guarda en
+     inventario_diario los movimientos, entradas, salidas y la existencia al
+     cierre. /api/inventario/historial?granularity=day lee de aquí.
+  2. Compactar: los días con más de INVENTARIO_COMPACTAR_DIAS de antigüedad
+     se reemplazan en el libro por un solo movimiento por combustible. Se
+     conserva el último movimiento del día (su id y su existencia) con la
+     suma neta del día. El resumen se recalcula en la misma sentencia, así
+     que los totales coinciden siempre con lo que se borra.
+
+Las sumas se hacen en doble precisión y los totales exactos de cada día
+quedan en inventario_diario. El movimiento de resumen del libro guarda la
+suma neta en litros_ingresados, que es REAL: se redondea a float4 y es
+sólo informativa. Los días compactados no se vuelven a resumir desde el
+libro, y el historial por día lee inventario_diario. La existencia al
+cierre y el último movimiento de cada combustible
+(inventario_actual.ultimo_movimiento_id) no cambian.
+
+Los días ya archivados (archivo.py) se resumen leyendo también el archivo y
+no se compactan. Un advisory lock evita dos procesos a la vez. server.py
+ejecuta `tarea_programada` periódicamente (ver LIBRO_PROGRAMADO).
+
+Uso:
+    python libro_inventario.py ejecutar [--dias 30] [--lote 200]
+    python libro_inventario.py estado
+
+Variables de entorno:
+    DATABASE_URL                URL de conexión (obligatoria)
+    INVENTARIO_COMPACTAR_DIAS   Días con movimientos detallados (defecto 30)
+    INVENTARIO_COMPACTAR_LOTE   Días por transacción al compactar (defecto 200)
+"""
+
+import argparse
+import logging
+import os
+import sys
+from datetime import date, timedelta
+
+import psycopg2
+
+import archivo
+from cambios import marcar as marcar_cambios
+from conexiones import parametros_conexion
+import registro
+
+log = logging.getLogger(__name__)
+
+COMPACTAR_DIAS = int(os.environ.get('INVENTARIO_COMPACTAR_DIAS', 30))
+LOTE_DEFECTO = int(os.environ.get('INVENTARIO_COMPACTAR_LOTE', 200))
+CLAVE_LOCK = 'despacho_gas.libro_inventario'
+
+# Totales de un día y combustible a partir de sus movimientos
+COLUMNAS_TOTALES = '''
+    COUNT(*) AS movimientos,
+    COALESCE(SUM(litros_ingresados::float8) FILTER (WHERE litros_ingresados > 0), 0) AS entradas,
+    COALESCE(-SUM(litros_ingresados::float8) FILTER (WHERE litros_ingresados < 0), 0) AS salidas,
+    (ARRAY_AGG(litros_disponibles ORDER BY id DESC))[1] AS litros_disponibles,
+    MAX(id) AS ultimo_movimiento_id
+'''
+
+# Resume los días cerrados desde una fecha. `origen` es la tabla o la tabla
+# más las filas archivadas (archivo.origen), por eso los parámetros son
+# posicionales: último día archivado, los de `origen` y la fecha inicial.
+# Los días ya compactados no se tocan.
+SQL_RESUMIR = '''
+    INSERT INTO inventario_diario AS d (fecha, tipo_combustible, movimientos, entradas, salidas,
+                                        litros_disponibles, ultimo_movimiento_id, compactado)
+    SELECT fecha, tipo_combustible, movimientos, entradas, salidas,
+           litros_disponibles, ultimo_movimiento_id, fecha <= %s
+    FROM (
+        SELECT fecha_ingreso::date AS fecha, tipo_combustible, {totales}
+        FROM {origen} i
+        WHERE fecha_ingreso >= %s AND fecha_ingreso < CURRENT_DATE
+        GROUP BY fecha_ingreso::date, tipo_combustible
+    ) dias
+    ON CONFLICT (fecha, tipo_combustible) DO UPDATE
+    SET movimientos = EXCLUDED.movimientos,
+        entradas = EXCLUDED.entradas,
+        salidas = EXCLUDED.salidas,
+        litros_disponibles = EXCLUDED.litros_disponibles,
+        ultimo_movimiento_id = EXCLUDED.ultimo_movimiento_id,
+        compactado = EXCLUDED.compactado
+    WHERE NOT d.compactado
+'''
+
+# Compacta un lote de días: recalcula sus totales, borra todos los
+# movimientos salvo el último de cada día y combustible, deja en éste la
+# suma neta del día y marca el resumen como compactado.
+SQL_COMPACTAR = '''
+    WITH dias AS (
+        SELECT fecha, tipo_combustible FROM inventario_diario
+        WHERE NOT compactado AND fecha < %(corte)s AND fecha > %(archivado_hasta)s
+        ORDER BY fecha, tipo_combustible
+        LIMIT %(lote)s
+        FOR UPDATE
+    ),
+    movimientos AS (
+        SELECT i.id, d.fecha, i.tipo_combustible, i.litros_ingresados, i.litros_disponibles
+        FROM dias d
+        JOIN inventario i ON i.tipo_combustible = d.tipo_combustible
+                         AND i.fecha_ingreso >= d.fecha AND i.fecha_ingreso < d.fecha + 1
+        FOR UPDATE OF i
+    ),
+    totales AS (
+        SELECT fecha, tipo_combustible, {totales}
+        FROM movimientos
+        GROUP BY fecha, tipo_combustible
+    ),
+    borrados AS (
+        DELETE FROM inventario i
+        USING movimientos m
+        JOIN totales t ON t.fecha = m.fecha AND t.tipo_combustible = m.tipo_combustible
+        WHERE i.id = m.id AND i.id <> t.ultimo_movimiento_id
+        RETURNING i.id
+    ),
+    resumidos AS (
+        -- litros_ingresados es REAL: el total exacto es el de inventario_diario
+        UPDATE inventario i
+        SET litros_ingresados = t.entradas - t.salidas,
+            usuario_id = NULL,
+            observaciones = format('Resumen del día: %%s movimientos, entradas %%s L, salidas %%s L',
+                                   t.movimientos, t.entradas, t.salidas)
+        FROM totales t
+        WHERE i.id = t.ultimo_movimiento_id AND t.movimientos > 1
+        RETURNING i.id
+    ),
+    actualizados AS (
+        UPDATE inventario_diario d
+        SET movimientos = COALESCE(t.movimientos, d.movimientos),
+            entradas = COALESCE(t.entradas, d.entradas),
+            salidas = COALESCE(t.salidas, d.salidas),
+            litros_disponibles = COALESCE(t.litros_disponibles, d.litros_disponibles),
+            ultimo_movimiento_id = COALESCE(t.ultimo_movimiento_id, d.ultimo_movimiento_id),
+            compactado = TRUE
+        FROM dias x
+        LEFT JOIN totales t ON t.fecha = x.fecha AND t.tipo_combustible = x.tipo_combustible
+        WHERE d.fecha = x.fecha AND d.tipo_combustible = x.tipo_combustible
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM actualizados) AS dias,
+           (SELECT COUNT(*) FROM borrados) AS borrados,
+           (SELECT COUNT(*) FROM resumidos) AS resumidos
+'''
+
+
+def archivado_hasta():
+    """Último día del libro de inventario que está en el archivo frío."""
+    segmentos = archivo.obtener_archivo().segmentos('inventario')
+    if not segmentos:
+        return date.min
+    return date.fromisoformat(max(s['hasta'] for s in segmentos))
+
+
+def resumir(cursor, hasta_archivo):
+    """Resume los días cerrados posteriores al último día compactado."""
+    cursor.execute('SELECT MAX(fecha) AS fecha FROM inventario_diario WHERE compactado')
+    ultimo = cursor.fetchone()['fecha']
+    desde = ultimo + timedelta(days=1) if ultimo else date.min
+    # El archivo sólo se lee hasta tener resumidos los días archivados
+    filas = list(archivo.obtener_archivo().filas('inventario', desde=desde)) if desde <= hasta_archivo else []
+    origen, params = archivo.origen('inventario', filas)
+    cursor.execute(SQL_RESUMIR.format(origen=origen, totales=COLUMNAS_TOTALES),
+                   [hasta_archivo] + params + [desde])
+    return cursor.rowcount
+
+
+def compactar(conn, dias=COMPACTAR_DIAS, lote=LOTE_DEFECTO, hasta_archivo=date.min, hoy=None):
+    """Compacta por lotes los días anteriores a `dias` días atrás."""
+    corte = (hoy or date.today()) - timedelta(days=dias)
+    cursor = conn.cursor()
+    total = {'dias': 0, 'borrados': 0, 'resumidos': 0}
+    while True:
+        cursor.execute(SQL_COMPACTAR.format(totales=COLUMNAS_TOTALES),
+                       {'corte': corte, 'archivado_hasta': hasta_archivo, 'lote': lote})
+        resultado = cursor.fetchone()
+        conn.commit()
+        for clave in total:
+            total[clave] += resultado[clave]
+        if resultado['borrados'] or resultado['resumidos']:
+            marcar_cambios('inventario')
+        if resultado['dias'] < lote:
+            return total
+
+
+def ejecutar(dias=COMPACTAR_DIAS, lote=LOTE_DEFECTO, hoy=None):
+    """
+    Resume los días cerrados y compacta los viejos. Devuelve
+    {'resumidos': días resumidos, 'dias', 'borrados', 'resumidos_libro'}, o
+    None si otro proceso lo está haciendo.
+    """
+    conn = psycopg2.connect(**parametros_conexion())
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT pg_try_advisory_lock(hashtext(%s)) AS obtenido', (CLAVE_LOCK,))
+        obtenido = cursor.fetchone()['obtenido']
+        conn.commit()
+        if not obtenido:
+            return None
+        try:
+            hasta_archivo = archivado_hasta()
+            resumidos = resumir(cursor, hasta_archivo)
+            conn.commit()
+            compactados = compactar(conn, dias, lote, hasta_archivo, hoy)
+            return {'resumidos': resumidos, 'dias': compactados['dias'],
+                    'borrados': compactados['borrados'], 'resumidos_libro': compactados['resumidos']}
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.execute('SELECT pg_advisory_unlock(hashtext(%s))', (CLAVE_LOCK,))
+            conn.commit()
+    finally:
+        conn.close()
+
+
+def tarea_programada():
+    """Punto de entrada para el programador de tareas del servidor."""
+    resultado = ejecutar()
+    if resultado and resultado['dias']:
+        log.info("📒 Libro de inventario: %d días compactados, %d movimientos reemplazados por su resumen",
+                 resultado['dias'], resultado['borrados'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resumen diario y compactación del libro de inventario')
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    p_ejecutar = comandos.add_parser('ejecutar', help='resumir los días cerrados y compactar los viejos')
+    p_ejecutar.add_argument('--dias', type=int, default=COMPACTAR_DIAS,
+                            help='días recientes que conservan sus movimientos')
+    p_ejecutar.add_argument('--lote', type=int, default=LOTE_DEFECTO)
+    comandos.add_parser('estado', help='días resumidos y compactados')
+    args = parser.parse_args()
+    registro.configurar(formato='texto')
+
+    if not os.environ.get('DATABASE_URL'):
+        print("ERROR: DATABASE_URL no esta configurada")
+        sys.exit(1)
+
+    if args.comando == 'estado':
+        conn = psycopg2.connect(**parametros_conexion())
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT tipo_combustible, compactado, COUNT(*) AS dias, SUM(movimientos) AS movimientos,
+                       MIN(fecha) AS desde, MAX(fecha) AS hasta
+                FROM inventario_diario
+                GROUP BY tipo_combustible, compactado
+                ORDER BY tipo_combustible, compactado
+            ''')
+            filas = cursor.fetchall()
+            cursor.execute('SELECT COUNT(*) AS movimientos FROM inventario')
+            print(f"Movimientos en el libro: {cursor.fetchone()['movimientos']}")
+            for fila in filas:
+                print(f"   {fila['tipo_combustible']:<10} {'compactados' if fila['compactado'] else 'resumidos':<12} "
+                      f"{fila['dias']:>6} días {fila['movimientos']:>10} movimientos  {fila['desde']} .. {fila['hasta']}")
+        finally:
+            conn.close()
+        return
+
+    print(f"📒 Resumiendo el libro de inventario y compactando los días de hace más de {args.dias} días...")
+    resultado = ejecutar(dias=args.dias, lote=args.lote)
+    if resultado is None:
+        print("⚠️ Otro proceso está compactando el libro")
+        sys.exit(1)
+    print(f"✅ {resultado['resumidos']} días resumidos; {resultado['dias']} días compactados "
+          f"({resultado['borrados']} movimientos borrados, {resultado['resumidos_libro']} resúmenes en el libro)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""
+Métricas de la API en formato de exposición de Prometheus (GET /metrics).
+
+Por cada petición se registra, con etiquetas de método y ruta (la plantilla
+de Flask, p. ej. /api/clientes/<int:cliente_id>, para no crear una serie
+por id):
+  - peticiones por código de estado;
+  - histogramas de duración total, tiempo en PostgreSQL y tiempo en Python
+    (la diferencia);
+  - histogramas de filas leídas de PostgreSQL y de bytes de la respuesta.
+
+La medición la hace un middleware WSGI alrededor de la aplicación, así que
+incluye las respuestas en streaming (exportaciones, SSE) hasta que se
+terminan de enviar. El tiempo y las filas de PostgreSQL los suman los
+cursores del pool (ver `cursor_medido`).
+
+Con varios workers de gunicorn cada proceso escribe sus valores en archivos
+mapeados en memoria dentro de PROMETHEUS_MULTIPROC_DIR (modo multiproceso
+de prometheus_client) y /metrics suma los de todos, sin importar qué worker
+atiende el scrape. Los contadores de workers que terminaron siguen en sus
+archivos, así que un reinicio de worker tampoco hace bajar los totales.
+gunicorn.conf.py fija y vacía el directorio al arrancar. Sin esa variable
+(p. ej. `python server.py`) las métricas son las del proceso.
+
+Variables de entorno:
+    PROMETHEUS_MULTIPROC_DIR   Directorio de los archivos compartidos entre workers
+    METRICAS_TOKEN             Si está definido, /metrics exige
+                               `Authorization: Bearer <token>`
+"""
+
+import os
+import time
+
+from flask import has_request_context, request
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+DIRECTORIO = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+CLAVE_MEDICION = 'metricas.medicion'
+SIN_RUTA = 'sin_ruta'
+
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BUCKETS_FILAS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 100000)
+BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+ETIQUETAS = ('metodo', 'ruta')
+
+peticiones = Counter('gas_http_peticiones_total', 'Peticiones atendidas',
+                     ETIQUETAS + ('estado',))
+duracion = Histogram('gas_http_duracion_segundos', 'Duración total de la petición, hasta enviar la respuesta',
+                     ETIQUETAS, buckets=BUCKETS_SEGUNDOS)
+tiempo_db = Histogram('gas_http_db_segundos', 'Tiempo de la petición esperando a PostgreSQL',
+                      ETIQUETAS, buckets=BUCKETS_SEGUNDOS)
+tiempo_python = Histogram('gas_http_python_segundos', 'Tiempo de la petición fuera de PostgreSQL',
+                          ETIQUETAS, buckets=BUCKETS_SEGUNDOS)
+filas = Histogram('gas_http_filas', 'Filas leídas de PostgreSQL por petición',
+                  ETIQUETAS, buckets=BUCKETS_FILAS)
+bytes_respuesta = Histogram('gas_http_respuesta_bytes', 'Bytes del cuerpo de la respuesta',
+                            ETIQUETAS, buckets=BUCKETS_BYTES)
+en_curso = Gauge('gas_http_peticiones_en_curso', 'Peticiones (y streams) abiertas',
+                 multiprocess_mode='livesum')
+
+
+class Medicion:
+    """Acumulado de una petición; los cursores del pool le suman."""
+
+    __slots__ = ('ruta', 'db', 'filas', 'consultas')
+
+    def __init__(self):
+        self.ruta = SIN_RUTA
+        self.db = 0.0
+        self.filas = 0
+        self.consultas = 0
+
+
+def medicion_actual():
+    if has_request_context():
+        return request.environ.get(CLAVE_MEDICION)
+    return None
+
+
+def cursor_medido(base):
+    """
+    Subclase del cursor `base` que suma a la petición en curso el tiempo de
+    cada sentencia y las filas que devuelve. Fuera de una petición (tareas
+    programadas, scripts) no registra nada.
+    """
+
+    class CursorMedido(base):
+        def _medir(self, funcion, *args):
+            medicion = medicion_actual()
+            if medicion is None:
+                return funcion(*args)
+            inicio = time.perf_counter()
+            try:
+                return funcion(*args)
+            finally:
+                medicion.db += time.perf_counter() - inicio
+                medicion.consultas += 1
+                # Los cursores del cliente ya trajeron todo el resultado; los
+                # con nombre cuentan al iterar
+                if not self.name and self.description is not None and self.rowcount > 0:
+                    medicion.filas += self.rowcount
+
+        def execute(self, query, vars=None):
+            return self._medir(super().execute, query, vars)
+
+        def executemany(self, query, vars_list):
+            return self._medir(super().executemany, query, vars_list)
+
+        def copy_expert(self, sql, file, size=8192):
+            return self._medir(super().copy_expert, sql, file, size)
+
+        def __iter__(self):
+            medicion = medicion_actual()
+            if not self.name or medicion is None:
+                yield from super().__iter__()
+                return
+            # Cursor con nombre: cada lote de `itersize` filas se pide a
+            # PostgreSQL durante la iteración
+            filas_iter = super().__iter__()
+            while True:
+                inicio = time.perf_counter()
+                try:
+                    fila = next(filas_iter)
+                except StopIteration:
+                    medicion.db += time.perf_counter() - inicio
+                    return
+                medicion.db += time.perf_counter() - inicio
+                medicion.filas += 1
+                yield fila
+
+    CursorMedido.__name__ = f'{base.__name__}Medido'
+    return CursorMedido
+
+
+class _CuerpoMedido:
+    """Iterable de la respuesta que cuenta bytes y registra al cerrarse."""
+
+    def __init__(self, cuerpo, alcerrar):
+        self._cuerpo = cuerpo
+        self._alcerrar = alcerrar
+        self.bytes = 0
+
+    def __iter__(self):
+        for bloque in self._cuerpo:
+            self.bytes += len(bloque)
+            yield bloque
+
+    def close(self):
+        try:
+            if hasattr(self._cuerpo, 'close'):
+                self._cuerpo.close()
+        finally:
+            self._alcerrar(self.bytes)
+
+
+class MiddlewareMetricas:
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        medicion = environ[CLAVE_MEDICION] = Medicion()
+        metodo = environ.get('REQUEST_METHOD', '')
+        estado = ['500']
+        inicio = time.perf_counter()
+        en_curso.inc()
+
+        def registrar_inicio(status, headers, exc_info=None):
+            estado[0] = status.split(' ', 1)[0]
+            return start_response(status, headers, exc_info)
+
+        def registrar(total_bytes):
+            en_curso.dec()
+            segundos = time.perf_counter() - inicio
+            etiquetas = (metodo, medicion.ruta)
+            peticiones.labels(metodo, medicion.ruta, estado[0]).inc()
+            duracion.labels(*etiquetas).observe(segundos)
+            tiempo_db.labels(*etiquetas).observe(medicion.db)
+            tiempo_python.labels(*etiquetas).observe(max(segundos - medicion.db, 0))
+            filas.labels(*etiquetas).observe(medicion.filas)
+            bytes_respuesta.labels(*etiquetas).observe(total_bytes)
+
+        try:
+            cuerpo = self.wsgi_app(environ, registrar_inicio)
+        except BaseException:
+            registrar(0)
+            raise
+        return _CuerpoMedido(cuerpo, registrar)
+
+
+def instalar(app):
+    """Mide todas las rutas de `app`."""
+
+    @app.before_request
+    def _anotar_ruta():
+        if request.url_rule is not None:
+            request.environ[CLAVE_MEDICION].ruta = request.url_rule.rule
+
+    app.wsgi_app = MiddlewareMetricas(app.wsgi_app)
+
+
+def autorizado(cabecera):
+    token = os.environ.get('METRICAS_TOKEN')
+    return not token or cabecera == f'Bearer {token}'
+
+
+def exposicion():
+    """(cuerpo, content_type) para GET /metrics, sumando todos los workers."""
+    if DIRECTORIO:
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+    else:
+        from prometheus_client import REGISTRY as registro
+    return generate_latest(registro), CONTENT_TYPE_LATEST
+
@@ -0,0 +1,265 @@
+"""
+Migraciones versionadas del esquema PostgreSQL.
+
+Cada archivo migrations/NNNN_nombre.sql es una versión. Las versiones
+aplicadas quedan registradas en la tabla schema_version, así que cada
+migración se ejecuta una sola vez. Un advisory lock evita que dos procesos
+migren a la vez.
+
+Por defecto una migración corre en una transacción. Si su primera línea es
+`-- sin-transaccion` (p. ej. para CREATE INDEX CONCURRENTLY), cada sentencia
+se ejecuta por separado en autocommit; un índice que quedó inválido por un
+intento anterior se elimina y se vuelve a crear.
+
+Los workers de gunicorn no ejecutan DDL al arrancar: sólo comparan la
+versión (ver server.py). El despliegue corre antes, como paso previo
+(preDeployCommand en render.yaml, release en Procfile) y no en cada
+arranque del servicio:
+
+    python migraciones.py aplicar      # aplica las pendientes y asegura el usuario admin
+    python migraciones.py estado       # muestra aplicadas y pendientes
+    python migraciones.py admin        # crea el admin o actualiza su contraseña
+
+Variables de entorno:
+    DATABASE_URL                URL de conexión (obligatoria)
+    ADMIN_PASSWORD              Contraseña del usuario admin (ver `admin`)
+    MIGRACIONES_LOCK_TIMEOUT    lock_timeout para las migraciones transaccionales (defecto 10s)
+"""
+
+import argparse
+import logging
+import os
+import re
+import sys
+import time
+from collections import namedtuple
+
+import psycopg2
+
+from conexiones import parametros_conexion
+import registro
+
+log = logging.getLogger(__name__)
+
+DIRECTORIO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+PATRON_ARCHIVO = re.compile(r'^(\d{4})_(\w+)\.sql$')
+MARCA_SIN_TRANSACCION = '-- sin-transaccion'
+PATRON_INDICE_CONCURRENTE = re.compile(
+    r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)', re.IGNORECASE)
+PATRON_DOLAR = re.compile(r'\$\w*\$')
+CLAVE_LOCK = 'despacho_gas.migraciones'
+ADMIN_PASSWORD_DEFECTO = 'admin123'
+
+Migracion = namedtuple('Migracion', 'version nombre sql transaccional')
+
+
+def cargar_migraciones(directorio=DIRECTORIO):
+    migraciones = []
+    for archivo in sorted(os.listdir(directorio)):
+        coincidencia = PATRON_ARCHIVO.match(archivo)
+        if not coincidencia:
+            continue
+        with open(os.path.join(directorio, archivo), encoding='utf-8') as f:
+            sql = f.read()
+        migraciones.append(Migracion(
+            version=int(coincidencia.group(1)),
+            nombre=coincidencia.group(2),
+            sql=sql,
+            transaccional=not sql.lstrip().startswith(MARCA_SIN_TRANSACCION),
+        ))
+    versiones = [m.version for m in migraciones]
+    if len(versiones) != len(set(versiones)):
+        raise RuntimeError(f'Hay migraciones con la misma versión en {directorio}')
+    return migraciones
+
+
+def version_esperada(directorio=DIRECTORIO):
+    """Última versión disponible, sólo a partir de los nombres de archivo."""
+    versiones = [int(c.group(1)) for c in map(PATRON_ARCHIVO.match, os.listdir(directorio)) if c]
+    return max(versiones, default=0)
+
+
+def version_actual(cursor):
+    """Versión más alta aplicada (0 si schema_version todavía no existe)."""
+    cursor.execute("SELECT to_regclass('schema_version') IS NOT NULL AS existe")
+    if not cursor.fetchone()['existe']:
+        return 0
+    cursor.execute('SELECT COALESCE(MAX(version), 0) AS version FROM schema_version')
+    return cursor.fetchone()['version']
+
+
+def versiones_aplicadas(cursor):
+    """Versiones registradas; no crea nada si schema_version todavía no existe."""
+    cursor.execute("SELECT to_regclass('schema_version') IS NOT NULL AS existe")
+    if not cursor.fetchone()['existe']:
+        return set()
+    cursor.execute('SELECT version FROM schema_version')
+    return {fila['version'] for fila in cursor.fetchall()}
+
+
+def pendientes(conn):
+    cursor = conn.cursor()
+    aplicadas = versiones_aplicadas(cursor)
+    return [m for m in cargar_migraciones() if m.version not in aplicadas]
+
+
+def _sentencias(sql):
+    """
+    Divide un script en sentencias (sólo para migraciones sin transacción).
+    Una sentencia termina en `;` al final de línea; dentro de un cuerpo
+    $$ ... $$ (DO, CREATE FUNCTION) los `;` no cortan.
+    """
+    sentencias = []
+    actual = []
+    en_cuerpo = False
+    for linea in sql.splitlines():
+        if not actual and (not linea.strip() or linea.strip().startswith('--')):
+            continue
+        actual.append(linea)
+        if len(PATRON_DOLAR.findall(linea)) % 2:
+            en_cuerpo = not en_cuerpo
+        if not en_cuerpo and linea.rstrip().endswith(';'):
+            sentencias.append('\n'.join(actual).rstrip().rstrip(';'))
+            actual = []
+    if ''.join(actual).strip():
+        sentencias.append('\n'.join(actual).rstrip().rstrip(';'))
+    return sentencias
+
+
+def _descartar_indice_invalido(cursor, nombre):
+    cursor.execute('''
+        SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s AND NOT i.indisvalid
+    ''', (nombre,))
+    if cursor.fetchone():
+        log.warning("   ⚠️ Índice %s inválido de un intento anterior: se vuelve a crear", nombre)
+        cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {nombre}')
+
+
+def _aplicar_una(conn, migracion):
+    cursor = conn.cursor()
+    inicio = time.monotonic()
+    if migracion.transaccional:
+        conn.autocommit = False
+        try:
+            cursor.execute("SET LOCAL lock_timeout = %s",
+                           (os.environ.get('MIGRACIONES_LOCK_TIMEOUT', '10s'),))
+            cursor.execute(migracion.sql)
+            cursor.execute('INSERT INTO schema_version (version, nombre, duracion_ms) VALUES (%s, %s, %s)',
+                           (migracion.version, migracion.nombre, int((time.monotonic() - inicio) * 1000)))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.autocommit = True
+    else:
+        for sentencia in _sentencias(migracion.sql):
+            indice = PATRON_INDICE_CONCURRENTE.search(sentencia)
+            if indice:
+                _descartar_indice_invalido(cursor, indice.group(1))
+            cursor.execute(sentencia)
+        cursor.execute('INSERT INTO schema_version (version, nombre, duracion_ms) VALUES (%s, %s, %s)',
+                       (migracion.version, migracion.nombre, int((time.monotonic() - inicio) * 1000)))
+    return time.monotonic() - inicio
+
+
+def aplicar(hasta=None):
+    """Aplica las migraciones pendientes en orden. Devuelve las versiones aplicadas."""
+    conn = psycopg2.connect(**parametros_conexion())
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT pg_advisory_lock(hashtext(%s))', (CLAVE_LOCK,))
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                nombre VARCHAR(255) NOT NULL,
+                aplicada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                duracion_ms INTEGER
+            )
+        ''')
+        aplicadas = []
+        for migracion in pendientes(conn):
+            if hasta is not None and migracion.version > hasta:
+                break
+            log.info("🔧 Aplicando migración %04d_%s%s...", migracion.version, migracion.nombre,
+                     '' if migracion.transaccional else ' (sin transacción)')
+            segundos = _aplicar_una(conn, migracion)
+            log.info("   ✅ %04d_%s en %.2fs", migracion.version, migracion.nombre, segundos)
+            aplicadas.append(migracion.version)
+        if not aplicadas:
+            log.info("✅ Esquema al día")
+        return aplicadas
+    finally:
+        try:
+            cursor.execute('SELECT pg_advisory_unlock(hashtext(%s))', (CLAVE_LOCK,))
+        finally:
+            conn.close()
+
+
+def asegurar_admin(actualizar_password=False):
+    """Crea el usuario admin si no existe; con actualizar_password fija ADMIN_PASSWORD."""
+    password = os.environ.get('ADMIN_PASSWORD', ADMIN_PASSWORD_DEFECTO)
+    conn = psycopg2.connect(**parametros_conexion())
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id FROM usuarios WHERE usuario = %s', ('admin',))
+        if cursor.fetchone():
+            if actualizar_password:
+                cursor.execute('UPDATE usuarios SET contrasena = %s WHERE usuario = %s', (password, 'admin'))
+                log.info("Usuario admin actualizado con contraseña configurada")
+        else:
+            cursor.execute(
+                'INSERT INTO usuarios (usuario, contrasena, nombre, es_admin) VALUES (%s, %s, %s, %s)',
+                ('admin', password, 'Administrador', True)
+            )
+            log.info("Usuario admin creado con contraseña configurada")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def estado():
+    conn = psycopg2.connect(**parametros_conexion())
+    try:
+        cursor = conn.cursor()
+        registradas = {}
+        if versiones_aplicadas(cursor):
+            cursor.execute('SELECT version, aplicada_en, duracion_ms FROM schema_version')
+            registradas = {fila['version']: fila for fila in cursor.fetchall()}
+        for migracion in cargar_migraciones():
+            fila = registradas.get(migracion.version)
+            situacion = (f"aplicada {fila['aplicada_en']:%Y-%m-%d %H:%M} ({fila['duracion_ms']} ms)"
+                         if fila else 'PENDIENTE')
+            print(f"{migracion.version:04d}_{migracion.nombre:<30} {situacion}")
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migraciones del esquema PostgreSQL')
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    p_aplicar = comandos.add_parser('aplicar', help='aplicar migraciones pendientes')
+    p_aplicar.add_argument('--hasta', type=int, help='aplicar sólo hasta esta versión')
+    comandos.add_parser('estado', help='mostrar migraciones aplicadas y pendientes')
+    comandos.add_parser('admin', help='crear el usuario admin o actualizar su contraseña (ADMIN_PASSWORD)')
+    args = parser.parse_args()
+    registro.configurar(formato='texto')
+
+    if not os.environ.get('DATABASE_URL'):
+        print("ERROR: DATABASE_URL no esta configurada")
+        sys.exit(1)
+
+    if args.comando == 'aplicar':
+        aplicar(hasta=args.hasta)
+        # Sincroniza la contraseña sólo si se configuró explícitamente
+        asegurar_admin(actualizar_password='ADMIN_PASSWORD' in os.environ)
+    elif args.comando == 'estado':
+        estado()
+    elif args.comando == 'admin':
+        asegurar_admin(actualizar_password=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+-- Esquema base: las tablas que creaba init_db() en server.py.
+-- Usa IF NOT EXISTS para poder marcar como aplicada una base de datos que
+-- ya tenía estas tablas antes de existir schema_version.
+
+CREATE TABLE IF NOT EXISTS usuarios (
+    id SERIAL PRIMARY KEY,
+    usuario VARCHAR(255) UNIQUE NOT NULL,
+    contrasena VARCHAR(255) NOT NULL,
+    nombre VARCHAR(255) NOT NULL,
+    es_admin BOOLEAN DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS clientes (
+    id SERIAL PRIMARY KEY,
+    nombre VARCHAR(255) NOT NULL,
+    direccion TEXT,
+    telefono VARCHAR(50),
+    cedula VARCHAR(50) UNIQUE,
+    rif VARCHAR(50),
+    placa VARCHAR(50),
+    categoria VARCHAR(100) DEFAULT 'Persona Natural',
+    subcategoria VARCHAR(100),
+    exonerado BOOLEAN DEFAULT FALSE,
+    huella BOOLEAN DEFAULT FALSE,
+    litros_mes REAL DEFAULT 0,
+    litros_disponibles REAL DEFAULT 0,
+    litros_mes_gasolina REAL DEFAULT 0,
+    litros_mes_gasoil REAL DEFAULT 0,
+    litros_disponibles_gasolina REAL DEFAULT 0,
+    litros_disponibles_gasoil REAL DEFAULT 0,
+    activo BOOLEAN DEFAULT TRUE
+);
+
+CREATE TABLE IF NOT EXISTS retiros (
+    id SERIAL PRIMARY KEY,
+    cliente_id INTEGER NOT NULL,
+    fecha DATE NOT NULL,
+    hora TIME NOT NULL DEFAULT '00:00:00',
+    litros REAL NOT NULL,
+    usuario_id INTEGER NOT NULL,
+    tipo_combustible VARCHAR(20) DEFAULT 'gasoil',
+    codigo_ticket INTEGER,
+    FOREIGN KEY (cliente_id) REFERENCES clientes (id),
+    FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
+);
+
+CREATE TABLE IF NOT EXISTS sistema_config (
+    id INTEGER PRIMARY KEY CHECK(id = 1),
+    retiros_bloqueados INTEGER NOT NULL DEFAULT 0,
+    limite_diario_gasolina REAL DEFAULT 2000,
+    fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS subclientes (
+    id SERIAL PRIMARY KEY,
+    cliente_padre_id INTEGER NOT NULL,
+    nombre VARCHAR(255) NOT NULL,
+    cedula VARCHAR(50),
+    placa VARCHAR(50),
+    litros_mes_gasolina REAL DEFAULT 0,
+    litros_mes_gasoil REAL DEFAULT 0,
+    litros_disponibles_gasolina REAL DEFAULT 0,
+    litros_disponibles_gasoil REAL DEFAULT 0,
+    activo BOOLEAN DEFAULT TRUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (cliente_padre_id) REFERENCES clientes (id)
+);
+
+CREATE TABLE IF NOT EXISTS agendamientos (
+    id SERIAL PRIMARY KEY,
+    cliente_id INTEGER NOT NULL,
+    subcliente_id INTEGER,
+    tipo_combustible VARCHAR(20) NOT NULL DEFAULT 'gasolina',
+    litros REAL NOT NULL,
+    fecha_agendada DATE NOT NULL,
+    codigo_ticket INTEGER,
+    estado VARCHAR(20) NOT NULL DEFAULT 'pendiente',
+    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (cliente_id) REFERENCES clientes (id),
+    FOREIGN KEY (subcliente_id) REFERENCES subclientes (id)
+);
+
+CREATE TABLE IF NOT EXISTS limites_diarios (
+    id SERIAL PRIMARY KEY,
+    fecha DATE NOT NULL,
+    tipo_combustible VARCHAR(20) NOT NULL DEFAULT 'gasolina',
+    litros_agendados REAL DEFAULT 0,
+    litros_procesados REAL DEFAULT 0,
+    UNIQUE(fecha, tipo_combustible)
+);
+
+CREATE TABLE IF NOT EXISTS inventario (
+    id SERIAL PRIMARY KEY,
+    tipo_combustible VARCHAR(20) NOT NULL CHECK(tipo_combustible IN ('gasoil', 'gasolina')),
+    litros_ingresados REAL NOT NULL,
+    litros_disponibles REAL NOT NULL,
+    fecha_ingreso TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    usuario_id INTEGER,
+    observaciones TEXT,
+    FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
+);
+
+-- Antes se agregaba con un ALTER TABLE dentro de try/except
+ALTER TABLE sistema_config ADD COLUMN IF NOT EXISTS fecha_ultimo_reset DATE;
+
+UPDATE sistema_config SET fecha_ultimo_reset = CURRENT_DATE - INTERVAL '1 day' WHERE fecha_ultimo_reset IS NULL;
+
+INSERT INTO sistema_config (id, retiros_bloqueados) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
@@ -0,0 +1,16 @@
+-- Contadores de tickets por día. Se siembran con el máximo código ya
+-- emitido en cada fecha para continuar la numeración.
+
+CREATE TABLE IF NOT EXISTS ticket_counters (
+    fecha DATE NOT NULL,
+    tipo VARCHAR(20) NOT NULL,
+    ultimo INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, tipo)
+);
+
+INSERT INTO ticket_counters (fecha, tipo, ultimo)
+SELECT fecha_agendada, 'agendamiento', MAX(codigo_ticket)
+FROM agendamientos
+WHERE codigo_ticket IS NOT NULL
+GROUP BY fecha_agendada
+ON CONFLICT (fecha, tipo) DO NOTHING;
@@ -0,0 +1,16 @@
+-- Existencia actual por tipo de combustible. `inventario` queda como libro
+-- de movimientos (sólo INSERT); esta tabla se actualiza en la misma
+-- sentencia que inserta cada movimiento.
+
+CREATE TABLE IF NOT EXISTS inventario_actual (
+    tipo_combustible VARCHAR(20) PRIMARY KEY CHECK(tipo_combustible IN ('gasoil', 'gasolina')),
+    litros_disponibles REAL NOT NULL DEFAULT 0,
+    ultimo_movimiento_id INTEGER,
+    fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO inventario_actual (tipo_combustible, litros_disponibles, ultimo_movimiento_id)
+SELECT DISTINCT ON (tipo_combustible) tipo_combustible, litros_disponibles, id
+FROM inventario
+ORDER BY tipo_combustible, id DESC
+ON CONFLICT (tipo_combustible) DO NOTHING;
@@ -0,0 +1,37 @@
+-- Resumen diario de consumo para /api/estadisticas/retiros. Se mantiene
+-- incrementalmente en cada retiro y entrega; aquí se calcula a partir del
+-- histórico. Si la tabla ya existía (creada por init_db) sus filas se
+-- conservan.
+
+CREATE TABLE IF NOT EXISTS consumo_diario (
+    fecha DATE NOT NULL,
+    tipo_combustible VARCHAR(20) NOT NULL,
+    litros DOUBLE PRECISION NOT NULL DEFAULT 0,
+    clientes INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, tipo_combustible)
+);
+
+CREATE TABLE IF NOT EXISTS consumo_diario_clientes (
+    fecha DATE NOT NULL,
+    tipo_combustible VARCHAR(20) NOT NULL,
+    cliente_id INTEGER NOT NULL,
+    PRIMARY KEY (fecha, tipo_combustible, cliente_id)
+);
+
+CREATE TEMP TABLE consumo_historico ON COMMIT DROP AS
+SELECT fecha, COALESCE(tipo_combustible, 'gasoil') AS tipo_combustible, cliente_id, litros
+FROM retiros
+UNION ALL
+SELECT fecha_agendada, tipo_combustible, cliente_id, litros
+FROM agendamientos
+WHERE estado = 'entregado';
+
+INSERT INTO consumo_diario_clientes (fecha, tipo_combustible, cliente_id)
+SELECT DISTINCT fecha, tipo_combustible, cliente_id FROM consumo_historico
+ON CONFLICT DO NOTHING;
+
+INSERT INTO consumo_diario (fecha, tipo_combustible, litros, clientes)
+SELECT fecha, tipo_combustible, SUM(litros), COUNT(DISTINCT cliente_id)
+FROM consumo_historico
+GROUP BY fecha, tipo_combustible
+ON CONFLICT (fecha, tipo_combustible) DO NOTHING;
@@ -0,0 +1,12 @@
+-- Avance del reset diario por lotes (ver reset_diario.py)
+
+CREATE TABLE IF NOT EXISTS reset_diario_progreso (
+    fecha DATE NOT NULL,
+    tabla VARCHAR(30) NOT NULL,
+    ultimo_id INTEGER NOT NULL DEFAULT 0,
+    filas INTEGER NOT NULL DEFAULT 0,
+    iniciado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    completado_en TIMESTAMP,
+    PRIMARY KEY (fecha, tabla)
+);
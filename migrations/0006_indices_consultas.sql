@@ -0,0 +1,23 @@
+-- sin-transaccion
+-- Índices de las rutas más consultadas. CONCURRENTLY no bloquea escrituras
+-- en una base de datos en uso, pero no puede ejecutarse dentro de una
+-- transacción: el ejecutor aplica cada sentencia por separado.
+
+-- Historial paginado de retiros (keyset sobre fecha, hora, id). Cubre
+-- también las búsquedas por retiros(fecha, hora).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_retiros_fecha_hora_id ON retiros (fecha, hora, id);
+
+-- Retiros de un cliente; cubre también retiros(cliente_id, fecha).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_retiros_cliente_fecha_hora_id ON retiros (cliente_id, fecha, hora, id);
+
+-- Agendamientos del día ordenados por ticket (/api/agendamientos/dia/<fecha>)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_agendamientos_fecha_ticket ON agendamientos (fecha_agendada, codigo_ticket);
+
+-- Agendamientos y tickets de un cliente
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_agendamientos_cliente_fecha ON agendamientos (cliente_id, fecha_agendada);
+
+-- Búsqueda de clientes por teléfono
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_clientes_telefono ON clientes (telefono);
+
+-- Subclientes de un cliente
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_subclientes_cliente_padre ON subclientes (cliente_padre_id);
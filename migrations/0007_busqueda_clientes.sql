@@ -0,0 +1,114 @@
+-- Búsqueda de clientes por texto completo (ver busqueda_clientes.py).
+-- Se usa la configuración 'simple' (sin diccionario ni stemming) porque se
+-- buscan nombres propios e identificadores, y no requiere extensiones.
+
+-- Minúsculas sin acentos
+CREATE OR REPLACE FUNCTION busqueda_normalizar(texto TEXT) RETURNS TEXT
+LANGUAGE SQL IMMUTABLE PARALLEL SAFE AS $$
+    SELECT translate(lower(COALESCE(texto, '')),
+                     'áàäâéèëêíìïîóòöôúùüûñç', 'aaaaeeeeiiiioooouuuunc')
+$$;
+
+-- Identificador sin separadores: 'V-12.345.678' -> 'v12345678'. Se usa
+-- translate y no expresiones regulares porque corre en cada alta.
+CREATE OR REPLACE FUNCTION busqueda_compactar(texto TEXT) RETURNS TEXT
+LANGUAGE SQL IMMUTABLE PARALLEL SAFE AS $$
+    SELECT translate(busqueda_normalizar(texto), ' -./_,#()', '')
+$$;
+
+-- Documento de búsqueda: nombre e identificadores con peso A (la cédula y
+-- la placa también sin separadores y la cédula sólo con sus dígitos), la
+-- dirección con peso D. El parser de to_tsvector separa las palabras.
+CREATE OR REPLACE FUNCTION clientes_documento_busqueda(
+    nombre TEXT, cedula TEXT, placa TEXT, telefono TEXT, direccion TEXT
+) RETURNS tsvector
+LANGUAGE SQL IMMUTABLE PARALLEL SAFE AS $$
+    SELECT setweight(to_tsvector('simple',
+               busqueda_normalizar(nombre) || ' ' ||
+               busqueda_compactar(cedula) || ' ' ||
+               translate(busqueda_compactar(cedula), 'abcdefghijklmnopqrstuvwxyz', '') || ' ' ||
+               busqueda_compactar(placa) || ' ' ||
+               busqueda_compactar(telefono)), 'A')
+        || setweight(to_tsvector('simple', busqueda_normalizar(direccion)), 'D')
+$$;
+
+-- El documento se guarda calculado en una tabla aparte (no como columna de
+-- clientes, para no cambiar los SELECT * de la API), sólo para los clientes
+-- activos y junto con el nombre: la búsqueda ordena por relevancia y nombre
+-- sin volver a calcular documentos ni leer clientes fila por fila, y sólo
+-- une con clientes las filas que devuelve. No lleva clave foránea (su
+-- chequeo por fila duplicaba el costo de las importaciones masivas); las
+-- bajas, que son raras (los clientes se desactivan), se limpian con un
+-- trigger por fila.
+CREATE TABLE IF NOT EXISTS clientes_busqueda (
+    cliente_id INTEGER PRIMARY KEY,
+    nombre VARCHAR(255) NOT NULL,
+    documento TSVECTOR NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_clientes_busqueda_documento ON clientes_busqueda USING gin (documento);
+
+-- Altas: un trigger por sentencia con tabla de transición, para que las
+-- importaciones masivas no paguen un trigger por fila.
+CREATE OR REPLACE FUNCTION clientes_busqueda_insertar() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO clientes_busqueda (cliente_id, nombre, documento)
+    SELECT id, nombre, clientes_documento_busqueda(nombre, cedula, placa, telefono, direccion)
+    FROM nuevos
+    WHERE activo
+    ON CONFLICT (cliente_id) DO UPDATE SET nombre = EXCLUDED.nombre, documento = EXCLUDED.documento;
+    RETURN NULL;
+END
+$$;
+
+-- Cambios: sólo cuando cambia de verdad alguna columna buscable o el estado
+-- activo (el reset diario y los retiros, que sólo tocan litros, no lo
+-- disparan, ni una reimportación con los mismos datos).
+CREATE OR REPLACE FUNCTION clientes_busqueda_actualizar() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF NEW.activo THEN
+        INSERT INTO clientes_busqueda (cliente_id, nombre, documento)
+        VALUES (NEW.id, NEW.nombre,
+                clientes_documento_busqueda(NEW.nombre, NEW.cedula, NEW.placa, NEW.telefono, NEW.direccion))
+        ON CONFLICT (cliente_id) DO UPDATE SET nombre = EXCLUDED.nombre, documento = EXCLUDED.documento;
+    ELSE
+        DELETE FROM clientes_busqueda WHERE cliente_id = NEW.id;
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION clientes_busqueda_borrar() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    DELETE FROM clientes_busqueda WHERE cliente_id = OLD.id;
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_clientes_busqueda_insertar ON clientes;
+CREATE TRIGGER trg_clientes_busqueda_insertar
+    AFTER INSERT ON clientes
+    REFERENCING NEW TABLE AS nuevos
+    FOR EACH STATEMENT EXECUTE FUNCTION clientes_busqueda_insertar();
+
+DROP TRIGGER IF EXISTS trg_clientes_busqueda_actualizar ON clientes;
+CREATE TRIGGER trg_clientes_busqueda_actualizar
+    AFTER UPDATE OF nombre, cedula, placa, telefono, direccion, activo ON clientes
+    FOR EACH ROW
+    WHEN ((OLD.nombre, OLD.cedula, OLD.placa, OLD.telefono, OLD.direccion, OLD.activo)
+          IS DISTINCT FROM (NEW.nombre, NEW.cedula, NEW.placa, NEW.telefono, NEW.direccion, NEW.activo))
+    EXECUTE FUNCTION clientes_busqueda_actualizar();
+
+DROP TRIGGER IF EXISTS trg_clientes_busqueda_borrar ON clientes;
+CREATE TRIGGER trg_clientes_busqueda_borrar
+    AFTER DELETE ON clientes
+    FOR EACH ROW EXECUTE FUNCTION clientes_busqueda_borrar();
+
+INSERT INTO clientes_busqueda (cliente_id, nombre, documento)
+SELECT id, nombre, clientes_documento_busqueda(nombre, cedula, placa, telefono, direccion)
+FROM clientes
+WHERE activo = TRUE
+ON CONFLICT (cliente_id) DO UPDATE SET nombre = EXCLUDED.nombre, documento = EXCLUDED.documento;
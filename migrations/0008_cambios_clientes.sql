@@ -0,0 +1,41 @@
+-- Aviso de cambios en clientes para el modelo en memoria de cada worker
+-- (ver modelo_clientes.py). Un trigger por sentencia con tabla de
+-- transición publica en el canal 'clientes_cambios' los ids afectados, en
+-- grupos de 500 para no pasar el límite de 8000 bytes de NOTIFY. Como todo
+-- NOTIFY, sólo se entrega si la transacción se confirma.
+
+CREATE OR REPLACE FUNCTION clientes_notificar_cambios() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    ids INTEGER[];
+BEGIN
+    FOR ids IN
+        SELECT array_agg(id ORDER BY id)
+        FROM (SELECT id, (row_number() OVER (ORDER BY id) - 1) / 500 AS grupo FROM filas) f
+        GROUP BY grupo
+    LOOP
+        PERFORM pg_notify('clientes_cambios', json_build_object(
+            'op', CASE TG_OP WHEN 'DELETE' THEN 'borrar' ELSE 'cambiar' END,
+            'ids', ids)::text);
+    END LOOP;
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_clientes_cambios_insertar ON clientes;
+CREATE TRIGGER trg_clientes_cambios_insertar
+    AFTER INSERT ON clientes
+    REFERENCING NEW TABLE AS filas
+    FOR EACH STATEMENT EXECUTE FUNCTION clientes_notificar_cambios();
+
+DROP TRIGGER IF EXISTS trg_clientes_cambios_actualizar ON clientes;
+CREATE TRIGGER trg_clientes_cambios_actualizar
+    AFTER UPDATE ON clientes
+    REFERENCING NEW TABLE AS filas
+    FOR EACH STATEMENT EXECUTE FUNCTION clientes_notificar_cambios();
+
+DROP TRIGGER IF EXISTS trg_clientes_cambios_borrar ON clientes;
+CREATE TRIGGER trg_clientes_cambios_borrar
+    AFTER DELETE ON clientes
+    REFERENCING OLD TABLE AS filas
+    FOR EACH STATEMENT EXECUTE FUNCTION clientes_notificar_cambios();
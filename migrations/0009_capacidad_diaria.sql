@@ -0,0 +1,22 @@
+-- Capacidad diaria de despacho en limites_diarios. Hasta ahora nadie
+-- escribía la tabla; desde esta versión cada agendamiento reserva sus litros
+-- en litros_agendados y la entrega los pasa a litros_procesados (ver
+-- crear_agendamiento y marcar_como_entregado en server.py). Aquí se
+-- calculan los totales a partir de los agendamientos existentes.
+
+UPDATE limites_diarios SET litros_agendados = 0 WHERE litros_agendados IS NULL;
+UPDATE limites_diarios SET litros_procesados = 0 WHERE litros_procesados IS NULL;
+
+ALTER TABLE limites_diarios
+    ALTER COLUMN litros_agendados SET NOT NULL,
+    ALTER COLUMN litros_procesados SET NOT NULL;
+
+INSERT INTO limites_diarios (fecha, tipo_combustible, litros_agendados, litros_procesados)
+SELECT fecha_agendada, tipo_combustible,
+       COALESCE(SUM(litros) FILTER (WHERE estado <> 'entregado'), 0),
+       COALESCE(SUM(litros) FILTER (WHERE estado = 'entregado'), 0)
+FROM agendamientos
+GROUP BY fecha_agendada, tipo_combustible
+ON CONFLICT (fecha, tipo_combustible) DO UPDATE
+SET litros_agendados = EXCLUDED.litros_agendados,
+    litros_procesados = EXCLUDED.litros_procesados;
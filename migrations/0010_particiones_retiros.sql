@@ -0,0 +1,165 @@
+-- sin-transaccion
+-- Particionado mensual (RANGE por fecha) de retiros. Ver GUIA_PARTICIONES.md.
+--
+-- La tabla existente no se copia: queda como partición retiros_historico,
+-- que cubre todo lo anterior al corte. Los pasos largos no bloquean
+-- escrituras:
+--   1. CHECK (fecha < corte) NOT VALID: sólo un bloqueo breve.
+--   2. VALIDATE CONSTRAINT: recorre la tabla sin bloquear escrituras.
+--   3. Índice único (id, fecha) CONCURRENTLY: será la clave primaria de la
+--      partición (en una tabla particionada la clave incluye la fecha).
+--   4. Corte, en una transacción corta con lock_timeout: renombra la tabla,
+--      crea la tabla particionada con sus claves foráneas e índices, adjunta
+--      la tabla vieja (el CHECK validado evita recorrerla; los índices
+--      existentes se reutilizan) y crea las particiones mensuales siguientes.
+--
+-- El corte es el primer día del mes siguiente al siguiente (o el mes
+-- siguiente a la fecha más alta ya registrada): hasta entonces los retiros
+-- nuevos también caen en retiros_historico.
+
+-- Fecha de corte: límite superior de la partición histórica, guardado en su
+-- CHECK `<tabla>_historico_rango`. NULL si no hay partición histórica.
+CREATE OR REPLACE FUNCTION particiones_corte(tabla text) RETURNS date AS $$
+    SELECT substring(pg_get_constraintdef(oid) FROM '''(\d{4}-\d{2}-\d{2})''')::date
+    FROM pg_constraint
+    WHERE conname = tabla || '_historico_rango' AND convalidated
+      AND conrelid IN (to_regclass(tabla), to_regclass(tabla || '_historico'))
+$$ LANGUAGE sql STABLE;
+
+-- Crea (si falta) la partición mensual de `tabla` que contiene `mes` y la
+-- adjunta. Se crea suelta, con un CHECK del rango, para que ATTACH PARTITION
+-- no tenga que recorrerla ni bloquear la tabla madre más que con SHARE UPDATE
+-- EXCLUSIVE (las lecturas y escrituras siguen). Devuelve el nombre de la
+-- partición creada o NULL si ya existía o si el mes es anterior al corte
+-- (lo cubre la partición histórica).
+CREATE OR REPLACE FUNCTION particiones_crear_mes(tabla text, mes date) RETURNS text AS $$
+DECLARE
+    desde date := date_trunc('month', mes)::date;
+    hasta date := (date_trunc('month', mes) + INTERVAL '1 month')::date;
+    nombre text := tabla || '_p' || to_char(mes, 'YYYYMM');
+    columna text;
+BEGIN
+    IF to_regclass(nombre) IS NOT NULL OR desde < particiones_corte(tabla) THEN
+        RETURN NULL;
+    END IF;
+    SELECT a.attname INTO columna
+    FROM pg_partitioned_table p
+    JOIN pg_attribute a ON a.attrelid = p.partrelid AND a.attnum = p.partattrs[0]
+    WHERE p.partrelid = tabla::regclass;
+    IF columna IS NULL THEN
+        RAISE EXCEPTION 'La tabla % no está particionada', tabla;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS)', nombre, tabla);
+    EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I CHECK (%I >= %L AND %I < %L)',
+                   nombre, nombre || '_rango', columna, desde, columna, hasta);
+    EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   tabla, nombre, desde, hasta);
+    RETURN nombre;
+END
+$$ LANGUAGE plpgsql;
+
+-- Paso 1: CHECK NOT VALID con el corte. No hace nada si la tabla ya está
+-- particionada o el CHECK ya existe (migración reintentada).
+CREATE OR REPLACE FUNCTION particiones_preparar(tabla text, columna text) RETURNS void AS $$
+DECLARE
+    corte date;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = tabla::regclass) <> 'r'
+       OR EXISTS (SELECT 1 FROM pg_constraint
+                  WHERE conrelid = tabla::regclass AND conname = tabla || '_historico_rango') THEN
+        RETURN;
+    END IF;
+    EXECUTE format('SELECT GREATEST(date_trunc(''month'', CURRENT_DATE) + INTERVAL ''2 months'',
+                                    date_trunc(''month'', MAX(%I)) + INTERVAL ''1 month'')::date FROM %I',
+                   columna, tabla) INTO corte;
+    PERFORM set_config('lock_timeout', '5s', true);
+    EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I CHECK (%I < %L) NOT VALID',
+                   tabla, tabla || '_historico_rango', columna, corte);
+END
+$$ LANGUAGE plpgsql;
+
+-- Paso 2
+CREATE OR REPLACE FUNCTION particiones_validar(tabla text) RETURNS void AS $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = tabla::regclass) = 'r' THEN
+        EXECUTE format('ALTER TABLE %I VALIDATE CONSTRAINT %I', tabla, tabla || '_historico_rango');
+    END IF;
+END
+$$ LANGUAGE plpgsql;
+
+-- Paso 4: el corte. Sólo cambia catálogos, así que el bloqueo dura lo que
+-- tarden las sentencias en curso sobre la tabla (lock_timeout 5s; si no lo
+-- consigue, la migración falla sin cambios y se puede reintentar).
+CREATE OR REPLACE FUNCTION particiones_convertir(tabla text, columna text, meses_adelante integer)
+RETURNS void AS $$
+DECLARE
+    historico text := tabla || '_historico';
+    corte date;
+    secuencia text;
+    fila record;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = tabla::regclass) <> 'r' THEN
+        RETURN;
+    END IF;
+    PERFORM set_config('lock_timeout', '5s', true);
+    EXECUTE format('LOCK TABLE %I IN ACCESS EXCLUSIVE MODE', tabla);
+
+    corte := particiones_corte(tabla);
+    IF corte IS NULL THEN
+        RAISE EXCEPTION 'Falta el CHECK validado %_rango en %', historico, tabla;
+    END IF;
+    secuencia := pg_get_serial_sequence(tabla, 'id');
+
+    -- La tabla vieja pasa a ser la partición histórica, con clave (id, columna)
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', tabla, historico);
+    FOR fila IN
+        SELECT conname FROM pg_constraint WHERE conrelid = historico::regclass AND contype = 'p'
+    LOOP
+        EXECUTE format('ALTER TABLE %I DROP CONSTRAINT %I', historico, fila.conname);
+    END LOOP;
+    EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I PRIMARY KEY USING INDEX %I',
+                   historico, historico || '_pkey', tabla || '_id_' || columna);
+    FOR fila IN
+        SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = historico::regclass AND c.relname <> historico || '_pkey'
+    LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', fila.relname, left(fila.relname, 52) || '_historico');
+    END LOOP;
+
+    -- Tabla particionada con las mismas columnas, claves foráneas e índices
+    -- (no únicos); ATTACH reutiliza los índices equivalentes de la histórica
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS) PARTITION BY RANGE (%I)',
+                   tabla, historico, columna);
+    EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (id, %I)', tabla, columna);
+    FOR fila IN
+        SELECT conname, pg_get_constraintdef(oid) AS definicion
+        FROM pg_constraint WHERE conrelid = historico::regclass AND contype = 'f'
+    LOOP
+        EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I %s', tabla, fila.conname, fila.definicion);
+    END LOOP;
+    FOR fila IN
+        SELECT c.relname, substring(pg_get_indexdef(i.indexrelid) FROM ' USING .*$') AS definicion
+        FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = historico::regclass AND NOT i.indisunique AND i.indisvalid
+    LOOP
+        EXECUTE format('CREATE INDEX %I ON %I %s', replace(fila.relname, '_historico', ''), tabla, fila.definicion);
+    END LOOP;
+    IF secuencia IS NOT NULL THEN
+        EXECUTE format('ALTER SEQUENCE %s OWNED BY %I.id', secuencia, tabla);
+    END IF;
+
+    EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (MINVALUE) TO (%L)',
+                   tabla, historico, corte);
+    FOR i IN 0..meses_adelante LOOP
+        PERFORM particiones_crear_mes(tabla, (corte + make_interval(months => i))::date);
+    END LOOP;
+END
+$$ LANGUAGE plpgsql;
+
+SELECT particiones_preparar('retiros', 'fecha');
+
+SELECT particiones_validar('retiros');
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS retiros_id_fecha ON retiros (id, fecha);
+
+SELECT particiones_convertir('retiros', 'fecha', 3);
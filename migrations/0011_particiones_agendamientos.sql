@@ -0,0 +1,12 @@
+-- sin-transaccion
+-- Particionado mensual (RANGE por fecha_agendada) de agendamientos, con los
+-- mismos pasos que 0010_particiones_retiros.sql. La tabla existente queda
+-- como partición agendamientos_historico.
+
+SELECT particiones_preparar('agendamientos', 'fecha_agendada');
+
+SELECT particiones_validar('agendamientos');
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS agendamientos_id_fecha_agendada ON agendamientos (id, fecha_agendada);
+
+SELECT particiones_convertir('agendamientos', 'fecha_agendada', 3);
@@ -0,0 +1,10 @@
+-- Totales por cliente de los retiros movidos al archivo frío (ver
+-- archivo.py). /api/clientes/lista los suma a los de la tabla retiros para
+-- que el total de retiros de cada cliente no cambie al archivar.
+
+CREATE TABLE IF NOT EXISTS retiros_archivados_clientes (
+    cliente_id INTEGER PRIMARY KEY,
+    retiros INTEGER NOT NULL DEFAULT 0,
+    litros DOUBLE PRECISION NOT NULL DEFAULT 0,
+    ultimo_retiro DATE
+);
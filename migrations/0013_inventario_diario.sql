@@ -0,0 +1,22 @@
+-- sin-transaccion
+-- Resumen diario del libro de inventario (ver libro_inventario.py). Cada
+-- agendamiento y retiro anota una salida en `inventario`; los días cerrados
+-- se resumen aquí y, pasado INVENTARIO_COMPACTAR_DIAS, sus movimientos se
+-- reemplazan por un solo movimiento por día y combustible con los mismos
+-- totales. La tabla se llena en la primera ejecución de libro_inventario.py.
+
+CREATE TABLE IF NOT EXISTS inventario_diario (
+    fecha DATE NOT NULL,
+    tipo_combustible VARCHAR(20) NOT NULL,
+    movimientos INTEGER NOT NULL,
+    entradas DOUBLE PRECISION NOT NULL,
+    salidas DOUBLE PRECISION NOT NULL,
+    litros_disponibles DOUBLE PRECISION NOT NULL,   -- existencia al cierre del día
+    ultimo_movimiento_id INTEGER NOT NULL,
+    compactado BOOLEAN NOT NULL DEFAULT FALSE,      -- el libro ya sólo tiene el resumen
+    PRIMARY KEY (fecha, tipo_combustible)
+);
+
+-- Historial paginado de inventario (keyset sobre fecha_ingreso, id) y
+-- movimientos de un día
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_inventario_fecha_id ON inventario (fecha_ingreso, id);
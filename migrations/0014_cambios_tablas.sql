@@ -0,0 +1,29 @@
+-- Aviso de cambios por tabla para la caché de respuestas y los ETag (ver
+-- cambios.py). Un trigger por sentencia publica el nombre de la tabla en
+-- el canal 'cambios_tablas', así también cuentan las escrituras hechas
+-- fuera del servidor (scripts, psql, cron, otra instancia). PostgreSQL
+-- agrupa los avisos idénticos de una transacción y sólo los entrega si se
+-- confirma. En las tablas particionadas el trigger va en la tabla padre.
+
+CREATE OR REPLACE FUNCTION cambios_tablas_notificar() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('cambios_tablas', TG_TABLE_NAME);
+    RETURN NULL;
+END
+$$;
+
+DO $$
+DECLARE
+    tabla TEXT;
+BEGIN
+    FOREACH tabla IN ARRAY ARRAY['clientes', 'subclientes', 'retiros', 'agendamientos',
+                                 'inventario', 'limites_diarios', 'sistema_config', 'usuarios']
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_' || tabla || '_cambios_tablas', tabla);
+        EXECUTE format('CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION cambios_tablas_notificar()',
+                       'trg_' || tabla || '_cambios_tablas', tabla);
+    END LOOP;
+END
+$$;
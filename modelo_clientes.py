@@ -0,0 +1,377 @@
+"""
+Modelo en memoria de los clientes activos, uno por worker.
+
+El login por cédula, la consulta por teléfono o id, /api/clientes/simple y
+la validación de saldo de los agendamientos leen siempre las mismas pocas
+miles de filas de clientes. Cada worker guarda una copia compacta (una
+tupla por cliente en una lista de slots) con índices por id, cédula,
+teléfono y placa, y la sirve sin ir a PostgreSQL.
+
+La copia se mantiene al día con los avisos del canal 'clientes_cambios'
+(trigger de migrations/0008_cambios_clientes.sql): cada aviso trae los ids
+cambiados y el modelo vuelve a leer sólo esas filas. Si se pierden avisos
+(reconexión de la escucha, cola desbordada, error al aplicar) o pasa
+MODELO_RESYNC_SEG, recarga todo. Mientras no está al día, `disponible()`
+devuelve None y las rutas consultan PostgreSQL como antes.
+
+Variables de entorno:
+    MODELO_CLIENTES       1 (defecto) para usar el modelo, 0 para leer siempre de PostgreSQL
+    MODELO_RESYNC_SEG     Recarga completa de respaldo (defecto 600)
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+import unicodedata
+
+import psycopg2
+import psycopg2.extensions
+
+from conexiones import parametros_conexion
+from eventos import Difusor
+
+log = logging.getLogger(__name__)
+
+CANAL = 'clientes_cambios'
+ACTIVO = os.environ.get('MODELO_CLIENTES', '1') == '1'
+RESYNC_SEG = float(os.environ.get('MODELO_RESYNC_SEG', 600))
+REVISION_SEG = 60      # sin avisos: revisar cambio de mes y recarga de respaldo
+COLA_MAX = 1000
+
+# Las mismas columnas que `SELECT c.*, ... AS litros_retirados_mes` de
+# obtener_cliente: la fila del modelo sirve tal cual como respuesta.
+SQL_FILAS = '''
+    SELECT c.*, r.litros AS litros_retirados_mes
+    FROM clientes c
+    LEFT JOIN (
+        SELECT cliente_id, SUM(litros) AS litros
+        FROM retiros
+        WHERE fecha >= DATE_TRUNC('month', CURRENT_DATE)::date
+          AND fecha < (DATE_TRUNC('month', CURRENT_DATE) + INTERVAL '1 month')::date
+          {filtro_retiros}
+        GROUP BY cliente_id
+    ) r ON r.cliente_id = c.id
+    WHERE c.activo = TRUE {filtro}
+'''
+SQL_TODAS = SQL_FILAS.format(filtro_retiros='', filtro='')
+SQL_POR_IDS = SQL_FILAS.format(filtro_retiros='AND cliente_id = ANY(%(ids)s)', filtro='AND c.id = ANY(%(ids)s)')
+SQL_MES = "SELECT DATE_TRUNC('month', CURRENT_DATE)::date"
+
+
+def clave_nombre(nombre):
+    """Orden por nombre sin distinguir mayúsculas ni acentos."""
+    descompuesto = unicodedata.normalize('NFKD', (nombre or '').casefold())
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+class ModeloClientes:
+    def __init__(self):
+        self.columnas = ()
+        self._filas = []          # slot -> tupla de la fila, None si está libre
+        self._libres = []
+        self._por_id = {}         # id -> slot
+        self._por_cedula = {}     # cédula -> slot
+        self._por_telefono = {}   # teléfono -> {slots}
+        self._por_placa = {}      # placa -> {slots}
+        self._lock = threading.RLock()
+        self._vistas = {}         # nombre -> (version, valor)
+        self._pid = os.getpid()
+        self._hilo = None
+        self._difusor = None
+        self._suscripcion = None
+        self.version = 0
+        self.cargado = False
+        self.mes = None
+        self.ultima_recarga = None
+        self.recargas = 0
+        self.avisos_aplicados = 0
+        self.filas_releidas = 0
+        self.errores = 0
+
+    # --- Lectura -------------------------------------------------------
+
+    @property
+    def listo(self):
+        return (self.cargado
+                and self._difusor is not None and self._difusor.conectado.is_set()
+                and not self._suscripcion.desbordada)
+
+    def _dict(self, slot):
+        return dict(zip(self.columnas, self._filas[slot]))
+
+    def _primero(self, slots):
+        # Con teléfonos o placas repetidos se devuelve el cliente más antiguo
+        return self._dict(min(slots, key=lambda s: self._filas[s][0])) if slots else None
+
+    def por_id(self, cliente_id):
+        try:
+            cliente_id = int(cliente_id)
+        except (TypeError, ValueError):
+            return None
+        with self._lock:
+            slot = self._por_id.get(cliente_id)
+            return None if slot is None else self._dict(slot)
+
+    def por_cedula(self, cedula):
+        with self._lock:
+            slot = self._por_cedula.get(cedula)
+            return None if slot is None else self._dict(slot)
+
+    def por_telefono(self, telefono):
+        with self._lock:
+            return self._primero(self._por_telefono.get(telefono))
+
+    def por_placa(self, placa):
+        with self._lock:
+            return [self._dict(s) for s in sorted(self._por_placa.get(placa, ()), key=lambda s: self._filas[s][0])]
+
+    def activos(self, columnas=None):
+        """Lista de clientes (sólo `columnas` si se indican), ordenada por nombre."""
+        with self._lock:
+            posiciones = [self.columnas.index(c) for c in (columnas or self.columnas)]
+            nombres = columnas or self.columnas
+            i_nombre = self.columnas.index('nombre')
+            filas = sorted((f for f in self._filas if f is not None), key=lambda f: (clave_nombre(f[i_nombre]), f[0]))
+        return [dict(zip(nombres, (f[p] for p in posiciones))) for f in filas]
+
+    def vista(self, nombre, construir):
+        """Valor derivado (p. ej. una respuesta serializada) reconstruido sólo si el modelo cambió."""
+        with self._lock:
+            version = self.version
+            guardada = self._vistas.get(nombre)
+        if guardada is not None and guardada[0] == version:
+            return guardada[1]
+        valor = construir(self)
+        with self._lock:
+            if self.version == version:
+                self._vistas[nombre] = (version, valor)
+        return valor
+
+    # --- Escritura (sólo desde el hilo de sincronización) ---------------
+
+    def _indexar(self, slot, fila, agregar):
+        cedula = fila[self._pos_cedula]
+        if agregar:
+            self._por_id[fila[0]] = slot
+            if cedula is not None:
+                self._por_cedula[cedula] = slot
+        else:
+            self._por_id.pop(fila[0], None)
+            if self._por_cedula.get(cedula) == slot:
+                del self._por_cedula[cedula]
+        for indice, posicion in ((self._por_telefono, self._pos_telefono), (self._por_placa, self._pos_placa)):
+            valor = fila[posicion]
+            if valor is None:
+                continue
+            if agregar:
+                indice.setdefault(valor, set()).add(slot)
+            else:
+                slots = indice.get(valor)
+                if slots is not None:
+                    slots.discard(slot)
+                    if not slots:
+                        del indice[valor]
+
+    def _quitar(self, cliente_id):
+        slot = self._por_id.get(cliente_id)
+        if slot is None:
+            return
+        self._indexar(slot, self._filas[slot], agregar=False)
+        self._filas[slot] = None
+        self._libres.append(slot)
+
+    def _poner(self, fila):
+        self._quitar(fila[0])
+        if self._libres:
+            slot = self._libres.pop()
+            self._filas[slot] = fila
+        else:
+            slot = len(self._filas)
+            self._filas.append(fila)
+        self._indexar(slot, fila, agregar=True)
+
+    def reemplazar(self, columnas, filas, mes):
+        with self._lock:
+            self.columnas = tuple(columnas)
+            if self.columnas[0] != 'id':
+                raise RuntimeError(f'La primera columna de clientes debe ser id: {self.columnas[:3]}')
+            self._pos_cedula, self._pos_telefono, self._pos_placa = (
+                self.columnas.index(c) for c in ('cedula', 'telefono', 'placa'))
+            self._filas, self._libres = [], []
+            self._por_id, self._por_cedula, self._por_telefono, self._por_placa = {}, {}, {}, {}
+            for fila in filas:
+                self._poner(tuple(fila))
+            self.mes = mes
+            self.version += 1
+            self.cargado = True
+
+    def aplicar(self, ids, filas):
+        """`filas` son las filas activas actuales de `ids`; los demás ids se quitan."""
+        with self._lock:
+            presentes = set()
+            for fila in filas:
+                self._poner(tuple(fila))
+                presentes.add(fila[0])
+            for cliente_id in ids:
+                if cliente_id not in presentes:
+                    self._quitar(cliente_id)
+            self.version += 1
+
+    # --- Sincronización -------------------------------------------------
+
+    def iniciar(self):
+        if self._hilo is None:
+            self._difusor = Difusor(canal=CANAL, capacidad_cola=COLA_MAX)
+            self._suscripcion = self._difusor.suscribir()
+            self._hilo = threading.Thread(target=self._sincronizar, name='modelo-clientes', daemon=True)
+            self._hilo.start()
+
+    def _recargar(self, cursor):
+        inicio = time.monotonic()
+        cursor.execute(SQL_MES)
+        mes = cursor.fetchone()[0]
+        cursor.execute(SQL_TODAS)
+        columnas = [d[0] for d in cursor.description]
+        self.reemplazar(columnas, cursor.fetchall(), mes)
+        self.recargas += 1
+        self.ultima_recarga = time.time()
+        log.info("🧠 Modelo de clientes cargado: %d clientes en %.0fms",
+                 len(self._por_id), (time.monotonic() - inicio) * 1000)
+
+    def _releer(self, cursor, ids):
+        cursor.execute(SQL_POR_IDS, {'ids': list(ids)})
+        if tuple(d[0] for d in cursor.description) != self.columnas:
+            # Cambió el esquema de clientes: recargar con las columnas nuevas
+            self._suscripcion.desbordada = True
+            return
+        filas = cursor.fetchall()
+        self.aplicar(ids, filas)
+        self.filas_releidas += len(filas)
+
+    def _hay_que_recargar(self, cursor):
+        if not self.cargado or self._suscripcion.desbordada:
+            return True
+        if time.time() - self.ultima_recarga >= RESYNC_SEG:
+            return True
+        cursor.execute(SQL_MES)
+        return cursor.fetchone()[0] != self.mes   # litros_retirados_mes es del mes en curso
+
+    def _vaciar_cola(self):
+        mensajes = []
+        while True:
+            try:
+                mensajes.append(self._suscripcion.cola.get_nowait())
+            except queue.Empty:
+                return mensajes
+
+    def _sincronizar(self):
+        conn = None
+        espera = 1
+        revisar = True
+        while True:
+            try:
+                if conn is None:
+                    conn = psycopg2.connect(**dict(parametros_conexion(),
+                                                   cursor_factory=psycopg2.extensions.cursor))
+                    conn.autocommit = True
+                cursor = conn.cursor()
+                if revisar and self._hay_que_recargar(cursor):
+                    if not self._difusor.conectado.wait(REVISION_SEG):
+                        continue
+                    # Lo que llegue desde aquí se aplica sobre la carga nueva
+                    self._suscripcion.desbordada = False
+                    self._vaciar_cola()
+                    self._recargar(cursor)
+                revisar = False
+                try:
+                    mensajes = [self._suscripcion.cola.get(timeout=REVISION_SEG)]
+                except queue.Empty:
+                    revisar = True
+                    continue
+                mensajes += self._vaciar_cola()
+                if self._suscripcion.desbordada:
+                    revisar = True
+                    continue
+                cambiar, borrar = set(), set()
+                for mensaje in mensajes:
+                    if mensaje is None:
+                        continue
+                    _, _, datos = mensaje
+                    (borrar if datos.get('op') == 'borrar' else cambiar).update(datos.get('ids') or ())
+                    self.avisos_aplicados += 1
+                borrar -= cambiar
+                if borrar:
+                    self.aplicar(borrar, ())
+                if cambiar:
+                    self._releer(cursor, cambiar)
+                revisar = self._suscripcion.desbordada
+                espera = 1
+            except Exception as e:
+                self.errores += 1
+                self._suscripcion.desbordada = True   # pudo perderse un aviso
+                revisar = True
+                log.warning("⚠️ Sincronización del modelo de clientes interrumpida: %s. Reintentando en %ss", e, espera)
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                    conn = None
+                time.sleep(espera)
+                espera = min(espera * 2, 30)
+
+    def metricas(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'activo': ACTIVO,
+                'listo': self.listo,
+                'clientes': len(self._por_id),
+                'slots': len(self._filas),
+                'slots_libres': len(self._libres),
+                'version': self.version,
+                'mes': self.mes,
+                'recargas': self.recargas,
+                'ultima_recarga_hace_seg': (round(time.time() - self.ultima_recarga, 1)
+                                            if self.ultima_recarga else None),
+                'avisos_aplicados': self.avisos_aplicados,
+                'filas_releidas': self.filas_releidas,
+                'errores': self.errores,
+                'escucha': self._difusor.metricas() if self._difusor else None,
+            }
+
+
+_modelo = None
+_modelo_lock = threading.Lock()
+
+
+def obtener_modelo():
+    """Modelo del proceso actual; la primera llamada inicia la sincronización."""
+    global _modelo
+    if _modelo is None or _modelo._pid != os.getpid():
+        with _modelo_lock:
+            if _modelo is None or _modelo._pid != os.getpid():
+                _modelo = ModeloClientes()
+                _modelo.iniciar()
+    return _modelo
+
+
+def disponible():
+    """El modelo si está al día; None si hay que consultar PostgreSQL."""
+    if not ACTIVO:
+        return None
+    modelo = obtener_modelo()
+    return modelo if modelo.listo else None
+
+
+def _despues_de_fork():
+    # El hilo de sincronización no sobrevive al fork: el hijo crea el suyo
+    global _modelo, _modelo_lock
+    _modelo_lock = threading.Lock()
+    _modelo = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_despues_de_fork)
@@ -0,0 +1,193 @@
+"""
+Particiones mensuales de retiros y agendamientos (ver GUIA_PARTICIONES.md y
+migrations/0010_particiones_retiros.sql).
+
+Cada tabla tiene una partición por mes (retiros_p202612, ...) más la
+partición histórica con todo lo anterior al particionado
+(retiros_historico). No hay partición DEFAULT: con ella no se podría usar
+DETACH PARTITION CONCURRENTLY. Por eso las particiones de los meses
+siguientes tienen que existir antes de que lleguen filas de esas fechas:
+server.py ejecuta `crear_futuras` periódicamente en cada worker (un advisory
+lock evita que lo hagan dos a la vez).
+
+Uso:
+    python particiones.py estado                          # particiones, filas estimadas y tamaño
+    python particiones.py crear [--meses 3]               # crea las particiones que falten
+    python particiones.py desconectar retiros 2025-01     # DETACH CONCURRENTLY de un mes
+    python particiones.py desconectar retiros historico   # ... o de la partición histórica
+
+Variables de entorno:
+    DATABASE_URL                  URL de conexión (obligatoria)
+    PARTICIONES_MESES_ADELANTE    Meses futuros con partición creada (defecto 3)
+"""
+
+import argparse
+import logging
+import os
+import sys
+from datetime import date
+
+import psycopg2
+
+from conexiones import parametros_conexion
+import registro
+
+log = logging.getLogger(__name__)
+
+# Tabla particionada -> columna de partición
+TABLAS = {
+    'retiros': 'fecha',
+    'agendamientos': 'fecha_agendada',
+}
+MESES_ADELANTE = int(os.environ.get('PARTICIONES_MESES_ADELANTE', 3))
+CLAVE_LOCK = 'despacho_gas.particiones'
+LOCK_TIMEOUT = '5s'
+
+
+def sumar_meses(mes, meses):
+    indice = mes.year * 12 + mes.month - 1 + meses
+    return date(indice // 12, indice % 12 + 1, 1)
+
+
+def esta_particionada(cursor, tabla):
+    cursor.execute("SELECT relkind = 'p' AS particionada FROM pg_class WHERE oid = to_regclass(%s)", (tabla,))
+    fila = cursor.fetchone()
+    return bool(fila and fila['particionada'])
+
+
+def crear_futuras(meses=MESES_ADELANTE, hoy=None):
+    """
+    Crea las particiones del mes actual y de los `meses` siguientes que
+    falten. Devuelve los nombres creados (lista vacía si ya existían todas o
+    si otro proceso está haciendo lo mismo).
+    """
+    mes_actual = (hoy or date.today()).replace(day=1)
+    conn = psycopg2.connect(**parametros_conexion())
+    conn.autocommit = True
+    cursor = conn.cursor()
+    creadas = []
+    try:
+        cursor.execute('SELECT pg_try_advisory_lock(hashtext(%s)) AS obtenido', (CLAVE_LOCK,))
+        if not cursor.fetchone()['obtenido']:
+            return creadas
+        try:
+            cursor.execute('SET lock_timeout = %s', (LOCK_TIMEOUT,))
+            for tabla in TABLAS:
+                if not esta_particionada(cursor, tabla):
+                    continue
+                for i in range(meses + 1):
+                    cursor.execute('SELECT particiones_crear_mes(%s, %s) AS nombre',
+                                   (tabla, sumar_meses(mes_actual, i)))
+                    nombre = cursor.fetchone()['nombre']
+                    if nombre:
+                        creadas.append(nombre)
+        finally:
+            cursor.execute('SELECT pg_advisory_unlock(hashtext(%s))', (CLAVE_LOCK,))
+    finally:
+        conn.close()
+    return creadas
+
+
+def tarea_programada():
+    """Punto de entrada para el programador de tareas del servidor."""
+    creadas = crear_futuras()
+    if creadas:
+        log.info("🗂️ Particiones creadas: %s", ', '.join(creadas))
+
+
+def listar(cursor, tabla):
+    cursor.execute('''
+        SELECT c.relname AS particion,
+               pg_get_expr(c.relpartbound, c.oid) AS rango,
+               GREATEST(c.reltuples, 0)::bigint AS filas_estimadas,
+               pg_size_pretty(pg_total_relation_size(c.oid)) AS tamano
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+        ORDER BY c.relname
+    ''', (tabla,))
+    return [dict(fila) for fila in cursor.fetchall()]
+
+
+def nombre_particion(tabla, mes):
+    """'historico' o 'AAAA-MM' -> nombre de la partición."""
+    if mes == 'historico':
+        return f'{tabla}_historico'
+    anio, numero = (int(parte) for parte in mes.split('-'))
+    return f'{tabla}_p{anio:04d}{numero:02d}'
+
+
+def desconectar(tabla, mes, hoy=None):
+    """
+    Separa una partición ya cerrada de la tabla con DETACH PARTITION
+    CONCURRENTLY: no copia datos y no bloquea lecturas ni escrituras (espera
+    a que terminen las consultas que la estén usando). La partición queda
+    como tabla suelta para archivarla o borrarla con DROP TABLE.
+    """
+    if tabla not in TABLAS:
+        raise ValueError(f'Tabla no particionada: {tabla}')
+    particion = nombre_particion(tabla, mes)
+    if mes != 'historico':
+        if sumar_meses(date(*map(int, mes.split('-')), 1), 1) > (hoy or date.today()).replace(day=1):
+            raise ValueError(f'El mes {mes} no ha terminado: sólo se separan meses cerrados')
+
+    conn = psycopg2.connect(**parametros_conexion())
+    conn.autocommit = True   # CONCURRENTLY no puede ir dentro de una transacción
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT 1 FROM pg_inherits
+            WHERE inhparent = %s::regclass AND inhrelid = to_regclass(%s)
+        ''', (tabla, particion))
+        if not cursor.fetchone():
+            raise ValueError(f'{particion} no es una partición de {tabla}')
+        cursor.execute(f'ALTER TABLE {tabla} DETACH PARTITION {particion} CONCURRENTLY')
+    finally:
+        conn.close()
+    return particion
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Particiones mensuales de retiros y agendamientos')
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    comandos.add_parser('estado', help='listar particiones con filas estimadas y tamaño')
+    p_crear = comandos.add_parser('crear', help='crear las particiones de los próximos meses')
+    p_crear.add_argument('--meses', type=int, default=MESES_ADELANTE)
+    p_desconectar = comandos.add_parser('desconectar', help='separar la partición de un mes cerrado')
+    p_desconectar.add_argument('tabla', choices=sorted(TABLAS))
+    p_desconectar.add_argument('mes', help="AAAA-MM o 'historico'")
+    args = parser.parse_args()
+    registro.configurar(formato='texto')
+
+    if not os.environ.get('DATABASE_URL'):
+        print("ERROR: DATABASE_URL no esta configurada")
+        sys.exit(1)
+
+    if args.comando == 'estado':
+        conn = psycopg2.connect(**parametros_conexion())
+        try:
+            cursor = conn.cursor()
+            for tabla in TABLAS:
+                if not esta_particionada(cursor, tabla):
+                    print(f"{tabla}: sin particionar")
+                    continue
+                print(f"{tabla}:")
+                for fila in listar(cursor, tabla):
+                    print(f"   {fila['particion']:<28} {fila['rango']:<58} "
+                          f"{fila['filas_estimadas']:>10} filas  {fila['tamano']:>8}")
+        finally:
+            conn.close()
+    elif args.comando == 'crear':
+        creadas = crear_futuras(meses=args.meses)
+        print(f"✅ Creadas: {', '.join(creadas)}" if creadas else "✅ No faltaba ninguna partición")
+    elif args.comando == 'desconectar':
+        try:
+            particion = desconectar(args.tabla, args.mes)
+        except ValueError as e:
+            print(f"ERROR: {e}")
+            sys.exit(1)
+        print(f"✅ {particion} separada de {args.tabla}; ya se puede archivar o borrar con DROP TABLE")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""
+Registro (logging) del servidor: niveles, líneas JSON y escritura fuera de
+los hilos de las peticiones.
+
+Los módulos usan el logging estándar (`log = logging.getLogger(__name__)`)
+y `configurar()` instala un único handler en el logger raíz. Ese handler
+sólo encola el registro (QueueHandler); un hilo aparte (QueueListener) le
+da formato y lo escribe en stdout. Una petición nunca espera a que el pipe
+de stdout se vacíe. Con el worker gevent de gunicorn, el hilo, su lock y la
+cola son los nativos del sistema: un greenlet no podría escribir sin
+bloquear el worker.
+
+En el hilo de la petición sólo se crea el registro, sin buscar archivo,
+línea ni hilo de origen (no se escriben). También se resuelve lo que
+después no estaría:
+el método y la ruta de la petición en curso, el traceback de una excepción
+y los argumentos que no sean valores inmutables (un dict podría cambiar
+antes de que el hilo lo formatee).
+
+Cada línea JSON lleva ts, nivel, modulo, mensaje y pid, más metodo y ruta
+dentro de una petición y los campos de `extra=`:
+
+    log.warning('sql_lenta', extra={'huella': ..., 'ms': 812.4})
+
+Variables de entorno:
+    LOG_NIVEL     Nivel del logger raíz (defecto INFO)
+    LOG_DEBUG     Módulos con DEBUG activo y la fracción de sus mensajes
+                  DEBUG que se escribe, p. ej. "server=0.01,eventos" (sin
+                  fracción se escriben todos)
+    LOG_FORMATO   json o texto (defecto json en el servidor y texto en los
+                  scripts de línea de comandos)
+"""
+
+import _thread
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+from flask import has_request_context, request
+
+# Valores que se pueden formatear más tarde en otro hilo sin riesgo
+_INMUTABLES = (str, int, float, bool, type(None), Decimal, date)
+# Atributos propios de un LogRecord; el resto vino por `extra=`
+_ATRIBUTOS_BASE = frozenset(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {'message', 'asctime'}
+
+_listener = None
+_lock = threading.Lock()
+
+
+def _nativo(modulo, nombre):
+    """Objeto original de `modulo` aunque gevent lo haya parcheado (worker gevent de gunicorn)."""
+    monkey = sys.modules.get('gevent.monkey')
+    if monkey is not None:
+        return monkey.get_original(modulo, nombre)
+    return getattr(sys.modules[modulo], nombre)
+
+
+def leer_muestreo(texto):
+    """'server=0.01,eventos' -> {'server': 0.01, 'eventos': 1.0}"""
+    fracciones = {}
+    for parte in filter(None, (p.strip() for p in (texto or '').split(','))):
+        modulo, _, fraccion = parte.partition('=')
+        try:
+            fracciones[modulo.strip()] = min(max(float(fraccion), 0.0), 1.0) if fraccion else 1.0
+        except ValueError:
+            fracciones[modulo.strip()] = 1.0
+    return fracciones
+
+
+class Muestreo(logging.Filter):
+    """Deja pasar una fracción de los mensajes DEBUG de cada módulo (y sus submódulos)."""
+
+    def __init__(self, fracciones):
+        super().__init__()
+        self.fracciones = fracciones
+        self._por_logger = {}
+
+    def fraccion(self, nombre):
+        fraccion = self._por_logger.get(nombre)
+        if fraccion is None:
+            fraccion, prefijo = 1.0, nombre
+            while prefijo:
+                if prefijo in self.fracciones:
+                    fraccion = self.fracciones[prefijo]
+                    break
+                prefijo = prefijo.rpartition('.')[0]
+            self._por_logger[nombre] = fraccion
+        return fraccion
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        fraccion = self.fraccion(record.name)
+        return fraccion >= 1.0 or random.random() < fraccion
+
+
+class HandlerCola(logging.handlers.QueueHandler):
+    """Encola el registro casi intacto: el formato completo lo hace el hilo del listener."""
+
+    def prepare(self, record):
+        if has_request_context():
+            record.__dict__.setdefault('metodo', request.method)
+            record.__dict__.setdefault('ruta', request.url_rule.rule if request.url_rule else request.path)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if record.args and (isinstance(record.args, dict)
+                            or not all(isinstance(arg, _INMUTABLES) for arg in record.args)):
+            record.msg, record.args = record.getMessage(), None
+        return record
+
+
+class FormatoJSON(logging.Formatter):
+    def format(self, record):
+        datos = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'modulo': record.name,
+            'mensaje': record.getMessage(),
+            'pid': record.process,
+        }
+        for clave, valor in record.__dict__.items():
+            if clave not in _ATRIBUTOS_BASE:
+                datos[clave] = valor
+        if record.exc_text:
+            datos['excepcion'] = record.exc_text
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class FormatoTexto(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)-7s %(name)s: %(message)s', '%H:%M:%S')
+
+    def format(self, record):
+        linea = super().format(record)
+        extra = ' '.join(f'{clave}={valor}' for clave, valor in record.__dict__.items()
+                         if clave not in _ATRIBUTOS_BASE)
+        return f'{linea} {extra}' if extra else linea
+
+
+class Listener(logging.handlers.QueueListener):
+    """QueueListener en un hilo del sistema (threading.Thread sería un greenlet con gevent)."""
+
+    def start(self):
+        self._terminado = _nativo('_thread', 'allocate_lock')()
+        self._terminado.acquire()
+        _nativo('_thread', 'start_new_thread')(self._correr, ())
+
+    def _correr(self):
+        try:
+            self._monitor()
+        finally:
+            self._terminado.release()
+
+    def stop(self, espera=5):
+        self.enqueue_sentinel()
+        self._terminado.acquire(timeout=espera)
+
+
+def configurar(formato='json', nivel=None):
+    """
+    Instala el handler con cola en el logger raíz. Sólo la primera llamada
+    del proceso tiene efecto; LOG_FORMATO y LOG_NIVEL mandan sobre los
+    argumentos.
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        formato = os.environ.get('LOG_FORMATO', formato)
+        nivel = os.environ.get('LOG_NIVEL', nivel or 'INFO').upper()
+        fracciones = leer_muestreo(os.environ.get('LOG_DEBUG'))
+
+        salida = logging.StreamHandler(sys.stdout)
+        salida.lock = _nativo('_thread', 'RLock')()
+        salida.setFormatter(FormatoJSON() if formato == 'json' else FormatoTexto())
+        cola = _nativo('queue', 'SimpleQueue')()
+        handler = HandlerCola(cola)
+        handler.addFilter(Muestreo(fracciones))
+
+        # Archivo, línea e hilo de origen no se escriben: que no se busquen
+        logging._srcfile = None
+        logging.logThreads = False
+        logging.logMultiprocessing = False
+
+        raiz = logging.getLogger()
+        raiz.handlers[:] = [handler]
+        raiz.setLevel(nivel)
+        for modulo in fracciones:
+            logging.getLogger(modulo).setLevel(logging.DEBUG)
+
+        _listener = Listener(cola, salida)
+        _listener.start()
+        atexit.register(detener)
+
+
+def detener():
+    """Escribe lo que quedó en la cola y termina el hilo."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
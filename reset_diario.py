@@ -0,0 +1,230 @@
+"""
+Reset diario de cupos: devuelve los litros disponibles de clientes y
+subclientes a su asignación (litros_mes*) una vez por día, a partir de las
+4:00 AM hora de Venezuela.
+
+El trabajo se hace por lotes ordenados por id (keyset), cada uno en su
+propia transacción corta, para no bloquear la tabla clientes completa
+durante las horas de mayor uso. El avance se guarda en
+reset_diario_progreso: si el proceso se interrumpe, la siguiente ejecución
+continúa desde el último id procesado. Un advisory lock garantiza que sólo
+un proceso (CLI o worker) ejecute el reset a la vez.
+
+Se puede ejecutar desde cron o a mano, y server.py lo programa dentro de
+cada worker (ver RESET_PROGRAMADO).
+
+Uso:
+    python reset_diario.py              # ejecuta el reset si corresponde
+    python reset_diario.py --forzar     # lo repite aunque ya se hizo hoy
+    python reset_diario.py --estado     # muestra el progreso registrado
+
+Variables de entorno:
+    DATABASE_URL   URL de conexión (obligatoria)
+    RESET_LOTE     Filas por lote (defecto 1000)
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import psycopg2
+
+from cambios import marcar as marcar_cambios
+from conexiones import parametros_conexion
+import registro
+
+log = logging.getLogger(__name__)
+
+DESFASE_VENEZUELA = timedelta(hours=-4)   # UTC-4, sin horario de verano
+HORA_RESET = 4
+LOTE_DEFECTO = int(os.environ.get('RESET_LOTE', 1000))
+CLAVE_LOCK = 'despacho_gas.reset_diario'
+
+# Un lote: toma los siguientes `lote` ids activos después de `desde`, repone
+# su cupo y registra el avance, todo en una sola sentencia.
+SQL_LOTE = '''
+    WITH lote AS (
+        SELECT id FROM {tabla}
+        WHERE id > %(desde)s AND activo = TRUE
+        ORDER BY id
+        LIMIT %(lote)s
+    ),
+    actualizados AS (
+        UPDATE {tabla} t
+        SET {asignaciones}
+        FROM lote
+        WHERE t.id = lote.id
+        RETURNING t.id
+    )
+    INSERT INTO reset_diario_progreso AS p (fecha, tabla, ultimo_id, filas)
+    SELECT %(fecha)s, '{tabla}', COALESCE(MAX(id), %(desde)s), COUNT(*) FROM actualizados
+    ON CONFLICT (fecha, tabla) DO UPDATE
+    SET ultimo_id = EXCLUDED.ultimo_id,
+        filas = p.filas + EXCLUDED.filas,
+        actualizado_en = CURRENT_TIMESTAMP
+    RETURNING p.ultimo_id, (SELECT COUNT(*) FROM actualizados) AS filas_lote
+'''
+
+TABLAS_RESET = {
+    'clientes': '''litros_disponibles = t.litros_mes,
+            litros_disponibles_gasolina = t.litros_mes_gasolina,
+            litros_disponibles_gasoil = t.litros_mes_gasoil''',
+    'subclientes': '''litros_disponibles_gasolina = t.litros_mes_gasolina,
+            litros_disponibles_gasoil = t.litros_mes_gasoil''',
+}
+
+
+def hora_venezuela(ahora=None):
+    return (ahora or datetime.utcnow()) + DESFASE_VENEZUELA
+
+
+def _resetear_tabla(cursor, tabla, fecha, lote):
+    cursor.execute('''
+        SELECT ultimo_id, filas, completado_en FROM reset_diario_progreso
+        WHERE fecha = %s AND tabla = %s
+    ''', (fecha, tabla))
+    progreso = cursor.fetchone()
+    if progreso and progreso['completado_en']:
+        return progreso['filas']
+
+    desde = progreso['ultimo_id'] if progreso else 0
+    if desde:
+        log.info("   ↪️  %s: retomando desde id %s", tabla, desde)
+    sql = SQL_LOTE.format(tabla=tabla, asignaciones=TABLAS_RESET[tabla])
+
+    lotes = 0
+    while True:
+        cursor.execute(sql, {'desde': desde, 'lote': lote, 'fecha': fecha})
+        resultado = cursor.fetchone()
+        desde = resultado['ultimo_id']
+        lotes += 1
+        if resultado['filas_lote']:
+            marcar_cambios(tabla)
+        ultimo_lote = resultado['filas_lote'] < lote
+        if ultimo_lote or lotes % 10 == 0:
+            log.info("   %s: %d lotes (hasta id %s)", tabla, lotes, desde)
+        if ultimo_lote:
+            break
+
+    cursor.execute('''
+        UPDATE reset_diario_progreso SET completado_en = CURRENT_TIMESTAMP
+        WHERE fecha = %s AND tabla = %s
+        RETURNING filas
+    ''', (fecha, tabla))
+    return cursor.fetchone()['filas']
+
+
+def ejecutar_reset(forzar=False, lote=LOTE_DEFECTO, ahora=None):
+    """
+    Ejecuta el reset del día si corresponde. Devuelve un diccionario con
+    `estado`: completado, al_dia, antes_de_hora, inicializado u ocupado.
+    """
+    conn = psycopg2.connect(**parametros_conexion())
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT pg_try_advisory_lock(hashtext(%s)) AS obtenido', (CLAVE_LOCK,))
+        if not cursor.fetchone()['obtenido']:
+            return {'estado': 'ocupado'}
+
+        try:
+            venezuela_now = hora_venezuela(ahora)
+            hoy = venezuela_now.date()
+
+            cursor.execute('SELECT fecha_ultimo_reset FROM sistema_config WHERE id = 1')
+            config = cursor.fetchone()
+            if not config:
+                log.warning("⚠️ No se encontró configuración del sistema")
+                return {'estado': 'sin_configuracion'}
+
+            ultimo_reset = config['fecha_ultimo_reset']
+            if ultimo_reset is None and not forzar:
+                # Sin fecha registrada no se resetea de inmediato: se espera a mañana
+                cursor.execute('UPDATE sistema_config SET fecha_ultimo_reset = %s WHERE id = 1', (hoy,))
+                log.warning("⚠️ fecha_ultimo_reset era NULL, inicializada a hoy: %s", hoy)
+                return {'estado': 'inicializado', 'fecha': hoy}
+
+            if not forzar:
+                if hasattr(ultimo_reset, 'date'):
+                    ultimo_reset = ultimo_reset.date()
+                if ultimo_reset >= hoy:
+                    return {'estado': 'al_dia', 'fecha': ultimo_reset}
+                if venezuela_now.hour < HORA_RESET:
+                    return {'estado': 'antes_de_hora', 'fecha': ultimo_reset}
+            else:
+                cursor.execute('DELETE FROM reset_diario_progreso WHERE fecha = %s', (hoy,))
+
+            log.info("🔄 EJECUTANDO RESET DIARIO %s- %s %02d:%02d hora Venezuela | Último reset: %s | Lote: %d",
+                     '(FORZADO) ' if forzar else '', hoy, venezuela_now.hour, venezuela_now.minute,
+                     ultimo_reset, lote)
+            inicio = time.monotonic()
+
+            resultado = {'estado': 'completado', 'fecha': hoy}
+            for tabla in TABLAS_RESET:
+                resultado[tabla] = _resetear_tabla(cursor, tabla, hoy, lote)
+
+            cursor.execute('UPDATE sistema_config SET fecha_ultimo_reset = %s WHERE id = 1', (hoy,))
+            resultado['segundos'] = round(time.monotonic() - inicio, 3)
+
+            log.info("✅ RESET DIARIO COMPLETADO: %d clientes, %d subclientes en %ss",
+                     resultado['clientes'], resultado['subclientes'], resultado['segundos'])
+            return resultado
+        finally:
+            cursor.execute('SELECT pg_advisory_unlock(hashtext(%s))', (CLAVE_LOCK,))
+    finally:
+        conn.close()
+
+
+def tarea_programada():
+    """Punto de entrada para el programador de tareas del servidor."""
+    resultado = ejecutar_reset()
+    if resultado['estado'] not in ('al_dia', 'antes_de_hora', 'ocupado'):
+        log.info("ℹ️ Reset diario: %s", resultado)
+
+
+def progreso(limite=10):
+    conn = psycopg2.connect(**parametros_conexion())
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT fecha, tabla, ultimo_id, filas, iniciado_en, actualizado_en, completado_en
+            FROM reset_diario_progreso
+            ORDER BY fecha DESC, tabla
+            LIMIT %s
+        ''', (limite,))
+        return [dict(fila) for fila in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reset diario de cupos de clientes y subclientes')
+    parser.add_argument('--forzar', action='store_true', help='repetir el reset aunque ya se hizo hoy')
+    parser.add_argument('--lote', type=int, default=LOTE_DEFECTO, help='filas por lote')
+    parser.add_argument('--estado', action='store_true', help='mostrar el progreso registrado y salir')
+    args = parser.parse_args()
+    registro.configurar(formato='texto')
+
+    if not os.environ.get('DATABASE_URL'):
+        print("ERROR: DATABASE_URL no esta configurada")
+        sys.exit(1)
+
+    if args.estado:
+        for fila in progreso():
+            estado = f"completado {fila['completado_en']}" if fila['completado_en'] else 'en curso'
+            print(f"{fila['fecha']} {fila['tabla']:<12} {fila['filas']:>8} filas "
+                  f"(último id {fila['ultimo_id']}) - {estado}")
+        return
+
+    resultado = ejecutar_reset(forzar=args.forzar, lote=args.lote)
+    print(f"Resultado: {resultado}")
+    if resultado['estado'] == 'ocupado':
+        print("Otro proceso está ejecutando el reset en este momento")
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,43 @@
-from flask import Flask, jsonify, request, g, make_response
+import arranque  # primero, para medir también el tiempo de los imports
+from flask import Flask, jsonify, request, g, make_response, Response, stream_with_context
 from flask_cors import CORS, cross_origin
 import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
 import psycopg2.extras
 import os
 import jwt
+import json
+import logging
+import base64
+import csv
+import io
 from datetime import datetime, timedelta
 from functools import wraps
-import urllib.parse
+
+from conexiones import envolver_cursores, obtener_pool
+from cambios import marcar as marcar_cambios
+from cache_respuestas import cache, cacheada, con_etag
+from eventos import CANAL as CANAL_EVENTOS, notificar, obtener_difusor, transmitir
+from tareas_programadas import programar
+import reset_diario
+import particiones
+import archivo
+import libro_inventario
+import importacion_clientes
+import busqueda_clientes
+import modelo_clientes
+import migraciones
+import metricas
+import instrumentacion
+import registro
+import threading
+
+# Registro JSON por una cola: las peticiones no escriben en stdout (ver registro.py)
+registro.configurar()
+log = logging.getLogger('server')   # también al ejecutarse como script
+
+arranque.fase('imports')
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'tu_clave_secreta_muy_segura')  # En producción, usa una variable de entorno
@@ -28,6 +59,16 @@ class CustomJSONProvider(DefaultJSONProvider):
 
 app.json = CustomJSONProvider(app)
 
+# Latencia, estados, tiempo en PostgreSQL, filas y bytes de cada ruta (ver
+# metricas.py y GET /metrics)
+metricas.instalar(app)
+# Los cursores del pool suman su tiempo y sus filas a la petición en curso
+envolver_cursores(metricas.cursor_medido)
+# SQL lenta y consultas repetidas (N+1) por petición (ver instrumentacion.py)
+instrumentacion.instalar(app)
+if instrumentacion.ACTIVA:
+    envolver_cursores(instrumentacion.cursor_instrumentado)
+
 # Ruta raíz para health check
 @app.route('/', methods=['GET'])
 def home():
@@ -59,306 +100,77 @@ def after_request(response):
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS,PATCH')
     response.headers.add('Access-Control-Allow-Credentials', 'true')
+    arranque.primera_respuesta()
     return response
 
-# Configuración de la base de datos PostgreSQL
+# Configuración de la base de datos PostgreSQL (pool compartido por el proceso).
+# Nada toca la base de datos al importar: la primera petición que la necesita
+# abre la conexión y verifica el esquema una sola vez por proceso.
+_esquema_verificado = False
+_esquema_lock = threading.Lock()
+
 def get_db():
     if 'db' not in g:
-        database_url = os.environ.get('DATABASE_URL')
-        if not database_url:
-            raise Exception("DATABASE_URL no está configurada")
-        
-        # Parse the URL
-        result = urllib.parse.urlparse(database_url)
-        g.db = psycopg2.connect(
-            database=result.path[1:],
-            user=result.username,
-            password=result.password,
-            host=result.hostname,
-            port=result.port,
-            cursor_factory=psycopg2.extras.RealDictCursor
-        )
-        g.db.set_session(autocommit=False)
+        g.db = obtener_pool().obtener() if _esquema_verificado else _primera_conexion()
     return g.db
 
+@arranque.medir('primera_conexion')
+def _abrir_primera_conexion():
+    return obtener_pool().obtener()
+
+def _primera_conexion():
+    global _esquema_verificado
+    with _esquema_lock:
+        if _esquema_verificado:
+            return obtener_pool().obtener()
+        db = _abrir_primera_conexion()
+        try:
+            verificar_esquema(db)
+        except Exception:
+            obtener_pool().devolver(db)
+            raise
+        _esquema_verificado = True
+        return db
+
 @app.teardown_appcontext
 def close_db(error):
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        obtener_pool().devolver(db)
 
-def verificar_reset_diario():
-    """
-    Verifica si es necesario resetear los litros disponibles de los clientes.
-    
-    IMPORTANTE: Esta función debe ejecutarse SOLO:
-    - En el login del cliente (para verificar si pasó un nuevo día)
-    - A las 4:00 AM Venezuela time (mediante cron job o scheduler)
-    
-    NO debe ejecutarse en cada consulta de datos del cliente.
-    """
-    try:
-        # Hora actual en Venezuela (UTC-4)
-        utc_now = datetime.utcnow()
-        venezuela_now = utc_now - timedelta(hours=4)
-        hoy_venezuela = venezuela_now.date()
-        
-        db = get_db()
-        cursor = db.cursor()
-        
-        # Obtener fecha último reset
-        cursor.execute('SELECT fecha_ultimo_reset FROM sistema_config WHERE id = 1')
-        row = cursor.fetchone()
-        
-        if not row:
-            print("⚠️ No se encontró configuración del sistema")
-            return
-        
-        ultimo_reset = row['fecha_ultimo_reset']
-        
-        # Si fecha_ultimo_reset es NULL, inicializarla a hoy para evitar reset inmediato
-        if ultimo_reset is None:
-            print(f"⚠️ fecha_ultimo_reset era NULL, inicializando a hoy: {hoy_venezuela}")
-            cursor.execute('UPDATE sistema_config SET fecha_ultimo_reset = %s WHERE id = 1', (hoy_venezuela,))
-            db.commit()
-            print("✅ fecha_ultimo_reset inicializada correctamente")
-            print("   ℹ️  No se ejecutará reset ahora, se esperará hasta mañana a las 4:00 AM")
-            return
-        
-        # Convertir ultimo_reset a date si es datetime
-        if hasattr(ultimo_reset, 'date'):
-            ultimo_reset = ultimo_reset.date()
-        
-        # Si ya se reseteó hoy, no hacer nada
-        if ultimo_reset >= hoy_venezuela:
-            print(f"✅ Reset ya ejecutado hoy ({ultimo_reset}), no se requiere acción")
-            return
-        
-        # Solo resetear si es después de las 4:00 AM Y no se ha reseteado hoy
-        if venezuela_now.hour >= 4:
-            print("=" * 70)
-            print(f"🔄 EJECUTANDO RESET DIARIO AUTOMÁTICO")
-            print(f"   Fecha: {hoy_venezuela}")
-            print(f"   Hora Venezuela: {venezuela_now.hour:02d}:{venezuela_now.minute:02d}")
-            print(f"   Último reset: {ultimo_reset}")
-            print("=" * 70)
-            
-            # Ejecutar reset
-            cursor.execute('''
-                UPDATE clientes 
-                SET litros_disponibles = litros_mes,
-                    litros_disponibles_gasolina = litros_mes_gasolina,
-                    litros_disponibles_gasoil = litros_mes_gasoil
-                WHERE activo = TRUE
-            ''')
-            
-            clientes_actualizados = cursor.rowcount
-            
-            # Actualizar fecha último reset
-            cursor.execute('UPDATE sistema_config SET fecha_ultimo_reset = %s WHERE id = 1', (hoy_venezuela,))
-            
-            db.commit()
-            
-            print(f"✅ RESET DIARIO COMPLETADO EXITOSAMENTE")
-            print(f"   Clientes actualizados: {clientes_actualizados}")
-            print(f"   Nueva fecha_ultimo_reset: {hoy_venezuela}")
-            print("=" * 70)
-        else:
-            print(f"⏰ Es antes de las 4:00 AM ({venezuela_now.hour:02d}:{venezuela_now.minute:02d})")
-            print(f"   Esperando hasta las 4:00 AM para ejecutar reset")
-            print(f"   Último reset: {ultimo_reset}")
-        
-    except Exception as e:
-        print(f"❌ ERROR en reset diario: {e}")
-        import traceback
-        traceback.print_exc()
-        try:
-            db = get_db()
-            db.rollback()
-        except:
-            pass
+# Verificar el esquema de la base de datos. El DDL vive en migrations/ y se
+# aplica con `python migraciones.py aplicar` en el paso previo al despliegue
+# (preDeployCommand, release); los workers sólo leen schema_version. Si la
+# versión registrada ya es la última de migrations/ basta con una consulta.
+# Sólo en desarrollo (o con MIGRAR_AL_INICIAR=1) el primer worker aplica las
+# pendientes; en producción se avisa y se sigue con el esquema que hay.
+@arranque.medir('esquema')
+def verificar_esquema(db):
+    actual = migraciones.version_actual(db.cursor())
+    db.rollback()
+    if actual >= migraciones.version_esperada():
+        log.info("✅ Esquema de base de datos al día (versión %d)", actual)
+        return
 
-# Inicializar la base de datos
-def init_db():
-    with app.app_context():
-        db = get_db()
-        cursor = db.cursor()
-        
-        
-        # Crear tablas si no existen (PostgreSQL syntax)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS usuarios (
-                id SERIAL PRIMARY KEY,
-                usuario VARCHAR(255) UNIQUE NOT NULL,
-                contrasena VARCHAR(255) NOT NULL,
-                nombre VARCHAR(255) NOT NULL,
-                es_admin BOOLEAN DEFAULT FALSE
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS clientes (
-                id SERIAL PRIMARY KEY,
-                nombre VARCHAR(255) NOT NULL,
-                direccion TEXT,
-                telefono VARCHAR(50),
-                cedula VARCHAR(50) UNIQUE,
-                rif VARCHAR(50),
-                placa VARCHAR(50),
-                categoria VARCHAR(100) DEFAULT 'Persona Natural',
-                subcategoria VARCHAR(100),
-                exonerado BOOLEAN DEFAULT FALSE,
-                huella BOOLEAN DEFAULT FALSE,
-                litros_mes REAL DEFAULT 0,
-                litros_disponibles REAL DEFAULT 0,
-                litros_mes_gasolina REAL DEFAULT 0,
-                litros_mes_gasoil REAL DEFAULT 0,
-                litros_disponibles_gasolina REAL DEFAULT 0,
-                litros_disponibles_gasoil REAL DEFAULT 0,
-                activo BOOLEAN DEFAULT TRUE
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS retiros (
-                id SERIAL PRIMARY KEY,
-                cliente_id INTEGER NOT NULL,
-                fecha DATE NOT NULL,
-                hora TIME NOT NULL DEFAULT '00:00:00',
-                litros REAL NOT NULL,
-                usuario_id INTEGER NOT NULL,
-                tipo_combustible VARCHAR(20) DEFAULT 'gasoil',
-                codigo_ticket INTEGER,
-                FOREIGN KEY (cliente_id) REFERENCES clientes (id),
-                FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
-            )
-        ''')
-        
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sistema_config (
-                id INTEGER PRIMARY KEY CHECK(id = 1),
-                retiros_bloqueados INTEGER NOT NULL DEFAULT 0,
-                limite_diario_gasolina REAL DEFAULT 2000,
-                fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS subclientes (
-                id SERIAL PRIMARY KEY,
-                cliente_padre_id INTEGER NOT NULL,
-                nombre VARCHAR(255) NOT NULL,
-                cedula VARCHAR(50),
-                placa VARCHAR(50),
-                litros_mes_gasolina REAL DEFAULT 0,
-                litros_mes_gasoil REAL DEFAULT 0,
-                litros_disponibles_gasolina REAL DEFAULT 0,
-                litros_disponibles_gasoil REAL DEFAULT 0,
-                activo BOOLEAN DEFAULT TRUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (cliente_padre_id) REFERENCES clientes (id)
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS agendamientos (
-                id SERIAL PRIMARY KEY,
-                cliente_id INTEGER NOT NULL,
-                subcliente_id INTEGER,
-                tipo_combustible VARCHAR(20) NOT NULL DEFAULT 'gasolina',
-                litros REAL NOT NULL,
-                fecha_agendada DATE NOT NULL,
-                codigo_ticket INTEGER,
-                estado VARCHAR(20) NOT NULL DEFAULT 'pendiente',
-                fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (cliente_id) REFERENCES clientes (id),
-                FOREIGN KEY (subcliente_id) REFERENCES subclientes (id)
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS limites_diarios (
-                id SERIAL PRIMARY KEY,
-                fecha DATE NOT NULL,
-                tipo_combustible VARCHAR(20) NOT NULL DEFAULT 'gasolina',
-                litros_agendados REAL DEFAULT 0,
-                litros_procesados REAL DEFAULT 0,
-                UNIQUE(fecha, tipo_combustible)
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS inventario (
-                id SERIAL PRIMARY KEY,
-                tipo_combustible VARCHAR(20) NOT NULL CHECK(tipo_combustible IN ('gasoil', 'gasolina')),
-                litros_ingresados REAL NOT NULL,
-                litros_disponibles REAL NOT NULL,
-                fecha_ingreso TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                usuario_id INTEGER,
-                observaciones TEXT,
-                FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
-            )
-        ''')
-
-        # Agregar columna fecha_ultimo_reset si no existe
-        try:
-            cursor.execute('ALTER TABLE sistema_config ADD COLUMN fecha_ultimo_reset DATE')
-            db.commit()
-        except Exception:
-            db.rollback()
-            
-        # Inicializar fecha_ultimo_reset si es NULL
-        cursor.execute('UPDATE sistema_config SET fecha_ultimo_reset = CURRENT_DATE - INTERVAL \'1 day\' WHERE fecha_ultimo_reset IS NULL')
-        db.commit()
-
-        # Verificar si existe usuario admin
-        cursor.execute('SELECT * FROM usuarios WHERE usuario = %s', ('admin',))
-        if not cursor.fetchone():
-            # Crear usuario admin por defecto
-            hashed_password = 'admin_password_placeholder' # Debería ser hasheado
-            # Aquí deberíamos usar bcrypt pero para simplificar en init_db asumimos que se crea luego o manualmente
-            # Mejor no crear admin hardcodeado si no tenemos hash function aquí disponible fácilmente sin importar
-            pass
-            
-        db.commit()
-        print("✅ Base de datos PostgreSQL inicializada correctamente")
-
-        
-        
-        # Inicializar configuración si no existe
-        cursor.execute('SELECT * FROM sistema_config WHERE id = 1')
-        if not cursor.fetchone():
-            cursor.execute('INSERT INTO sistema_config (id, retiros_bloqueados) VALUES (1, 0)')
-        
-        # Crear o actualizar usuario admin
-        admin_password = os.environ.get('ADMIN_PASSWORD', 'admin123')
-        
-        cursor.execute('SELECT * FROM usuarios WHERE usuario = %s', ('admin',))
-        if cursor.fetchone():
-            # Si existe, actualizar contraseña
-            cursor.execute(
-                'UPDATE usuarios SET contrasena = %s WHERE usuario = %s',
-                (admin_password, 'admin')
-            )
-            print(f"Usuario admin actualizado con contraseña configurada")
-        else:
-            # Si no existe, crear
-            cursor.execute(
-                'INSERT INTO usuarios (usuario, contrasena, nombre, es_admin) VALUES (%s, %s, %s, %s)',
-                ('admin', admin_password, 'Administrador', True)
-            )
-            print(f"Usuario admin creado con contraseña configurada")
-        
-        db.commit()
-        print("✅ Base de datos PostgreSQL inicializada correctamente")
+    pendientes = migraciones.pendientes(db)
+    db.rollback()
+    nombres = ', '.join(f"{m.version:04d}_{m.nombre}" for m in pendientes)
+    es_desarrollo = os.environ.get('FLASK_ENV', 'development') == 'development'
+    if os.environ.get('MIGRAR_AL_INICIAR', '1' if es_desarrollo else '0') == '1':
+        log.info("🔧 Migraciones pendientes: %s. Aplicando...", nombres)
+        migraciones.aplicar()
+        migraciones.asegurar_admin()
+    else:
+        log.warning("⚠️ Migraciones pendientes: %s. Ejecute: python migraciones.py aplicar", nombres)
 
 # Decorador para verificar el token JWT
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         token = request.headers.get('Authorization')
+        if not token and request.accept_mimetypes.best == 'text/event-stream':
+            # EventSource no permite cabeceras: en SSE el token va en ?token=
+            token = request.args.get('token') and f"Bearer {request.args['token']}"
         if not token:
             return jsonify({'message': 'Token no proporcionado'}), 403
         try:
@@ -383,7 +195,7 @@ def token_required(f):
                 return jsonify({'message': 'Token inválido'}), 403
                 
         except Exception as e:
-            print(f"Error al decodificar token: {e}")
+            log.warning("Error al decodificar token: %s", e)
             return jsonify({'message': 'Token inválido'}), 403
         return f(*args, **kwargs)
     return decorated
@@ -447,14 +259,14 @@ def login():
         
         return response
         
-    except Exception as e:
-        print(f"Error en el login: {str(e)}")
+    except Exception:
+        log.exception("Error en el login")
         return jsonify({'error': 'Error en el servidor'}), 500
 
 # Login de clientes (sin autenticación requerida)
 @app.route('/api/clientes/login', methods=['POST'])
 def login_cliente():
-    verificar_reset_diario()
+    # El reset diario de cupos ya no se verifica aquí: lo ejecuta reset_diario.py
     try:
         data = request.json
         cedula = data.get('cedula')
@@ -462,11 +274,13 @@ def login_cliente():
         if not cedula:
             return jsonify({'error': 'La cédula es requerida'}), 400
         
-        db = get_db()
-        cursor = db.cursor()
-        
-        cursor.execute('SELECT * FROM clientes WHERE cedula = %s AND activo = TRUE', (cedula,))
-        cliente = cursor.fetchone()
+        modelo = modelo_clientes.disponible()
+        if modelo:
+            cliente = modelo.por_cedula(cedula)
+        else:
+            cursor = get_db().cursor()
+            cursor.execute('SELECT * FROM clientes WHERE cedula = %s AND activo = TRUE', (cedula,))
+            cliente = cursor.fetchone()
         
         if not cliente:
             return jsonify({'error': 'Cliente no encontrado o inactivo'}), 404
@@ -503,8 +317,8 @@ def login_cliente():
                 'litros_mes_gasoil': cliente_dict.get('litros_mes_gasoil', 0)
             }
         })
-    except Exception as e:
-        print(f"Error en autenticación de cliente: {e}")
+    except Exception:
+        log.exception("Error en autenticación de cliente")
         return jsonify({'error': 'Error en el servidor'}), 500
 
 # Rutas de clientes
@@ -514,23 +328,29 @@ def obtener_clientes():
     db = get_db()
     cursor = db.cursor()
     
-    busqueda = request.args.get('busqueda', '')
-    query = 'SELECT * FROM clientes WHERE activo = TRUE'
-    params = []
-    
+    busqueda = request.args.get('busqueda', '').strip()
     if busqueda:
-        query += ' AND (nombre LIKE %s OR direccion LIKE %s)'
-        search_term = f'%{busqueda}%'
-        params.extend([search_term, search_term])
+        limite = request.args.get('limite', busqueda_clientes.LIMITE_DEFECTO, type=int)
+        return jsonify(busqueda_clientes.buscar(cursor, busqueda, limite))
     
-    cursor.execute(query, params)
-    clientes = [dict(row) for row in cursor.fetchall()]
-    cursor.execute(query, params)
+    cursor.execute('SELECT * FROM clientes WHERE activo = TRUE')
     clientes = [dict(row) for row in cursor.fetchall()]
     return jsonify(clientes)
 
+COLUMNAS_CLIENTES_SIMPLE = ('id', 'nombre', 'cedula', 'telefono', 'placa', 'categoria', 'subcategoria',
+                             'litros_mes', 'litros_disponibles')
+
+def serializar_clientes_simple(modelo):
+    # Mismo cuerpo que jsonify (compacto); se arma una vez por versión del modelo
+    filas = modelo.activos(COLUMNAS_CLIENTES_SIMPLE)
+    return (app.json.dumps(filas, separators=(',', ':')) + '\n').encode()
+
 @app.route('/api/clientes/simple', methods=['GET'])
 def obtener_clientes_simple():
+    modelo = modelo_clientes.disponible()
+    if modelo:
+        return Response(modelo.vista('simple', serializar_clientes_simple), mimetype='application/json')
+    
     db = get_db()
     cursor = db.cursor()
     
@@ -547,8 +367,24 @@ def obtener_clientes_simple():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Historial archivado (ver archivo.py). Las rutas de historial agregan a la
+# consulta las filas archivadas que cumplen sus filtros; si el rango de
+# fechas o el cliente no llegan a ningún segmento no se lee el archivo y la
+# consulta queda igual que antes.
+def origen_historial(tabla, desde=None, hasta=None, condicion=None, orden=None, limite=None, cliente_id=None):
+    """(fragmento FROM, parámetros) de `tabla` más sus filas archivadas."""
+    fuente = archivo.obtener_archivo()
+    if orden is not None and limite is not None:
+        filas = fuente.recientes(tabla, limite, orden, desde, hasta, condicion, cliente_id)
+    else:
+        filas = list(fuente.filas(tabla, desde, hasta, condicion, cliente_id))
+        if orden is not None:
+            filas.sort(key=orden, reverse=True)
+    return archivo.origen(tabla, filas)
+
 @app.route('/api/clientes/lista', methods=['GET'])
 @token_required
+@con_etag('clientes', 'retiros')
 def obtener_clientes_lista():
     db = get_db()
     cursor = db.cursor()
@@ -565,11 +401,12 @@ def obtener_clientes_lista():
                 c.subcategoria,
                 c.litros_mes,
                 c.litros_disponibles,
-                COUNT(r.id) as total_retiros,
-                COALESCE(SUM(r.litros), 0) as total_litros_retirados,
-                MAX(r.fecha) as ultimo_retiro
+                COUNT(r.id) + COALESCE(MAX(ra.retiros), 0) as total_retiros,
+                COALESCE(SUM(r.litros), 0) + COALESCE(MAX(ra.litros), 0) as total_litros_retirados,
+                COALESCE(MAX(r.fecha), MAX(ra.ultimo_retiro)) as ultimo_retiro
             FROM clientes c
             LEFT JOIN retiros r ON c.id = r.cliente_id
+            LEFT JOIN retiros_archivados_clientes ra ON ra.cliente_id = c.id
             WHERE c.activo = TRUE 
             GROUP BY c.id
             ORDER BY c.nombre ASC
@@ -594,8 +431,8 @@ def obtener_clientes_lista():
             })
         
         return jsonify(clientes)
-    except Exception as e:
-        print(f"Error al obtener lista de clientes: {e}")
+    except Exception:
+        log.exception("Error al obtener lista de clientes")
         return jsonify({'error': 'Error interno del servidor'}), 500
 
 @app.route('/api/clientes/<int:cliente_id>', methods=['GET'])
@@ -603,22 +440,24 @@ def obtener_clientes_lista():
 def obtener_cliente(cliente_id):
     # ❌ REMOVED: verificar_reset_diario() - This was causing resets on every data fetch!
     # The reset should ONLY happen at 4:00 AM, not every time the dashboard loads
-    # Reset is still triggered on login (see login_cliente endpoint)
-    
-    db = get_db()
-    cursor = db.cursor()
+    # Reset now runs as a scheduled job (see reset_diario.py)
     
-    cursor.execute('''
-        SELECT c.*, 
-               (SELECT SUM(litros) FROM retiros 
-                WHERE cliente_id = c.id 
-                AND fecha >= DATE_TRUNC('month', CURRENT_DATE) 
-                AND fecha < DATE_TRUNC('month', CURRENT_DATE) + INTERVAL '1 month') as litros_retirados_mes
-        FROM clientes c 
-        WHERE c.id = %s AND c.activo = TRUE
-    ''', (cliente_id,))
+    modelo = modelo_clientes.disponible()
+    if modelo:
+        cliente = modelo.por_id(cliente_id)
+    else:
+        cursor = get_db().cursor()
+        cursor.execute('''
+            SELECT c.*, 
+                   (SELECT SUM(litros) FROM retiros 
+                    WHERE cliente_id = c.id 
+                    AND fecha >= DATE_TRUNC('month', CURRENT_DATE)::date 
+                    AND fecha < (DATE_TRUNC('month', CURRENT_DATE) + INTERVAL '1 month')::date) as litros_retirados_mes
+            FROM clientes c 
+            WHERE c.id = %s AND c.activo = TRUE
+        ''', (cliente_id,))
+        cliente = cursor.fetchone()
     
-    cliente = cursor.fetchone()
     if not cliente:
         return jsonify({'error': 'Cliente no encontrado'}), 404
     
@@ -631,7 +470,9 @@ def obtener_tickets_cliente(cliente_id):
     cursor = db.cursor()
     
     try:
-        cursor.execute('''
+        origen, params = origen_historial('retiros', cliente_id=cliente_id,
+                                          orden=lambda f: f['fecha'], limite=50)
+        cursor.execute(f'''
             SELECT 
                 r.id,
                 r.litros,
@@ -643,17 +484,17 @@ def obtener_tickets_cliente(cliente_id):
                 c.telefono as cliente_telefono,
                 c.placa as cliente_placa,
                 c.categoria as cliente_categoria
-            FROM retiros r
+            FROM {origen} r
             JOIN clientes c ON r.cliente_id = c.id
             WHERE r.cliente_id = %s
             ORDER BY r.fecha DESC
             LIMIT 50
-        ''', (cliente_id,))
+        ''', params + [cliente_id])
         
         tickets = [dict(row) for row in cursor.fetchall()]
         return jsonify(tickets)
-    except Exception as e:
-        print(f"Error al obtener tickets del cliente: {e}")
+    except Exception:
+        log.exception("Error al obtener tickets del cliente")
         return jsonify({'error': 'Error interno del servidor'}), 500
 
 @app.route('/api/clientes/<int:cliente_id>/subclientes', methods=['GET'])
@@ -685,8 +526,8 @@ def obtener_subclientes(cliente_id):
         
         subclientes = [dict(row) for row in cursor.fetchall()]
         return jsonify(subclientes)
-    except Exception as e:
-        print(f"Error al obtener subclientes: {e}")
+    except Exception:
+        log.exception("Error al obtener subclientes")
         return jsonify({'error': 'Error interno del servidor'}), 500
 
 @app.route('/api/clientes/<int:cliente_id>/subclientes', methods=['POST'])
@@ -764,33 +605,38 @@ def crear_subcliente(cliente_id):
         ))
         
         db.commit()
+        marcar_cambios('subclientes')
         subcliente_id = cursor.lastrowid
         
         return jsonify({
             'message': 'Subcliente creado exitosamente',
             'subclienteId': subcliente_id
         }), 201
-    except Exception as e:
+    except Exception:
         db.rollback()
-        print(f"Error al crear subcliente: {e}")
+        log.exception("Error al crear subcliente")
         return jsonify({'error': 'Error interno del servidor'}), 500
 
 @app.route('/api/clientes/telefono/<telefono>', methods=['GET'])
 def obtener_cliente_por_telefono(telefono):
-    db = get_db()
-    cursor = db.cursor()
-    
-    cursor.execute('''
-        SELECT c.*, 
-               (SELECT SUM(litros) FROM retiros 
-                WHERE cliente_id = c.id 
-                AND fecha >= DATE_TRUNC('month', CURRENT_DATE) 
-                AND fecha < DATE_TRUNC('month', CURRENT_DATE) + INTERVAL '1 month') as litros_retirados_mes
-        FROM clientes c 
-        WHERE c.telefono = %s AND c.activo = TRUE
-    ''', (telefono,))
+    modelo = modelo_clientes.disponible()
+    if modelo:
+        cliente = modelo.por_telefono(telefono)
+    else:
+        cursor = get_db().cursor()
+        cursor.execute('''
+            SELECT c.*, 
+                   (SELECT SUM(litros) FROM retiros 
+                    WHERE cliente_id = c.id 
+                    AND fecha >= DATE_TRUNC('month', CURRENT_DATE)::date 
+                    AND fecha < (DATE_TRUNC('month', CURRENT_DATE) + INTERVAL '1 month')::date) as litros_retirados_mes
+            FROM clientes c 
+            WHERE c.telefono = %s AND c.activo = TRUE
+            ORDER BY c.id
+            LIMIT 1
+        ''', (telefono,))
+        cliente = cursor.fetchone()
     
-    cliente = cursor.fetchone()
     if not cliente:
         return jsonify({'error': 'Cliente no encontrado'}), 404
     
@@ -841,11 +687,50 @@ def crear_cliente():
         ))
         
         db.commit()
+        marcar_cambios('clientes')
         return jsonify({'id': cursor.lastrowid}), 201
     except Exception as e:
         db.rollback()
-        print(f"Error creando cliente: {str(e)}")
+        log.exception("Error creando cliente")
+        return jsonify({'error': str(e)}), 400
+
+# Importación masiva: CSV con encabezados o NDJSON, en el cuerpo de la
+# petición o como campo `archivo` de un formulario multipart.
+@app.route('/api/clientes/bulk', methods=['POST'])
+@token_required
+def importar_clientes():
+    if not g.es_admin:
+        return jsonify({'error': 'No autorizado'}), 403
+    
+    nombre_archivo = None
+    if request.mimetype == 'multipart/form-data':
+        archivo = request.files.get('archivo')
+        if archivo is None:
+            return jsonify({'error': 'Envíe el archivo en el campo "archivo"'}), 400
+        flujo = archivo.stream
+        nombre_archivo = archivo.filename
+    else:
+        flujo = request.stream
+    
+    try:
+        formato = importacion_clientes.detectar_formato(
+            request.args.get('formato'), request.mimetype, nombre_archivo)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    db = get_db()
+    try:
+        reporte = importacion_clientes.importar(db, flujo, formato)
+    except Exception as e:
+        db.rollback()
+        log.warning("Error en importación de clientes: %s", e)
         return jsonify({'error': str(e)}), 400
+    
+    if reporte['insertados'] or reporte['actualizados']:
+        marcar_cambios('clientes')
+    log.info("📥 Importación de clientes: %d nuevos, %d actualizados, %d errores en %ss",
+             reporte['insertados'], reporte['actualizados'], reporte['total_errores'], reporte['segundos'])
+    return jsonify(reporte), 200
 
 @app.route('/api/clientes/<int:id>', methods=['PUT'])
 @token_required
@@ -888,12 +773,138 @@ def actualizar_cliente(id):
         ))
         
         db.commit()
+        marcar_cambios('clientes')
         return jsonify({'message': 'Cliente actualizado'}), 200
     except Exception as e:
         db.rollback()
         return jsonify({'error': str(e)}), 400
 
+# Movimientos de inventario. Cada sentencia actualiza la existencia en
+# inventario_actual y añade el movimiento al libro `inventario` con el mismo
+# id (tomado de la secuencia), en un solo viaje y sin leer antes el saldo.
+SQL_ENTRADA_INVENTARIO = '''
+    WITH stock AS (
+        INSERT INTO inventario_actual (tipo_combustible, litros_disponibles, ultimo_movimiento_id)
+        VALUES (%(tipo)s, %(litros)s, nextval(pg_get_serial_sequence('inventario', 'id')))
+        ON CONFLICT (tipo_combustible) DO UPDATE
+        SET litros_disponibles = inventario_actual.litros_disponibles + EXCLUDED.litros_disponibles,
+            ultimo_movimiento_id = EXCLUDED.ultimo_movimiento_id,
+            fecha_actualizacion = CURRENT_TIMESTAMP
+        RETURNING litros_disponibles, ultimo_movimiento_id
+    )
+    INSERT INTO inventario (id, tipo_combustible, litros_ingresados, litros_disponibles, usuario_id, observaciones)
+    SELECT ultimo_movimiento_id, %(tipo)s, %(litros)s, litros_disponibles, %(usuario_id)s, %(observaciones)s
+    FROM stock
+    RETURNING id, litros_disponibles,
+              pg_notify(''' + f"'{CANAL_EVENTOS}'" + ''', json_build_object(
+                  'evento', 'inventario', 'id', id, 'litros_ingresados', litros_ingresados,
+                  'inventario', json_build_object(tipo_combustible, litros_disponibles))::text)
+'''
+
+# Salida condicionada a que haya existencia suficiente: si no la hay no se
+# devuelve ninguna fila.
+SQL_SALIDA_INVENTARIO = '''
+    WITH stock AS (
+        UPDATE inventario_actual
+        SET litros_disponibles = litros_disponibles - %(litros)s,
+            ultimo_movimiento_id = nextval(pg_get_serial_sequence('inventario', 'id')),
+            fecha_actualizacion = CURRENT_TIMESTAMP
+        WHERE tipo_combustible = %(tipo)s AND litros_disponibles >= %(litros)s
+        RETURNING litros_disponibles, ultimo_movimiento_id
+    )
+    INSERT INTO inventario (id, tipo_combustible, litros_ingresados, litros_disponibles, usuario_id, observaciones)
+    SELECT ultimo_movimiento_id, %(tipo)s, 0 - %(litros)s, litros_disponibles, %(usuario_id)s, %(observaciones)s
+    FROM stock
+    RETURNING id, litros_disponibles
+'''
+
+# Resumen diario de consumo (retiros directos + agendamientos entregados).
+# Fragmento de CTE que suma un consumo a consumo_diario; `origen` es un CTE
+# que devuelve fecha, tipo_combustible, cliente_id y litros. La tabla
+# consumo_diario_clientes permite contar clientes distintos por día.
+CTE_CONSUMO_DIARIO = '''
+    consumo_cliente AS (
+        INSERT INTO consumo_diario_clientes (fecha, tipo_combustible, cliente_id)
+        SELECT fecha, tipo_combustible, cliente_id FROM {origen}
+        ON CONFLICT DO NOTHING
+        RETURNING 1
+    ),
+    consumo AS (
+        INSERT INTO consumo_diario (fecha, tipo_combustible, litros, clientes)
+        SELECT fecha, tipo_combustible, litros, (SELECT COUNT(*) FROM consumo_cliente)
+        FROM {origen}
+        ON CONFLICT (fecha, tipo_combustible) DO UPDATE
+        SET litros = consumo_diario.litros + EXCLUDED.litros,
+            clientes = consumo_diario.clientes + EXCLUDED.clientes
+    )
+'''
+
 # Rutas de retiros
+TIPOS_COMBUSTIBLE = ('gasolina', 'gasoil')
+
+# Retiro en una sola sentencia: descuenta el saldo del cliente (bloqueando su
+# fila), descuenta la existencia en inventario_actual, registra el retiro,
+# anota la salida en el libro de inventario y la suma al consumo del día. Si
+# el cliente no existe o está inactivo, ninguna de las modificaciones afecta
+# filas.
+SQL_RETIRO_ATOMICO = '''
+    WITH cliente AS (
+        UPDATE clientes
+        SET litros_disponibles = COALESCE(litros_disponibles, 0) - %(litros)s,
+            {campo} = COALESCE({campo}, 0) - %(litros)s
+        WHERE id = %(cliente_id)s AND activo = TRUE
+        RETURNING id, {campo} AS saldo
+    ),
+    stock AS (
+        UPDATE inventario_actual
+        SET litros_disponibles = litros_disponibles - %(litros)s,
+            ultimo_movimiento_id = nextval(pg_get_serial_sequence('inventario', 'id')),
+            fecha_actualizacion = CURRENT_TIMESTAMP
+        WHERE tipo_combustible = %(tipo)s
+          AND EXISTS (SELECT 1 FROM cliente)
+        RETURNING litros_disponibles, ultimo_movimiento_id
+    ),
+    retiro AS (
+        INSERT INTO retiros (cliente_id, fecha, hora, litros, usuario_id, tipo_combustible)
+        SELECT id, CURRENT_DATE, CURRENT_TIME, %(litros)s, %(usuario_id)s, %(tipo)s FROM cliente
+        RETURNING id, fecha, tipo_combustible, cliente_id, litros
+    ),''' + CTE_CONSUMO_DIARIO.format(origen='retiro') + ''',
+    movimiento AS (
+        INSERT INTO inventario (id, tipo_combustible, litros_ingresados, litros_disponibles, usuario_id, observaciones)
+        SELECT stock.ultimo_movimiento_id, %(tipo)s, 0 - %(litros)s, stock.litros_disponibles, %(usuario_id)s,
+               'Retiro #' || retiro.id || ' - Cliente ID: ' || %(cliente_id)s
+        FROM stock, retiro
+    )
+    SELECT retiro.id, cliente.saldo,
+           (SELECT litros_disponibles FROM stock) AS inventario,
+           pg_notify(''' + f"'{CANAL_EVENTOS}'" + ''', json_build_object(
+               'evento', 'retiro', 'id', retiro.id, 'cliente_id', retiro.cliente_id,
+               'tipo_combustible', retiro.tipo_combustible, 'litros', retiro.litros,
+               'inventario', json_build_object(retiro.tipo_combustible,
+                                               (SELECT litros_disponibles FROM stock)))::text)
+    FROM retiro, cliente
+'''
+
+def ejecutar_en_un_viaje(db, cursor, sql, params):
+    """
+    Ejecuta una sentencia autocontenida como su propia transacción.
+
+    Con la conexión en autocommit psycopg2 no envía BEGIN ni COMMIT, así que
+    la sentencia completa viaja en un solo round trip. Si ya hay una
+    transacción abierta en la petición, la sentencia se suma a ella.
+    """
+    if db.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        cursor.execute(sql, params)
+        db.commit()
+        return cursor.fetchone()
+
+    db.autocommit = True
+    try:
+        cursor.execute(sql, params)
+        return cursor.fetchone()
+    finally:
+        db.autocommit = False
+
 @app.route('/api/retiros', methods=['POST'])
 @token_required
 def registrar_retiro():
@@ -909,101 +920,168 @@ def registrar_retiro():
         if litros <= 0:
             return jsonify({'error': 'La cantidad debe ser mayor a cero'}), 400
 
-        # Verificar si el cliente existe y tiene saldo suficiente
-        cursor.execute('SELECT * FROM clientes WHERE id = %s AND activo = TRUE', (cliente_id,))
-        cliente = cursor.fetchone()
-        
-        if not cliente:
-            return jsonify({'error': 'Cliente no encontrado'}), 404
-            
-        # Verificar saldo disponible del cliente
+        if tipo_combustible not in TIPOS_COMBUSTIBLE:
+            return jsonify({'error': 'Tipo de combustible inválido. Use "gasoil" o "gasolina"'}), 400
+
+        # El saldo del cliente y el inventario no se validan (igual que antes):
+        # se permite el retiro aunque queden en negativo.
         campo_disponible = f'litros_disponibles_{tipo_combustible}'
-        saldo_actual = cliente.get(campo_disponible, 0)
-        
-        # if saldo_actual < litros:
-        #     return jsonify({'error': f'Saldo insuficiente de {tipo_combustible}. Disponible: {saldo_actual}'}), 400
-        
-        # Verificar inventario disponible
-        cursor.execute('SELECT id, litros_disponibles FROM inventario WHERE tipo_combustible = %s ORDER BY id DESC LIMIT 1', (tipo_combustible,))
-        inventario = cursor.fetchone()
-        
-        if not inventario: # or inventario['litros_disponibles'] < litros:
-             # Permitir retiro aunque no haya inventario registrado por ahora, o descomentar para restringir
-             pass
+        retiro = ejecutar_en_un_viaje(db, cursor, SQL_RETIRO_ATOMICO.format(campo=campo_disponible), {
+            'cliente_id': cliente_id,
+            'litros': litros,
+            'tipo': tipo_combustible,
+            'usuario_id': g.usuario_id,
+        })
         
-        # Registrar el retiro
-        cursor.execute('''
-            INSERT INTO retiros (cliente_id, fecha, hora, litros, usuario_id, tipo_combustible)
-            VALUES (%s, CURRENT_DATE, CURRENT_TIME, %s, %s, %s)
-        ''', (cliente_id, litros, g.usuario_id, tipo_combustible))
+        if not retiro:
+            return jsonify({'error': 'Cliente no encontrado'}), 404
         
-        # Actualizar el saldo del cliente
-        # Actualizar el saldo del cliente
-        print(f"DEBUG: Actualizando cliente {cliente_id}, descontando {litros} de {campo_disponible}")
-        cursor.execute(f'''
-            UPDATE clientes 
-            SET litros_disponibles = COALESCE(litros_disponibles, 0) - %s,
-                {campo_disponible} = COALESCE({campo_disponible}, 0) - %s
-            WHERE id = %s
-        ''', (litros, litros, cliente_id))
-        print(f"DEBUG: Filas actualizadas en clientes: {cursor.rowcount}")
-        
-        # Actualizar inventario (restar del último registro)
-        if inventario:
-            cursor.execute('''
-                UPDATE inventario 
-                SET litros_disponibles = litros_disponibles - %s 
-                WHERE id = %s
-            ''', (litros, inventario['id']))
+        marcar_cambios('retiros', 'clientes', 'inventario')
         
-        db.commit()
-        return jsonify({'mensaje': 'Retiro registrado exitosamente'}), 201
+        return jsonify({
+            'mensaje': 'Retiro registrado exitosamente',
+            'id': retiro['id'],
+            'saldo_disponible': retiro['saldo'],
+            'inventario_disponible': retiro['inventario']
+        }), 201
     except Exception as e:
         db.rollback()
-        print(f"Error en retiro: {e}")
+        log.exception("Error en retiro")
         return jsonify({'error': str(e)}), 400
 
 # Ruta para obtener el historial de retiros
+RETIROS_LIMITE_DEFECTO = 50
+RETIROS_LIMITE_MAXIMO = 500
+
+def codificar_cursor(*valores):
+    crudo = json.dumps([v.isoformat() if hasattr(v, 'isoformat') else v for v in valores])
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip('=')
+
+def decodificar_cursor(cursor_param):
+    relleno = '=' * (-len(cursor_param) % 4)
+    return json.loads(base64.urlsafe_b64decode(cursor_param + relleno).decode())
+
 @app.route('/api/retiros', methods=['GET'])
 @token_required
 def obtener_retiros():
+    """
+    Historial de retiros ordenado por (fecha, hora, id) descendente.
+
+    Sin `limit` ni `cursor` devuelve la lista completa (compatibilidad).
+    Con `limit` y/o `cursor` pagina por keyset y devuelve
+    {'retiros': [...], 'next_cursor': ...}; `next_cursor` es None en la
+    última página.
+    """
     cliente_id = request.args.get('cliente_id')
     fecha_inicio = request.args.get('fecha_inicio')
     fecha_fin = request.args.get('fecha_fin')
+    cursor_param = request.args.get('cursor')
+    paginado = 'limit' in request.args or cursor_param is not None
+    
+    limite = None
+    if paginado:
+        limite = request.args.get('limit', RETIROS_LIMITE_DEFECTO, type=int)
+        limite = max(1, min(limite, RETIROS_LIMITE_MAXIMO))
+    
+    clave_cursor = None
+    if cursor_param:
+        try:
+            clave_cursor = tuple(decodificar_cursor(cursor_param))
+            fecha_cursor, hora_cursor, id_cursor = clave_cursor
+        except Exception:
+            return jsonify({'error': 'Cursor inválido'}), 400
     
     db = get_db()
     cursor = db.cursor()
     
-    query = '''
-        SELECT r.*, c.nombre as cliente_nombre, u.nombre as usuario_nombre 
-        FROM retiros r
-        JOIN clientes c ON r.cliente_id = c.id
-        JOIN usuarios u ON r.usuario_id = u.id
-        WHERE 1=1
-    '''
-    params = []
-    
-    if cliente_id:
-        query += ' AND r.cliente_id = %s'
-        params.append(cliente_id)
+    def consultar(origen, params):
+        query = f'''
+            SELECT r.*, c.nombre as cliente_nombre, u.nombre as usuario_nombre 
+            FROM {origen} r
+            JOIN clientes c ON r.cliente_id = c.id
+            JOIN usuarios u ON r.usuario_id = u.id
+            WHERE 1=1
+        '''
+        
+        # Todos los filtros comparan columnas sin funciones para que los índices
+        # (fecha, hora, id) y (cliente_id, fecha, hora, id) puedan usarse y las
+        # particiones mensuales fuera del rango de fechas se descarten.
+        if cliente_id:
+            query += ' AND r.cliente_id = %s'
+            params.append(cliente_id)
+            
+        if fecha_inicio:
+            query += ' AND r.fecha >= %s'
+            params.append(fecha_inicio)
+            
+        if fecha_fin:
+            query += ' AND r.fecha <= %s'
+            params.append(fecha_fin)
         
-    if fecha_inicio:
-        query += ' AND r.fecha >= %s'
-        params.append(fecha_inicio)
+        if clave_cursor:
+            # La comparación de filas no poda particiones; `r.fecha <= %s` sí
+            query += ' AND r.fecha <= %s AND (r.fecha, r.hora, r.id) < (%s, %s, %s)'
+            params.extend([fecha_cursor, fecha_cursor, hora_cursor, id_cursor])
         
-    if fecha_fin:
-        query += ' AND r.fecha <= %s'
-        params.append(fecha_fin)
+        query += ' ORDER BY r.fecha DESC, r.hora DESC, r.id DESC'
+        
+        if limite:
+            # Una fila extra indica si hay página siguiente
+            query += ' LIMIT %s'
+            params.append(limite + 1)
+        
+        cursor.execute(query, params)
+        return [dict(row) for row in cursor.fetchall()]
     
-    query += ' ORDER BY r.fecha DESC, r.hora DESC'
+    retiros = consultar('retiros', [])
     
-    cursor.execute(query, params)
-    retiros = [dict(row) for row in cursor.fetchall()]
-    return jsonify(retiros)
+    # El archivo sólo tiene días anteriores a los de la tabla: se lee si el
+    # rango pedido llega a su último día y la página no se completó con
+    # filas más recientes que él
+    fuente = archivo.obtener_archivo()
+    ultimo_archivado = fuente.ultimo_dia('retiros')
+    leer_archivo = (ultimo_archivado is not None
+                    and (not fecha_inicio or fecha_inicio[:10] <= ultimo_archivado)
+                    and (not limite or len(retiros) <= limite or str(retiros[-1]['fecha']) <= ultimo_archivado))
+    if leer_archivo:
+        def archivada_en_pagina(fila):
+            return clave_cursor is None or (fila['fecha'], fila['hora'], fila['id']) < clave_cursor
+        
+        hasta = min(filter(None, (fecha_fin, clave_cursor and fecha_cursor)), default=None)
+        cliente_archivo = int(cliente_id) if cliente_id and cliente_id.isdigit() else None
+        if limite:
+            pagina = fuente.recientes('retiros', limite + 1, lambda f: (f['fecha'], f['hora'], f['id']),
+                                      fecha_inicio, hasta, archivada_en_pagina, cliente_archivo)
+            lotes = [pagina] if pagina else []
+        else:
+            # Sin paginar: una consulta por segmento, no el archivo entero en un parámetro
+            lotes = fuente.lotes('retiros', fecha_inicio, hasta, archivada_en_pagina, cliente_archivo)
+        for filas in lotes:
+            origen, params = archivo.origen_archivadas('retiros', filas)
+            retiros.extend(consultar(origen, params))
+        retiros.sort(key=lambda r: (r['fecha'], r['hora'], r['id']), reverse=True)
+        if limite:
+            retiros = retiros[:limite + 1]
+    
+    if not paginado:
+        return jsonify(retiros)
+    
+    next_cursor = None
+    if len(retiros) > limite:
+        retiros = retiros[:limite]
+        ultimo = retiros[-1]
+        next_cursor = codificar_cursor(ultimo['fecha'], ultimo['hora'], ultimo['id'])
+    
+    return jsonify({'retiros': retiros, 'next_cursor': next_cursor})
 
 # Rutas de estadísticas
+def fecha_actual():
+    # Las estadísticas y límites dependen del día: forma parte de la clave de caché
+    return datetime.now().date()
+
 @app.route('/api/estadisticas', methods=['GET'])
 @token_required
+@cacheada('clientes', 'retiros')
 def obtener_estadisticas_generales():
     db = get_db()
     cursor = db.cursor()
@@ -1028,74 +1106,51 @@ def obtener_estadisticas_generales():
 
 @app.route('/api/estadisticas/retiros', methods=['GET'])
 @token_required
+@cacheada('retiros', 'agendamientos', clave_extra=fecha_actual)
 def obtener_estadisticas_retiros():
     db = get_db()
     cursor = db.cursor()
     
     try:
-        # Litros hoy (Suma de retiros directos + agendamientos ENTREGADOS)
+        # Todo sale del resumen consumo_diario (retiros directos +
+        # agendamientos ENTREGADOS), a lo sumo unas cientos de filas.
         cursor.execute('''
-            SELECT 
-                (SELECT COALESCE(SUM(litros), 0) FROM retiros WHERE DATE(fecha) = CURRENT_DATE) +
-                (SELECT COALESCE(SUM(litros), 0) FROM agendamientos WHERE fecha_agendada = CURRENT_DATE AND estado = 'entregado') 
-            as total
+            SELECT
+                COALESCE(SUM(litros) FILTER (WHERE fecha = CURRENT_DATE), 0) AS hoy,
+                COALESCE(SUM(litros) FILTER (
+                    WHERE fecha >= DATE_TRUNC('month', CURRENT_DATE)
+                      AND fecha < DATE_TRUNC('month', CURRENT_DATE) + INTERVAL '1 month'
+                ), 0) AS mes,
+                COALESCE(SUM(litros), 0) AS ano,
+                (SELECT COUNT(DISTINCT cliente_id) FROM consumo_diario_clientes
+                 WHERE fecha = CURRENT_DATE) AS clientes_hoy
+            FROM consumo_diario
+            WHERE fecha >= DATE_TRUNC('year', CURRENT_DATE)
+              AND fecha < DATE_TRUNC('year', CURRENT_DATE) + INTERVAL '1 year'
         ''')
         res = cursor.fetchone()
-        litros_hoy = res['total'] if res and res['total'] else 0
+        litros_hoy = res['hoy']
+        litros_mes = res['mes']
+        litros_ano = res['ano']
+        clientes_hoy = res['clientes_hoy']
         
-        # Litros mes
+        # Retiros por día (últimos 7 días)
         cursor.execute('''
-            SELECT 
-                (SELECT COALESCE(SUM(litros), 0) FROM retiros WHERE TO_CHAR(fecha, 'YYYY-MM') = TO_CHAR(CURRENT_DATE, 'YYYY-MM')) +
-                (SELECT COALESCE(SUM(litros), 0) FROM agendamientos WHERE TO_CHAR(fecha_agendada, 'YYYY-MM') = TO_CHAR(CURRENT_DATE, 'YYYY-MM') AND estado = 'entregado')
-            as total
-        ''')
-        res = cursor.fetchone()
-        litros_mes = res['total'] if res and res['total'] else 0
-        
-        # Litros año
-        cursor.execute('''
-            SELECT 
-                (SELECT COALESCE(SUM(litros), 0) FROM retiros WHERE TO_CHAR(fecha, 'YYYY') = TO_CHAR(CURRENT_DATE, 'YYYY')) +
-                (SELECT COALESCE(SUM(litros), 0) FROM agendamientos WHERE TO_CHAR(fecha_agendada, 'YYYY') = TO_CHAR(CURRENT_DATE, 'YYYY') AND estado = 'entregado')
-            as total
-        ''')
-        res = cursor.fetchone()
-        litros_ano = res['total'] if res and res['total'] else 0
-        
-        # Clientes hoy (Union de ambos)
-        cursor.execute('''
-            SELECT COUNT(DISTINCT cliente_id) as total FROM (
-                SELECT cliente_id FROM retiros WHERE DATE(fecha) = CURRENT_DATE
-                UNION
-                SELECT cliente_id FROM agendamientos WHERE fecha_agendada = CURRENT_DATE AND estado = 'entregado'
-            ) as combined
-        ''')
-        clientes_hoy = cursor.fetchone()['total']
-        
-        # Retiros por día (últimos 7 días) - Combinado
-        cursor.execute('''
-            SELECT date_val as dia, SUM(total) as total
-            FROM (
-                SELECT DATE(fecha) as date_val, litros as total FROM retiros WHERE DATE(fecha) >= CURRENT_DATE - INTERVAL '7 days'
-                UNION ALL
-                SELECT fecha_agendada as date_val, litros as total FROM agendamientos WHERE fecha_agendada >= CURRENT_DATE - INTERVAL '7 days' AND estado = 'entregado'
-            ) as combined
-            GROUP BY date_val
-            ORDER BY date_val
+            SELECT fecha as dia, SUM(litros) as total
+            FROM consumo_diario
+            WHERE fecha >= CURRENT_DATE - INTERVAL '7 days'
+            GROUP BY fecha
+            ORDER BY fecha
         ''')
         retiros_dia = [dict(row) for row in cursor.fetchall()]
         
-        # Litros por mes (últimos 12 meses) - Combinado
+        # Litros por mes (últimos 12 meses)
         cursor.execute('''
-            SELECT month_val as mes, SUM(total) as total
-            FROM (
-                SELECT TO_CHAR(fecha, 'YYYY-MM') as month_val, litros as total FROM retiros WHERE DATE(fecha) >= CURRENT_DATE - INTERVAL '12 months'
-                UNION ALL
-                SELECT TO_CHAR(fecha_agendada, 'YYYY-MM') as month_val, litros as total FROM agendamientos WHERE fecha_agendada >= CURRENT_DATE - INTERVAL '12 months' AND estado = 'entregado'
-            ) as combined
-            GROUP BY month_val
-            ORDER BY month_val
+            SELECT TO_CHAR(fecha, 'YYYY-MM') as mes, SUM(litros) as total
+            FROM consumo_diario
+            WHERE fecha >= CURRENT_DATE - INTERVAL '12 months'
+            GROUP BY 1
+            ORDER BY 1
         ''')
         litros_por_mes = [dict(row) for row in cursor.fetchall()]
         
@@ -1108,17 +1163,19 @@ def obtener_estadisticas_retiros():
             'litrosPorMes': litros_por_mes
         })
     except Exception as e:
-        print(f"Error stats: {e}")
+        log.exception("Error stats")
         return jsonify({'error': str(e)}), 500
 
 # Rutas de agendamientos
 @app.route('/api/agendamientos/dia/<fecha>', methods=['GET'])
+@con_etag('agendamientos', 'clientes')
 def obtener_agendamientos_dia(fecha):
     db = get_db()
     cursor = db.cursor()
     
     try:
-        cursor.execute('''
+        origen, params = origen_historial('agendamientos', fecha, fecha)
+        cursor.execute(f'''
             SELECT 
                 a.id,
                 a.cliente_id,
@@ -1136,19 +1193,69 @@ def obtener_agendamientos_dia(fecha):
                 s.nombre AS subcliente_nombre,
                 s.cedula AS subcliente_cedula,
                 s.placa AS subcliente_placa
-            FROM agendamientos a
+            FROM {origen} a
             JOIN clientes c ON a.cliente_id = c.id
             LEFT JOIN clientes s ON a.subcliente_id = s.id
             WHERE a.fecha_agendada = %s
             ORDER BY a.codigo_ticket ASC
-        ''', (fecha,))
+        ''', params + [fecha])
         
         agendamientos = [dict(row) for row in cursor.fetchall()]
         return jsonify(agendamientos)
-    except Exception as e:
-        print(f"Error al obtener agendamientos: {e}")
+    except Exception:
+        log.exception("Error al obtener agendamientos")
         return jsonify({'error': 'Error interno del servidor'}), 500
 
+# Código de ticket: contador por día en ticket_counters, avanzado con un
+# upsert (O(1), sin recorrer los agendamientos del día y sin duplicados bajo
+# concurrencia porque el UPDATE bloquea la fila del contador).
+SQL_INSERTAR_AGENDAMIENTO = '''
+    WITH ticket AS (
+        INSERT INTO ticket_counters (fecha, tipo, ultimo)
+        VALUES (%s, 'agendamiento', 1)
+        ON CONFLICT (fecha, tipo) DO UPDATE SET ultimo = ticket_counters.ultimo + 1
+        RETURNING ultimo
+    )
+    INSERT INTO agendamientos (
+        cliente_id, tipo_combustible, litros, fecha_agendada,
+        subcliente_id, estado, codigo_ticket
+    )
+    SELECT %s, %s, %s, %s, %s, 'pendiente', ultimo FROM ticket
+    RETURNING id, codigo_ticket
+'''
+
+# Capacidad diaria de despacho: cada agendamiento reserva sus litros en
+# limites_diarios con un upsert condicionado (O(1), sin sumar los
+# agendamientos del día; el ON CONFLICT bloquea la fila, así que dos reservas
+# concurrentes no pueden pasarse del límite). Lo ya entregado sigue ocupando
+# capacidad en litros_procesados. Sólo la gasolina tiene límite; para el
+# gasoil el límite es NULL y la reserva siempre entra.
+LIMITE_DIARIO_DEFECTO = 2000
+
+SQL_RESERVAR_CAPACIDAD = '''
+    WITH limite AS (
+        SELECT CASE WHEN %(tipo)s = 'gasolina' THEN COALESCE(
+                   (SELECT NULLIF(limite_diario_gasolina, 0) FROM sistema_config WHERE id = 1),
+                   %(defecto)s)
+               END AS litros
+    )
+    INSERT INTO limites_diarios (fecha, tipo_combustible, litros_agendados, litros_procesados)
+    SELECT %(fecha)s, %(tipo)s, %(litros)s, 0 FROM limite
+    WHERE limite.litros IS NULL OR %(litros)s <= limite.litros
+    ON CONFLICT (fecha, tipo_combustible) DO UPDATE
+    SET litros_agendados = limites_diarios.litros_agendados + EXCLUDED.litros_agendados
+    WHERE (SELECT litros FROM limite) IS NULL
+       OR limites_diarios.litros_agendados + limites_diarios.litros_procesados
+          + EXCLUDED.litros_agendados <= (SELECT litros FROM limite)
+    RETURNING litros_agendados
+'''
+
+SQL_CAPACIDAD_DIA = '''
+    SELECT litros_agendados + litros_procesados AS ocupados
+    FROM limites_diarios
+    WHERE fecha = %s AND tipo_combustible = %s
+'''
+
 @app.route('/api/agendamientos', methods=['POST'])
 @token_required
 def crear_agendamiento():
@@ -1186,10 +1293,8 @@ def crear_agendamiento():
         # 1. Verificar INVENTARIO GLOBAL disponible
         cursor.execute('''
             SELECT litros_disponibles 
-            FROM inventario 
-            WHERE tipo_combustible = %s 
-            ORDER BY id DESC 
-            LIMIT 1
+            FROM inventario_actual 
+            WHERE tipo_combustible = %s
         ''', (tipo_combustible,))
         
         inventario_row = cursor.fetchone()
@@ -1203,9 +1308,14 @@ def crear_agendamiento():
                 'tipo_combustible': tipo_combustible
             }), 400
         
-        # 2. Verificar saldo disponible del cliente
-        cursor.execute('SELECT * FROM clientes WHERE id = %s AND activo = TRUE', (cliente_id,))
-        cliente = cursor.fetchone()
+        # 2. Verificar saldo disponible del cliente (del modelo en memoria si
+        # está al día; el UPDATE de abajo vuelve a comprobarlo en la base)
+        modelo = modelo_clientes.disponible()
+        if modelo:
+            cliente = modelo.por_id(cliente_id)
+        else:
+            cursor.execute('SELECT * FROM clientes WHERE id = %s AND activo = TRUE', (cliente_id,))
+            cliente = cursor.fetchone()
         
         if not cliente:
             return jsonify({'error': 'Cliente no encontrado'}), 404
@@ -1219,33 +1329,23 @@ def crear_agendamiento():
                  'error': f'Saldo insuficiente. Disponible: {saldo_actual}L, Solicitado: {litros}L'
              }), 400
         
-        # 3. Generar código de ticket (número secuencial para la fecha agendada)
-        cursor.execute('''
-            SELECT COALESCE(MAX(codigo_ticket), 0) + 1 as next_ticket
-            FROM agendamientos
-            WHERE fecha_agendada = %s
-        ''', (fecha_agendada,))
-        
-        codigo_ticket = cursor.fetchone()['next_ticket']
-        
-        # 4. Insertar agendamiento con código de ticket
-        cursor.execute('''
-            INSERT INTO agendamientos (
-                cliente_id, tipo_combustible, litros, fecha_agendada, 
-                subcliente_id, estado, codigo_ticket
-            ) VALUES (%s, %s, %s, %s, %s, 'pendiente', %s)
-        ''', (cliente_id, tipo_combustible, litros, fecha_agendada, subcliente_id, codigo_ticket))
-        
-        # 5. ACTUALIZAR SALDO DEL CLIENTE (Restar litros)
-        print(f"DEBUG: Descontando {litros}L de {tipo_combustible} al cliente {cliente_id}")
+        # 3. ACTUALIZAR SALDO DEL CLIENTE (Restar litros) sólo si todavía alcanza
+        log.debug("Descontando %sL de %s al cliente %s", litros, tipo_combustible, cliente_id)
         cursor.execute(f'''
             UPDATE clientes 
             SET litros_disponibles = COALESCE(litros_disponibles, 0) - %s,
                 {campo_disponible} = COALESCE({campo_disponible}, 0) - %s
-            WHERE id = %s
-        ''', (litros, litros, cliente_id))
+            WHERE id = %s AND activo = TRUE AND COALESCE({campo_disponible}, 0) >= %s
+            RETURNING {campo_disponible} AS saldo
+        ''', (litros, litros, cliente_id, litros))
+        saldo = cursor.fetchone()
+        if not saldo:
+            db.rollback()
+            return jsonify({
+                'error': f'Saldo insuficiente. Solicitado: {litros}L'
+            }), 400
         
-        # 6. Si hay subcliente, también actualizar su saldo
+        # 4. Si hay subcliente, también actualizar su saldo
         if subcliente_id:
             cursor.execute(f'''
                 UPDATE subclientes 
@@ -1253,41 +1353,102 @@ def crear_agendamiento():
                 WHERE id = %s
             ''', (litros, subcliente_id))
         
-        # 7. ACTUALIZAR INVENTARIO GLOBAL - RESTAR LITROS
-        # Calcular nuevo inventario disponible
-        nuevo_inventario = inventario_disponible - litros
+        # 5. Reservar capacidad del día agendado (sólo si todavía cabe)
+        cursor.execute(SQL_RESERVAR_CAPACIDAD, {
+            'fecha': fecha_agendada,
+            'tipo': tipo_combustible,
+            'litros': litros,
+            'defecto': LIMITE_DIARIO_DEFECTO
+        })
+        if not cursor.fetchone():
+            cursor.execute(SQL_CAPACIDAD_DIA, (fecha_agendada, tipo_combustible))
+            ocupados = cursor.fetchone()
+            cursor.execute('SELECT limite_diario_gasolina FROM sistema_config WHERE id = 1')
+            config = cursor.fetchone()
+            limite_diario = (config['limite_diario_gasolina'] if config and config['limite_diario_gasolina']
+                             else LIMITE_DIARIO_DEFECTO)
+            capacidad_disponible = max(limite_diario - (ocupados['ocupados'] if ocupados else 0), 0)
+            db.rollback()
+            return jsonify({
+                'error': f'Capacidad diaria de {tipo_combustible} agotada para {fecha_agendada}. '
+                         f'Disponible: {capacidad_disponible}L, Solicitado: {litros}L',
+                'capacidad_disponible': capacidad_disponible,
+                'limite_diario': limite_diario
+            }), 400
         
-        # Insertar nuevo registro en el historial de inventario (como salida/retiro)
-        print(f"DEBUG: Descontando {litros}L de inventario de {tipo_combustible}. Antes: {inventario_disponible}L, Después: {nuevo_inventario}L")
-        cursor.execute('''
-            INSERT INTO inventario (
-                tipo_combustible, litros_ingresados, litros_disponibles, 
-                usuario_id, observaciones
-            ) VALUES (%s, %s, %s, %s, %s)
-        ''', (
-            tipo_combustible, 
-            -litros,  # Negativo porque es una salida
-            nuevo_inventario,
-            g.usuario_id if hasattr(g, 'usuario_id') else None,
-            f'Agendamiento #{codigo_ticket} - Cliente ID: {cliente_id}'
-        ))
+        # 6. Insertar agendamiento con el siguiente código de ticket del día.
+        # El contador se avanza lo más tarde posible para que el bloqueo sobre
+        # su fila dure sólo hasta el commit.
+        try:
+            cursor.execute(SQL_INSERTAR_AGENDAMIENTO, (
+                fecha_agendada, cliente_id, tipo_combustible, litros, fecha_agendada, subcliente_id
+            ))
+        except psycopg2.errors.CheckViolation:
+            # No hay partición para ese mes: sólo existen hasta
+            # PARTICIONES_MESES_ADELANTE meses en el futuro (ver particiones.py)
+            db.rollback()
+            return jsonify({'error': f'Fecha de agendamiento fuera de rango: {fecha_agendada}'}), 400
+        agendamiento = cursor.fetchone()
+        codigo_ticket = agendamiento['codigo_ticket']
         
+        # 7. ACTUALIZAR INVENTARIO GLOBAL - RESTAR LITROS
+        # La salida se registra sólo si la existencia sigue alcanzando; otro
+        # agendamiento concurrente pudo consumirla después de la verificación.
+        cursor.execute(SQL_SALIDA_INVENTARIO, {
+            'tipo': tipo_combustible,
+            'litros': litros,
+            'usuario_id': g.usuario_id if hasattr(g, 'usuario_id') else None,
+            'observaciones': f'Agendamiento #{codigo_ticket} - Cliente ID: {cliente_id}'
+        })
+        movimiento = cursor.fetchone()
+        if not movimiento:
+            db.rollback()
+            return jsonify({
+                'error': f'Inventario insuficiente de {tipo_combustible}. Solicitado: {litros}L',
+                'tipo_combustible': tipo_combustible
+            }), 400
+        nuevo_inventario = movimiento['litros_disponibles']
+        log.debug("Descontando %sL de inventario de %s. Antes: %sL, Después: %sL",
+                  litros, tipo_combustible, inventario_disponible, nuevo_inventario)
+        
+        notificar(cursor, 'agendamiento',
+                  id=agendamiento['id'], codigo_ticket=codigo_ticket, fecha=fecha_agendada,
+                  tipo_combustible=tipo_combustible, litros=litros,
+                  inventario={tipo_combustible: nuevo_inventario})
         db.commit()
+        marcar_cambios('agendamientos', 'clientes', 'subclientes', 'inventario', 'limites_diarios')
         
         return jsonify({
             'message': 'Agendamiento creado exitosamente',
-            'id': cursor.lastrowid,
+            'id': agendamiento['id'],
             'codigo_ticket': codigo_ticket,
             'fecha_agendada': fecha_agendada,
-            'nuevo_saldo_cliente': saldo_actual - litros,
+            'nuevo_saldo_cliente': saldo['saldo'],
             'nuevo_inventario': nuevo_inventario
         }), 201
-    except Exception as e:
+    except Exception:
         db.rollback()
-        print(f"Error al crear agendamiento: {e}")
+        log.exception("Error al crear agendamiento")
         return jsonify({'error': 'Error interno del servidor'}), 500
 
 
+SQL_ENTREGAR_AGENDAMIENTO = '''
+    WITH entregado AS (
+        UPDATE agendamientos
+        SET estado = 'entregado'
+        WHERE id = %(id)s AND estado <> 'entregado'
+        RETURNING fecha_agendada AS fecha, tipo_combustible, cliente_id, litros
+    ),
+    capacidad AS (
+        UPDATE limites_diarios l
+        SET litros_agendados = GREATEST(l.litros_agendados - e.litros, 0),
+            litros_procesados = l.litros_procesados + e.litros
+        FROM entregado e
+        WHERE l.fecha = e.fecha AND l.tipo_combustible = e.tipo_combustible
+    ),''' + CTE_CONSUMO_DIARIO.format(origen='entregado') + '''
+    SELECT COUNT(*) AS entregados, MAX(fecha) AS fecha FROM entregado
+'''
+
 @app.route('/api/agendamientos/<int:agendamiento_id>/entregar', methods=['PATCH'])
 @token_required
 def marcar_como_entregado(agendamiento_id):
@@ -1295,28 +1456,29 @@ def marcar_como_entregado(agendamiento_id):
     cursor = db.cursor()
     
     try:
-        # Verificar que el agendamiento existe
-        cursor.execute('SELECT id, estado FROM agendamientos WHERE id = %s', (agendamiento_id,))
-        agendamiento = cursor.fetchone()
-        
-        if not agendamiento:
-            return jsonify({'error': 'Agendamiento no encontrado'}), 404
-        
-        # Actualizar estado a 'entregado'
-        cursor.execute('''
-            UPDATE agendamientos 
-            SET estado = 'entregado'
-            WHERE id = %s
-        ''', (agendamiento_id,))
+        # Actualizar estado a 'entregado', pasar sus litros de agendados a
+        # procesados y sumar al consumo del día. Un agendamiento ya entregado
+        # no se vuelve a contar.
+        cursor.execute(SQL_ENTREGAR_AGENDAMIENTO, {'id': agendamiento_id})
+        entrega = cursor.fetchone()
+        
+        if not entrega['entregados']:
+            # Verificar que el agendamiento existe
+            cursor.execute('SELECT id, estado FROM agendamientos WHERE id = %s', (agendamiento_id,))
+            if not cursor.fetchone():
+                return jsonify({'error': 'Agendamiento no encontrado'}), 404
+        else:
+            notificar(cursor, 'entrega', id=agendamiento_id, fecha=entrega['fecha'])
         
         db.commit()
+        marcar_cambios('agendamientos', 'limites_diarios')
         return jsonify({
             'message': 'Agendamiento marcado como entregado',
             'id': agendamiento_id
         }), 200
-    except Exception as e:
+    except Exception:
         db.rollback()
-        print(f"Error al marcar como entregado: {e}")
+        log.exception("Error al marcar como entregado")
         return jsonify({'error': 'Error interno del servidor'}), 500
 
 @app.route('/api/agendamientos/cliente/<int:cliente_id>', methods=['GET'])
@@ -1325,7 +1487,8 @@ def obtener_agendamientos_cliente(cliente_id):
     cursor = db.cursor()
     
     try:
-        cursor.execute('''
+        origen, params = origen_historial('agendamientos', cliente_id=cliente_id)
+        cursor.execute(f'''
             SELECT 
                 a.id,
                 a.cliente_id,
@@ -1339,20 +1502,21 @@ def obtener_agendamientos_cliente(cliente_id):
                 s.nombre AS subcliente_nombre,
                 s.cedula AS subcliente_cedula,
                 s.placa AS subcliente_placa
-            FROM agendamientos a
+            FROM {origen} a
             LEFT JOIN subclientes s ON a.subcliente_id = s.id
             WHERE a.cliente_id = %s
             ORDER BY a.fecha_agendada DESC, a.fecha_creacion DESC
-        ''', (cliente_id,))
+        ''', params + [cliente_id])
         
         agendamientos = [dict(row) for row in cursor.fetchall()]
         return jsonify(agendamientos)
-    except Exception as e:
-        print(f"Error al obtener agendamientos del cliente: {e}")
+    except Exception:
+        log.exception("Error al obtener agendamientos del cliente")
         return jsonify({'error': 'Error interno del servidor'}), 500
 
 # Rutas de sistema y administración
 @app.route('/api/sistema/limites', methods=['GET'])
+@cacheada('limites_diarios', 'sistema_config', clave_extra=fecha_actual)
 def obtener_limites():
     db = get_db()
     cursor = db.cursor()
@@ -1360,46 +1524,37 @@ def obtener_limites():
     try:
         from datetime import datetime, timedelta
         
-        # Obtener configuración
-        cursor.execute('SELECT limite_diario_gasolina FROM sistema_config WHERE id = 1')
-        config = cursor.fetchone()
-        limite_diario = config['limite_diario_gasolina'] if config and config['limite_diario_gasolina'] else 2000
-        
         # Fechas
         hoy = datetime.now().strftime('%Y-%m-%d')
         mañana = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
         
-        # Límites de hoy
-        cursor.execute('''
-            SELECT litros_agendados, litros_procesados 
-            FROM limites_diarios 
-            WHERE fecha = %s AND tipo_combustible = 'gasolina'
-        ''', (hoy,))
-        limites_hoy = cursor.fetchone()
-        
-        # Límites de mañana
+        # Configuración y límites de hoy y mañana en una sola consulta
         cursor.execute('''
-            SELECT litros_agendados 
-            FROM limites_diarios 
-            WHERE fecha = %s AND tipo_combustible = 'gasolina'
-        ''', (mañana,))
-        limites_mañana = cursor.fetchone()
+            SELECT d.fecha, COALESCE(l.litros_agendados, 0) AS litros_agendados,
+                   COALESCE(l.litros_procesados, 0) AS litros_procesados,
+                   (SELECT limite_diario_gasolina FROM sistema_config WHERE id = 1) AS limite_diario_gasolina
+            FROM (VALUES (%s::date), (%s::date)) AS d (fecha)
+            LEFT JOIN limites_diarios l ON l.fecha = d.fecha AND l.tipo_combustible = 'gasolina'
+            ORDER BY d.fecha
+        ''', (hoy, mañana))
+        limites_hoy, limites_mañana = cursor.fetchall()
+        limite_diario = limites_hoy['limite_diario_gasolina'] or LIMITE_DIARIO_DEFECTO
         
         return jsonify({
             'limite_diario': limite_diario,
             'hoy': {
                 'fecha': hoy,
-                'agendados': limites_hoy['litros_agendados'] if limites_hoy else 0,
-                'procesados': limites_hoy['litros_procesados'] if limites_hoy else 0
+                'agendados': limites_hoy['litros_agendados'],
+                'procesados': limites_hoy['litros_procesados']
             },
             'mañana': {
                 'fecha': mañana,
-                'agendados': limites_mañana['litros_agendados'] if limites_mañana else 0,
-                'disponible': limite_diario - (limites_mañana['litros_agendados'] if limites_mañana else 0)
+                'agendados': limites_mañana['litros_agendados'],
+                'disponible': limite_diario - (limites_mañana['litros_agendados'] + limites_mañana['litros_procesados'])
             }
         })
-    except Exception as e:
-        print(f"Error al obtener límites: {e}")
+    except Exception:
+        log.exception("Error al obtener límites")
         return jsonify({'error': 'Error interno del servidor'}), 500
 
 @app.route('/api/sistema/bloqueo', methods=['GET', 'POST'])
@@ -1419,55 +1574,103 @@ def sistema_bloqueo():
             
         bloqueado = request.json.get('bloqueado', False)
         cursor.execute('UPDATE sistema_config SET retiros_bloqueados = %s WHERE id = 1', (1 if bloqueado else 0,))
+        notificar(cursor, 'sistema', bloqueado=bool(bloqueado))
         db.commit()
+        marcar_cambios('sistema_config')
         
         estado = "bloqueados" if bloqueado else "desbloqueados"
         return jsonify({'message': f'Retiros {estado} exitosamente'})
 
+@app.route('/api/sistema/pool', methods=['GET'])
+@token_required
+def metricas_pool():
+    if not g.es_admin:
+        return jsonify({'error': 'No autorizado'}), 403
+
+    return jsonify(obtener_pool().metricas())
+
+@app.route('/api/sistema/cache', methods=['GET'])
+@token_required
+def estadisticas_cache():
+    if not g.es_admin:
+        return jsonify({'error': 'No autorizado'}), 403
+
+    return jsonify(cache.estadisticas())
+
+@app.route('/api/sistema/eventos', methods=['GET'])
+@token_required
+def metricas_eventos():
+    if not g.es_admin:
+        return jsonify({'error': 'No autorizado'}), 403
+
+    return jsonify(obtener_difusor().metricas())
+
+@app.route('/api/sistema/modelo-clientes', methods=['GET'])
+@token_required
+def metricas_modelo_clientes():
+    if not g.es_admin:
+        return jsonify({'error': 'No autorizado'}), 403
+
+    return jsonify(modelo_clientes.obtener_modelo().metricas())
+
+@app.route('/api/sistema/arranque', methods=['GET'])
+@token_required
+def metricas_arranque():
+    if not g.es_admin:
+        return jsonify({'error': 'No autorizado'}), 403
+
+    return jsonify(arranque.resumen())
+
+# Para el scraper de Prometheus: no usa JWT; con METRICAS_TOKEN exige ese token
+@app.route('/metrics', methods=['GET'])
+def exponer_metricas():
+    if not metricas.autorizado(request.headers.get('Authorization')):
+        return jsonify({'error': 'No autorizado'}), 401
+
+    cuerpo, tipo = metricas.exposicion()
+    return Response(cuerpo, content_type=tipo)
+
 @app.route('/api/admin/reset-litros', methods=['POST'])
 @token_required
 def reset_litros():
     if not g.es_admin:
         return jsonify({'error': 'No autorizado'}), 403
         
-    db = get_db()
-    cursor = db.cursor()
-    
     try:
-        # Resetear litros disponibles a su valor mensual
-        cursor.execute('''
-            UPDATE clientes 
-            SET litros_disponibles = litros_mes,
-                litros_disponibles_gasolina = litros_mes_gasolina,
-                litros_disponibles_gasoil = litros_mes_gasoil
-            WHERE activo = TRUE
-        ''')
+        # Resetear litros disponibles a su valor mensual (por lotes, igual que
+        # el reset diario programado)
+        resultado = reset_diario.ejecutar_reset(forzar=True)
+        if resultado['estado'] == 'ocupado':
+            return jsonify({'error': 'Ya hay un reset de litros en curso'}), 409
         
-        changes = cursor.rowcount
-        db.commit()
-        return jsonify({'message': 'Litros reseteados exitosamente', 'clientes_actualizados': changes})
+        return jsonify({
+            'message': 'Litros reseteados exitosamente',
+            'clientes_actualizados': resultado['clientes'],
+            'subclientes_actualizados': resultado['subclientes']
+        })
     except Exception as e:
-        db.rollback()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/admin/reset-diario', methods=['GET'])
+@token_required
+def estado_reset_diario():
+    if not g.es_admin:
+        return jsonify({'error': 'No autorizado'}), 403
+    
+    return jsonify(reset_diario.progreso())
+
 # Rutas de inventario
 @app.route('/api/inventario/estado', methods=['GET'])
+@cacheada('inventario')
 def obtener_estado_inventario():
     db = get_db()
     cursor = db.cursor()
     
     try:
-        cursor.execute('SELECT tipo_combustible, litros_disponibles FROM inventario ORDER BY id DESC')
-        inventarios = cursor.fetchall()
-        
-        # Obtener el último registro de cada tipo de combustible
-        estado_inventario = {}
-        tipos_vistos = set()
-        for inv in inventarios:
-            tipo = inv['tipo_combustible']
-            if tipo not in tipos_vistos:
-                estado_inventario[tipo] = inv['litros_disponibles']
-                tipos_vistos.add(tipo)
+        cursor.execute('SELECT tipo_combustible, litros_disponibles FROM inventario_actual')
+        estado_inventario = {
+            inv['tipo_combustible']: inv['litros_disponibles'] for inv in cursor.fetchall()
+        }
         
         disponible = any(litros > 0 for litros in estado_inventario.values())
         
@@ -1475,8 +1678,8 @@ def obtener_estado_inventario():
             'inventario': estado_inventario,
             'disponible': disponible
         })
-    except Exception as e:
-        print(f"Error al obtener estado del inventario: {e}")
+    except Exception:
+        log.exception("Error al obtener estado del inventario")
         return jsonify({'error': 'Error interno del servidor'}), 500
 
 @app.route('/api/inventario', methods=['GET'])
@@ -1486,39 +1689,117 @@ def obtener_inventario():
     cursor = db.cursor()
     
     try:
-        # Obtener el último registro de cada tipo de combustible
-        cursor.execute('SELECT * FROM inventario WHERE tipo_combustible = %s ORDER BY id DESC LIMIT 1', ('gasoil',))
-        gasoil = cursor.fetchone()
-        
-        cursor.execute('SELECT * FROM inventario WHERE tipo_combustible = %s ORDER BY id DESC LIMIT 1', ('gasolina',))
-        gasolina = cursor.fetchone()
-        
-        # Devolver un array con ambos tipos
-        inventario = []
-        if gasoil:
-            inventario.append(dict(gasoil))
-        if gasolina:
-            inventario.append(dict(gasolina))
+        # Último movimiento de cada tipo de combustible con la existencia actual
+        cursor.execute('''
+            SELECT i.id, i.tipo_combustible, i.litros_ingresados, a.litros_disponibles,
+                   i.fecha_ingreso, i.usuario_id, i.observaciones
+            FROM inventario_actual a
+            JOIN inventario i ON i.id = a.ultimo_movimiento_id
+            ORDER BY a.tipo_combustible
+        ''')
+        inventario = [dict(row) for row in cursor.fetchall()]
         
         return jsonify(inventario)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+INVENTARIO_HISTORIAL_LIMITE_DEFECTO = 100
+INVENTARIO_HISTORIAL_LIMITE_MAXIMO = 1000
+
+# Historial por día: los días resumidos en inventario_diario (ver
+# libro_inventario.py) más los posteriores, agregados del libro al vuelo.
+SQL_INVENTARIO_POR_DIA = f'''
+    SELECT fecha, tipo_combustible, movimientos, entradas, salidas, litros_disponibles
+    FROM inventario_diario
+    UNION ALL
+    SELECT fecha, tipo_combustible, movimientos, entradas, salidas, litros_disponibles
+    FROM (
+        SELECT fecha_ingreso::date AS fecha, tipo_combustible, {libro_inventario.COLUMNAS_TOTALES}
+        FROM inventario
+        WHERE fecha_ingreso >= (SELECT COALESCE(MAX(fecha) + 1, '-infinity') FROM inventario_diario)
+        GROUP BY fecha_ingreso::date, tipo_combustible
+    ) recientes
+'''
+
 @app.route('/api/inventario/historial', methods=['GET'])
 @token_required
+@con_etag('inventario', 'usuarios')
 def obtener_historial_inventario():
+    """
+    Movimientos del libro de inventario, del más reciente al más antiguo.
+
+    Sin `limit` ni `cursor` devuelve la lista completa (compatibilidad).
+    Con `limit` y/o `cursor` pagina por (fecha_ingreso, id) y devuelve
+    {'historial': [...], 'next_cursor': ...}. Con `granularity=day`
+    devuelve, siempre paginado, un resumen por día y combustible
+    (movimientos, entradas, salidas y existencia al cierre).
+    """
+    granularidad = request.args.get('granularity', 'movement')
+    if granularidad not in ('day', 'movement'):
+        return jsonify({'error': "granularity debe ser 'day' o 'movement'"}), 400
+    cursor_param = request.args.get('cursor')
+    paginado = granularidad == 'day' or 'limit' in request.args or cursor_param is not None
+    
+    limite = None
+    if paginado:
+        limite = request.args.get('limit', INVENTARIO_HISTORIAL_LIMITE_DEFECTO, type=int)
+        limite = max(1, min(limite, INVENTARIO_HISTORIAL_LIMITE_MAXIMO))
+    
+    clave_cursor = None
+    if cursor_param:
+        try:
+            clave_cursor = tuple(decodificar_cursor(cursor_param))
+            if len(clave_cursor) != 2:
+                raise ValueError(cursor_param)
+        except Exception:
+            return jsonify({'error': 'Cursor inválido'}), 400
+    
     db = get_db()
     cursor = db.cursor()
     
     try:
-        cursor.execute('''
-            SELECT i.*, u.usuario as usuario_nombre 
-            FROM inventario i 
-            LEFT JOIN usuarios u ON i.usuario_id = u.id 
-            ORDER BY i.fecha_ingreso DESC
-        ''')
+        if granularidad == 'day':
+            query = f'SELECT * FROM ({SQL_INVENTARIO_POR_DIA}) d'
+            params = []
+            if clave_cursor:
+                query += ' WHERE (fecha, tipo_combustible) < (%s, %s)'
+                params.extend(clave_cursor)
+            query += ' ORDER BY fecha DESC, tipo_combustible DESC LIMIT %s'
+            params.append(limite + 1)
+            clave = lambda fila: (fila['fecha'], fila['tipo_combustible'])
+        else:
+            def archivada_en_pagina(fila):
+                return clave_cursor is None or (fila['fecha_ingreso'], fila['id']) < clave_cursor
+            
+            origen, params = origen_historial('inventario', hasta=clave_cursor[0] if clave_cursor else None,
+                                              condicion=archivada_en_pagina,
+                                              orden=lambda f: (f['fecha_ingreso'], f['id']),
+                                              limite=limite + 1 if limite else None)
+            query = f'''
+                SELECT i.*, u.usuario as usuario_nombre 
+                FROM {origen} i 
+                LEFT JOIN usuarios u ON i.usuario_id = u.id 
+            '''
+            if clave_cursor:
+                query += ' WHERE (i.fecha_ingreso, i.id) < (%s, %s)'
+                params.extend(clave_cursor)
+            query += ' ORDER BY i.fecha_ingreso DESC, i.id DESC'
+            if limite:
+                query += ' LIMIT %s'
+                params.append(limite + 1)
+            clave = lambda fila: (fila['fecha_ingreso'], fila['id'])
+        
+        cursor.execute(query, params)
         historial = [dict(row) for row in cursor.fetchall()]
-        return jsonify(historial)
+        
+        if not paginado:
+            return jsonify(historial)
+        
+        next_cursor = None
+        if len(historial) > limite:
+            historial = historial[:limite]
+            next_cursor = codificar_cursor(*clave(historial[-1]))
+        return jsonify({'historial': historial, 'next_cursor': next_cursor})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1543,21 +1824,18 @@ def crear_inventario():
         if litros_ingresados <= 0:
             return jsonify({'error': 'Ingrese una cantidad válida de litros'}), 400
         
-        # Obtener el inventario actual para el tipo de combustible específico
-        cursor.execute('SELECT * FROM inventario WHERE tipo_combustible = %s ORDER BY id DESC LIMIT 1', (tipo_combustible,))
-        inventario_actual = cursor.fetchone()
-        
-        litros_disponibles = (dict(inventario_actual)['litros_disponibles'] if inventario_actual else 0) + litros_ingresados
-        
-        # Insertar nuevo registro de inventario
-        cursor.execute('''
-            INSERT INTO inventario (tipo_combustible, litros_ingresados, litros_disponibles, usuario_id, observaciones)
-            VALUES (%s, %s, %s, %s, %s)
-        ''', (tipo_combustible, litros_ingresados, litros_disponibles, g.usuario_id, observaciones))
+        # Sumar a la existencia actual y registrar la entrada en el libro
+        movimiento = ejecutar_en_un_viaje(db, cursor, SQL_ENTRADA_INVENTARIO, {
+            'tipo': tipo_combustible,
+            'litros': litros_ingresados,
+            'usuario_id': g.usuario_id,
+            'observaciones': observaciones
+        })
+        litros_disponibles = movimiento['litros_disponibles']
+        marcar_cambios('inventario')
         
-        db.commit()
         return jsonify({
-            'id': cursor.lastrowid,
+            'id': movimiento['id'],
             'litros_ingresados': litros_ingresados,
             'litros_disponibles': litros_disponibles,
             'usuario_id': g.usuario_id,
@@ -1577,19 +1855,31 @@ def resetear_inventario():
     cursor = db.cursor()
     
     try:
-        # Obtener el último registro de gasoil
-        cursor.execute('SELECT id FROM inventario WHERE tipo_combustible = %s ORDER BY id DESC LIMIT 1', ('gasoil',))
-        gasoil_record = cursor.fetchone()
-        if gasoil_record:
-            cursor.execute('UPDATE inventario SET litros_disponibles = 0 WHERE id = %s', (dict(gasoil_record)['id'],))
-        
-        # Obtener el último registro de gasolina
-        cursor.execute('SELECT id FROM inventario WHERE tipo_combustible = %s ORDER BY id DESC LIMIT 1', ('gasolina',))
-        gasolina_record = cursor.fetchone()
-        if gasolina_record:
-            cursor.execute('UPDATE inventario SET litros_disponibles = 0 WHERE id = %s', (dict(gasolina_record)['id'],))
+        # Llevar la existencia a 0 registrando el ajuste en el libro
+        cursor.execute('''
+            WITH previo AS (
+                SELECT tipo_combustible, litros_disponibles
+                FROM inventario_actual
+                WHERE litros_disponibles <> 0
+                FOR UPDATE
+            ),
+            stock AS (
+                UPDATE inventario_actual a
+                SET litros_disponibles = 0,
+                    ultimo_movimiento_id = nextval(pg_get_serial_sequence('inventario', 'id')),
+                    fecha_actualizacion = CURRENT_TIMESTAMP
+                FROM previo p
+                WHERE a.tipo_combustible = p.tipo_combustible
+                RETURNING a.tipo_combustible, a.ultimo_movimiento_id, p.litros_disponibles AS anterior
+            )
+            INSERT INTO inventario (id, tipo_combustible, litros_ingresados, litros_disponibles, usuario_id, observaciones)
+            SELECT ultimo_movimiento_id, tipo_combustible, -anterior, 0, %s, 'Reseteo de inventario a 0 litros'
+            FROM stock
+        ''', (g.usuario_id,))
+        notificar(cursor, 'inventario', inventario={tipo: 0 for tipo in TIPOS_COMBUSTIBLE})
         
         db.commit()
+        marcar_cambios('inventario')
         return jsonify({
             'message': 'Inventario reseteado a 0 litros',
             'gasoil': 0,
@@ -1599,9 +1889,218 @@ def resetear_inventario():
         db.rollback()
         return jsonify({'error': str(e)}), 500
 
-# Inicializar la base de datos
-with app.app_context():
-    init_db()
+# Eventos en tiempo real (SSE). Reemplaza el sondeo periódico de
+# /api/inventario/estado, /api/sistema/limites y /api/agendamientos/dia/<fecha>:
+# el cliente recibe 'retiro', 'agendamiento', 'entrega', 'inventario' y
+# 'sistema' al confirmarse cada cambio, y 'recargar' si se perdieron avisos.
+# La respuesta no usa get_db(): una conexión abierta no ocupa el pool.
+# EventSource no envía cabeceras: el token puede ir en ?token=.
+@app.route('/api/stream', methods=['GET'])
+@token_required
+def stream_eventos():
+    fecha = request.args.get('fecha')
+    filtro = None
+    if fecha:
+        # Sólo los agendamientos/entregas del día pedido; el resto pasa siempre
+        filtro = lambda datos: datos.get('fecha') in (None, fecha)
+    
+    difusor = obtener_difusor()
+    suscripcion = difusor.suscribir(filtro)
+    respuesta = Response(transmitir(suscripcion, difusor), mimetype='text/event-stream')
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    respuesta.headers['X-Accel-Buffering'] = 'no'
+    return respuesta
+
+# Rutas de exportación (respuestas en streaming)
+EXPORTACION_FILAS_POR_LOTE = 2000
+
+COLUMNAS_EXPORTACION_RETIROS = [
+    'id', 'fecha', 'hora', 'cliente_id', 'cliente_nombre', 'cliente_cedula',
+    'tipo_combustible', 'litros', 'codigo_ticket', 'usuario_nombre'
+]
+
+COLUMNAS_EXPORTACION_INVENTARIO = [
+    'id', 'fecha_ingreso', 'tipo_combustible', 'litros_ingresados',
+    'litros_disponibles', 'usuario_nombre', 'observaciones'
+]
+
+def _valor_csv(valor):
+    if valor is None:
+        return ''
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    return valor
+
+def respuesta_exportacion(nombre, query, params, columnas):
+    """
+    Devuelve una respuesta que va leyendo `query` con un cursor con nombre
+    (del lado del servidor) y escribe NDJSON o CSV por lotes, de modo que la
+    memoria usada no depende del rango de fechas exportado.
+    """
+    formato = request.args.get('formato', 'ndjson').lower()
+    if formato not in ('ndjson', 'csv'):
+        return jsonify({'error': 'Formato inválido. Use "ndjson" o "csv"'}), 400
+
+    def generar():
+        # Conexión propia: la de la petición (g.db) vuelve al pool en el
+        # teardown, que puede llegar mientras la respuesta sigue enviándose
+        db = obtener_pool().obtener()
+        cursor = db.cursor(name=f'exportar_{nombre}')
+        cursor.itersize = EXPORTACION_FILAS_POR_LOTE
+        try:
+            cursor.execute(query, params)
+            if formato == 'csv':
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(columnas)
+                pendientes = 1
+                for fila in cursor:
+                    writer.writerow([_valor_csv(fila[col]) for col in columnas])
+                    pendientes += 1
+                    if pendientes >= EXPORTACION_FILAS_POR_LOTE:
+                        yield buffer.getvalue()
+                        buffer.seek(0)
+                        buffer.truncate()
+                        pendientes = 0
+                if pendientes:
+                    yield buffer.getvalue()
+            else:
+                lote = []
+                for fila in cursor:
+                    lote.append(app.json.dumps({col: fila[col] for col in columnas}))
+                    if len(lote) >= EXPORTACION_FILAS_POR_LOTE:
+                        yield '\n'.join(lote) + '\n'
+                        lote = []
+                if lote:
+                    yield '\n'.join(lote) + '\n'
+        finally:
+            try:
+                cursor.close()
+            finally:
+                obtener_pool().devolver(db)
+
+    fecha = datetime.now().strftime('%Y%m%d')
+    if formato == 'csv':
+        mimetype = 'text/csv'
+        archivo = f'{nombre}_{fecha}.csv'
+    else:
+        mimetype = 'application/x-ndjson'
+        archivo = f'{nombre}_{fecha}.ndjson'
+
+    return Response(
+        stream_with_context(generar()),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{archivo}"'}
+    )
+
+@app.route('/api/export/retiros', methods=['GET'])
+@token_required
+def exportar_retiros():
+    if not g.es_admin:
+        return jsonify({'error': 'No autorizado'}), 403
+
+    cliente_id = request.args.get('cliente_id')
+    origen, params = origen_historial(
+        'retiros', request.args.get('fecha_inicio'), request.args.get('fecha_fin'),
+        condicion=lambda f: not cliente_id or str(f['cliente_id']) == cliente_id)
+    query = f'''
+        SELECT r.id, r.fecha, r.hora, r.cliente_id, c.nombre AS cliente_nombre,
+               c.cedula AS cliente_cedula, r.tipo_combustible, r.litros,
+               r.codigo_ticket, u.nombre AS usuario_nombre
+        FROM {origen} r
+        JOIN clientes c ON r.cliente_id = c.id
+        JOIN usuarios u ON r.usuario_id = u.id
+        WHERE 1=1
+    '''
+
+    if request.args.get('cliente_id'):
+        query += ' AND r.cliente_id = %s'
+        params.append(request.args['cliente_id'])
+
+    if request.args.get('fecha_inicio'):
+        query += ' AND r.fecha >= %s'
+        params.append(request.args['fecha_inicio'])
+
+    if request.args.get('fecha_fin'):
+        query += ' AND r.fecha <= %s'
+        params.append(request.args['fecha_fin'])
+
+    query += ' ORDER BY r.fecha, r.hora, r.id'
+    return respuesta_exportacion('retiros', query, params, COLUMNAS_EXPORTACION_RETIROS)
+
+@app.route('/api/export/inventario', methods=['GET'])
+@token_required
+def exportar_inventario():
+    if not g.es_admin:
+        return jsonify({'error': 'No autorizado'}), 403
+
+    tipo = request.args.get('tipo_combustible')
+    origen, params = origen_historial(
+        'inventario', request.args.get('fecha_inicio'), request.args.get('fecha_fin'),
+        condicion=lambda f: not tipo or f['tipo_combustible'] == tipo)
+    query = f'''
+        SELECT i.id, i.fecha_ingreso, i.tipo_combustible, i.litros_ingresados,
+               i.litros_disponibles, u.usuario AS usuario_nombre, i.observaciones
+        FROM {origen} i
+        LEFT JOIN usuarios u ON i.usuario_id = u.id
+        WHERE 1=1
+    '''
+
+    if request.args.get('tipo_combustible'):
+        query += ' AND i.tipo_combustible = %s'
+        params.append(request.args['tipo_combustible'])
+
+    if request.args.get('fecha_inicio'):
+        query += ' AND i.fecha_ingreso >= %s::date'
+        params.append(request.args['fecha_inicio'])
+
+    if request.args.get('fecha_fin'):
+        query += " AND i.fecha_ingreso < %s::date + INTERVAL '1 day'"
+        params.append(request.args['fecha_fin'])
+
+    query += ' ORDER BY i.id'
+    return respuesta_exportacion('inventario', query, params, COLUMNAS_EXPORTACION_INVENTARIO)
+
+arranque.fase('rutas')
+
+# Con ARRANQUE_DIFERIDO=0 la conexión y la verificación del esquema se hacen
+# al importar, como antes, en lugar de esperar a la primera petición.
+if os.environ.get('ARRANQUE_DIFERIDO', '1') == '0':
+    with app.app_context():
+        get_db()
+
+# Reset diario de cupos dentro de cada worker; el advisory lock del trabajo
+# evita que dos workers lo ejecuten a la vez. Con RESET_PROGRAMADO=0 se
+# desactiva (p. ej. si se ejecuta reset_diario.py desde un cron externo).
+# El retraso inicial deja la primera conexión a las peticiones del arranque.
+if os.environ.get('RESET_PROGRAMADO', '1') == '1':
+    programar('reset_diario', reset_diario.tarea_programada,
+              intervalo=int(os.environ.get('RESET_INTERVALO_SEG', 300)),
+              retraso_inicial=10)
+
+# Particiones mensuales de retiros y agendamientos para los próximos meses
+# (ver particiones.py); con PARTICIONES_PROGRAMADAS=0 se crean desde un cron
+# con `python particiones.py crear`.
+if os.environ.get('PARTICIONES_PROGRAMADAS', '1') == '1':
+    programar('particiones', particiones.tarea_programada,
+              intervalo=int(os.environ.get('PARTICIONES_INTERVALO_SEG', 6 * 3600)),
+              retraso_inicial=60)
+
+# Resumen diario y compactación del libro de inventario (ver
+# libro_inventario.py); con LIBRO_PROGRAMADO=0 se ejecuta desde un cron con
+# `python libro_inventario.py ejecutar`.
+if os.environ.get('LIBRO_PROGRAMADO', '1') == '1':
+    programar('libro_inventario', libro_inventario.tarea_programada,
+              intervalo=int(os.environ.get('LIBRO_INTERVALO_SEG', 6 * 3600)),
+              retraso_inicial=120)
+
+# Archivo frío del historial (ver archivo.py). Desactivado por defecto:
+# ARCHIVO_DIR tiene que estar en un disco persistente compartido por los
+# workers; si no, se ejecuta `python archivo.py archivar` desde un cron.
+if os.environ.get('ARCHIVO_PROGRAMADO', '0') == '1':
+    programar('archivo', archivo.tarea_programada,
+              intervalo=int(os.environ.get('ARCHIVO_INTERVALO_SEG', 24 * 3600)),
+              retraso_inicial=300)
 
 if __name__ == '__main__':
     # Puerto dinámico para producción (Railway usa PORT)
@@ -1611,5 +2110,5 @@ if __name__ == '__main__':
     # Debug solo en desarrollo
     is_dev = os.environ.get('FLASK_ENV', 'development') == 'development'
     
-    print(f"Servidor Flask iniciado en http://{host}:{port}")
+    log.info("Servidor Flask iniciado en http://%s:%s", host, port)
     app.run(host=host, port=port, debug=is_dev)
@@ -0,0 +1,66 @@
+"""
+Tareas periódicas dentro del proceso del servidor.
+
+Render (plan free) no ofrece cron, así que cada worker puede ejecutar sus
+propias tareas en un hilo en segundo plano. Las tareas deben protegerse por
+su cuenta (p. ej. con un advisory lock de PostgreSQL) si sólo una instancia
+debe hacer el trabajo.
+"""
+
+import logging
+import os
+import random
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class TareaPeriodica:
+    def __init__(self, nombre, funcion, intervalo, retraso_inicial=0):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.intervalo = intervalo
+        self.retraso_inicial = retraso_inicial
+        self._hilo = None
+        self._pid = None
+        self._detener = threading.Event()
+        self.ejecuciones = 0
+        self.errores = 0
+
+    def iniciar(self):
+        # Tras un fork el hilo del padre no existe en el hijo: se vuelve a crear
+        if self._hilo is not None and self._pid == os.getpid() and self._hilo.is_alive():
+            return
+        self._pid = os.getpid()
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._bucle, name=f'tarea-{self.nombre}', daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+
+    def _bucle(self):
+        # Un poco de azar para que los workers no consulten todos a la vez
+        if self._detener.wait(self.retraso_inicial + random.uniform(0, min(self.intervalo, 30))):
+            return
+        while True:
+            try:
+                self.funcion()
+                self.ejecuciones += 1
+            except Exception as e:
+                self.errores += 1
+                log.exception("❌ ERROR en tarea programada '%s'", self.nombre)
+            if self._detener.wait(self.intervalo):
+                return
+
+
+_tareas = []
+
+
+def programar(nombre, funcion, intervalo, retraso_inicial=0):
+    """Registra e inicia una tarea periódica en este proceso."""
+    tarea = TareaPeriodica(nombre, funcion, intervalo, retraso_inicial)
+    _tareas.append(tarea)
+    tarea.iniciar()
+    return tarea
+